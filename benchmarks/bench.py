@@ -0,0 +1,395 @@
+"""
+Benchmarks for chart fan-out, export streaming and cohort downloads
+
+Runs against amplitude_data_wrapper.mock_server in a separate process, so the numbers measure
+the client and not the server. Each benchmark runs in its own process to get a clean peak RSS.
+
+    python benchmarks/bench.py                        # run everything, save results json
+    python benchmarks/bench.py chart_fanout --charts 2000 --latency 0.05
+    python benchmarks/bench.py --compare benchmarks/results/0.6.2.json
+    python benchmarks/bench.py import_time
+"""
+
+# %%
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from importlib import metadata
+from pathlib import Path
+
+BENCHMARKS = (
+    "chart_fanout",
+    "export_download",
+    "export_stream",
+    "cohort_download",
+    "import_time",
+)
+IMPORT_TARGETS = (
+    "amplitude_data_wrapper",
+    "amplitude_data_wrapper.analytics_api",
+    "amplitude_data_wrapper.async_api",
+)
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# metrics where a larger number is better, used by --compare
+HIGHER_IS_BETTER = {"requests_per_second", "mb_per_second", "events_per_second"}
+
+
+# %%
+def _serve(config: dict, queue) -> None:
+    from amplitude_data_wrapper.mock_server import MockAmplitudeServer
+
+    server = MockAmplitudeServer(**config)
+    queue.put(server.start())
+    threading.Event().wait()
+
+
+@contextmanager
+def mock_server(**config):
+    """Run the mock server in a child process, yields its base URL"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_serve, args=(config, queue), daemon=True)
+    process.start()
+    try:
+        yield queue.get(timeout=30)
+    finally:
+        process.terminate()
+        process.join()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024**2 if sys.platform == "darwin" else rss / 1024
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    """p50, p95 and p99 in milliseconds"""
+    if len(values) < 2:
+        value = values[0] * 1000 if values else 0.0
+        return {"p50_ms": value, "p95_ms": value, "p99_ms": value}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+    }
+
+
+def best_of(runs: list[dict], key: str, higher: bool = True) -> dict:
+    """The run with the best value for key, with the values of all runs added"""
+    best = (
+        max(runs, key=lambda r: r[key]) if higher else min(runs, key=lambda r: r[key])
+    )
+    return {**best, f"{key}_runs": [r[key] for r in runs]}
+
+
+# %%
+def bench_chart_fanout(args: argparse.Namespace) -> dict:
+    """Requests per second and latency for download_charts with many charts in one project"""
+    from amplitude_data_wrapper.async_api import download_charts
+
+    charts = [f"chart{i}" for i in range(args.charts)]
+    runs = []
+    with mock_server(latency=args.latency, chart_bytes=args.chart_bytes) as base_url:
+        from amplitude_data_wrapper.analytics_api import register_region
+
+        register_region("bench", base_url)
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as out_dir:
+                projects = {"1": {"key": "key", "secret": "secret", "charts": charts}}
+                summary = asyncio.run(
+                    download_charts(
+                        projects, out_dir, region="bench", workers=args.workers
+                    )
+                )
+            seconds = [r.seconds for r in summary.results if r.status == "downloaded"]
+            runs.append(
+                {
+                    "requests": len(seconds),
+                    "failed": len(summary.results) - len(seconds),
+                    "seconds": summary.seconds,
+                    "requests_per_second": len(seconds) / summary.seconds,
+                    **percentiles(seconds),
+                }
+            )
+    return best_of(runs, "requests_per_second")
+
+
+def _export_range(args: argparse.Namespace) -> tuple[str, str]:
+    end = datetime(2022, 1, 1) + timedelta(hours=args.export_hours - 1)
+    return "20220101T00", end.strftime("%Y%m%dT%H")
+
+
+def bench_export_download(args: argparse.Namespace) -> dict:
+    """MB per second and peak memory for export_project_data writing a zip to disk"""
+    from amplitude_data_wrapper.analytics_api import (
+        export_project_data,
+        register_region,
+    )
+    from amplitude_data_wrapper.export_stream import iter_export_events
+
+    start, end = _export_range(args)
+    runs = []
+    with mock_server(export_events_per_hour=args.events_per_hour) as base_url:
+        register_region("bench", base_url)
+        # the server generates each hour on the first request, keep that out of the timings
+        for _ in iter_export_events(
+            start, end, "key", "secret", region="bench", raw=True
+        ):
+            pass
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as out_dir:
+                filename = f"{out_dir}/export.zip"
+                started = time.perf_counter()
+                export_project_data(
+                    start, end, "key", "secret", filename, region="bench"
+                )
+                seconds = time.perf_counter() - started
+                size = Path(filename).stat().st_size
+            runs.append(
+                {
+                    "bytes": size,
+                    "seconds": seconds,
+                    "mb_per_second": size / 1024**2 / seconds,
+                }
+            )
+    return {**best_of(runs, "mb_per_second"), "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_export_stream(args: argparse.Namespace) -> dict:
+    """Events and decompressed MB per second for iter_export_events, and peak memory"""
+    from amplitude_data_wrapper.analytics_api import register_region
+    from amplitude_data_wrapper.export_stream import iter_export_events
+
+    start, end = _export_range(args)
+    runs = []
+    with mock_server(export_events_per_hour=args.events_per_hour) as base_url:
+        register_region("bench", base_url)
+        for _ in iter_export_events(
+            start, end, "key", "secret", region="bench", raw=True
+        ):
+            pass
+        for _ in range(args.repeat):
+            events = 0
+            size = 0
+            started = time.perf_counter()
+            for line in iter_export_events(
+                start, end, "key", "secret", region="bench", raw=True
+            ):
+                events += 1
+                size += len(line)
+            seconds = time.perf_counter() - started
+            runs.append(
+                {
+                    "events": events,
+                    "bytes": size,
+                    "seconds": seconds,
+                    "events_per_second": events / seconds,
+                    "mb_per_second": size / 1024**2 / seconds,
+                }
+            )
+    return {**best_of(runs, "events_per_second"), "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_cohort_download(args: argparse.Namespace) -> dict:
+    """Wall time for one cohort with get_cohort, and for many cohorts with download_cohorts"""
+    from amplitude_data_wrapper.analytics_api import AmplitudeClient, register_region
+    from amplitude_data_wrapper.async_api import build_headers, download_cohorts
+
+    config = {
+        "latency": args.latency,
+        "cohort_rows": args.cohort_rows,
+        "cohort_pending_polls": args.pending_polls,
+    }
+    sync_seconds = []
+    async_seconds = []
+    with mock_server(**config) as base_url, tempfile.TemporaryDirectory() as out_dir:
+        register_region("bench", base_url)
+        client = AmplitudeClient("key", "secret", base_url=base_url)
+        for i in range(args.repeat):
+            started = time.perf_counter()
+            client.get_cohort(
+                f"cohort{i}",
+                f"{out_dir}/cohort{i}.csv",
+                poll_interval=args.poll_interval,
+            )
+            sync_seconds.append(time.perf_counter() - started)
+
+            cohort_ids = [f"many{i}-{n}" for n in range(args.cohorts)]
+            started = time.perf_counter()
+            results = asyncio.run(
+                download_cohorts(
+                    cohort_ids,
+                    build_headers("key", "secret"),
+                    f"{out_dir}/many{i}",
+                    region="bench",
+                    min_interval=args.poll_interval,
+                )
+            )
+            async_seconds.append(time.perf_counter() - started)
+            errors = [r for r in results.values() if isinstance(r, BaseException)]
+            if errors:
+                raise errors[0]
+        client.close()
+    return {
+        "rows": args.cohort_rows,
+        "pending_polls": args.pending_polls,
+        "get_cohort_seconds": min(sync_seconds),
+        "get_cohort_seconds_runs": sync_seconds,
+        "cohorts": args.cohorts,
+        "download_cohorts_seconds": min(async_seconds),
+        "download_cohorts_seconds_runs": async_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_import_time(args: argparse.Namespace) -> dict:
+    """Milliseconds to import the package and its main modules in a fresh interpreter"""
+    code = "import time; t = time.perf_counter(); import {}; print(time.perf_counter() - t)"
+    result = {}
+    for target in IMPORT_TARGETS:
+        runs = []
+        for _ in range(max(args.repeat, 5)):
+            done = subprocess.run(
+                [sys.executable, "-c", code.format(target)],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            runs.append(float(done.stdout) * 1000)
+        name = target.replace("amplitude_data_wrapper", "package").replace(".", "_")
+        result[f"{name}_ms"] = min(runs)
+        result[f"{name}_ms_runs"] = runs
+    return result
+
+
+# %%
+def run_child(name: str, argv: list[str]) -> dict:
+    """Run one benchmark in a fresh interpreter and return its results"""
+    cmd = [sys.executable, __file__, "--child", name, *argv]
+    done = subprocess.run(cmd, capture_output=True, text=True)
+    if done.returncode != 0:
+        return {
+            "error": done.stderr.strip().splitlines()[-1]
+            if done.stderr.strip()
+            else "failed"
+        }
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def package_version() -> str:
+    try:
+        return metadata.version("amplitude-data-wrapper")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict) -> None:
+    """Print the change of every numeric metric against a saved result file"""
+    print(f"\nCompared with {baseline.get('version')} from {baseline.get('timestamp')}")
+    for name, result in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        for metric, value in result.items():
+            before = old.get(metric)
+            if (
+                not isinstance(value, (int, float))
+                or not isinstance(before, (int, float))
+                or not before
+            ):
+                continue
+            change = (value - before) / before * 100
+            better = change > 0 if metric in HIGHER_IS_BETTER else change < 0
+            flag = "" if abs(change) < 5 else (" better" if better else " WORSE")
+            print(
+                f"  {name}.{metric}: {before:.4g} -> {value:.4g} ({change:+.1f}%){flag}"
+            )
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "benchmarks", nargs="*", help=f"any of {', '.join(BENCHMARKS)}. Default is all"
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="results file. Default is benchmarks/results/<version>.json",
+    )
+    parser.add_argument("--compare", type=Path, help="results file to compare with")
+    parser.add_argument("--child", choices=BENCHMARKS, help=argparse.SUPPRESS)
+    settings = parser.add_argument_group("settings")
+    settings.add_argument(
+        "--repeat", type=int, default=3, help="runs per benchmark, the best is reported"
+    )
+    settings.add_argument(
+        "--latency", type=float, default=0.01, help="mock server latency in seconds"
+    )
+    settings.add_argument("--charts", type=int, default=500)
+    settings.add_argument("--chart-bytes", type=int, default=4096)
+    settings.add_argument("--workers", type=int, default=8, help="chart workers")
+    settings.add_argument("--export-hours", type=int, default=24)
+    settings.add_argument("--events-per-hour", type=int, default=5000)
+    settings.add_argument("--cohort-rows", type=int, default=200000)
+    settings.add_argument(
+        "--cohorts", type=int, default=10, help="cohorts for download_cohorts"
+    )
+    settings.add_argument("--pending-polls", type=int, default=2)
+    settings.add_argument("--poll-interval", type=float, default=0.1)
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(
+            f"unknown benchmarks {sorted(unknown)}, choose from {', '.join(BENCHMARKS)}"
+        )
+    args.settings = {a.dest: getattr(args, a.dest) for a in settings._group_actions}
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    if args.child:
+        result = globals()[f"bench_{args.child}"](args)
+        print(json.dumps(result))
+        return
+
+    child_argv = [f"--{k.replace('_', '-')}={v}" for k, v in args.settings.items()]
+    results = {}
+    for name in args.benchmarks or BENCHMARKS:
+        print(f"running {name}...", file=sys.stderr)
+        results[name] = run_child(name, child_argv)
+        print(f"  {json.dumps(results[name])}", file=sys.stderr)
+
+    version = package_version()
+    output = {
+        "version": version,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": args.settings,
+        "results": results,
+    }
+    path = args.output or RESULTS_DIR / f"{version}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(output, indent=2) + "\n")
+    print(f"saved {path}", file=sys.stderr)
+    if args.compare:
+        compare(output, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
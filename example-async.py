@@ -2,16 +2,11 @@
 import asyncio
 import os
 import json
-from pathlib import Path
 import logging
 
-import aiohttp
 from dotenv import load_dotenv
 
-from src.amplitude_data_wrapper.async_api import (
-    build_headers,
-    download_one_chart,
-)
+from src.amplitude_data_wrapper.async_api import download_charts
 
 # %%
 """
@@ -61,38 +56,9 @@ async def download_all() -> None:
 
     Checks which charts are already downloaded in the download directory, and which are missing. Downloads missing charts.
     """
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-
-        for project_id, cfg in PROJECT_CREDENTIALS.items():
-            headers = build_headers(cfg["key"], cfg["secret"])
-
-            project_dir = Path(SAVE_DIR) / project_id
-            project_dir.mkdir(parents=True, exist_ok=True)
-
-            # Determine which charts are already downloaded
-            existing = {f.stem for f in project_dir.glob("*.json")}
-            all_charts = set(cfg["charts"])
-            missing = sorted(all_charts - existing)
-            _ = list(missing)
-            with open(f"{SAVE_DIR}/missing.json", "w", encoding="utf-8") as f:
-                json.dump(_, f, indent=2)
-
-            logging.info(
-                f"Project {project_id}: {len(existing)} already downloaded, {len(missing)} missing"
-            )
-
-            for chart_id in missing:
-                tasks.append(
-                    download_one_chart(
-                        session=session,
-                        chart_id=chart_id,
-                        headers=headers,
-                        out_path=Path(f"{SAVE_DIR}/{project_id}/{chart_id}.json"),
-                        region="us",
-                    )
-                )
-        await asyncio.gather(*tasks)
+    summary = await download_charts(PROJECT_CREDENTIALS, SAVE_DIR, region="us")
+    for result in summary.failed:
+        logging.error(f"Failed to download chart {result.chart_id}")
 
 
 if __name__ == "__main__":
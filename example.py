@@ -1,5 +1,6 @@
 # %%
 import json
+import logging
 import os
 
 from dotenv import load_dotenv
@@ -7,6 +8,7 @@ from dotenv import load_dotenv
 import src.amplitude_data_wrapper.analytics_api as amp
 
 # %%
+logging.basicConfig(level=logging.INFO)
 load_dotenv()
 api_key = os.getenv("AMPLITUDE_EU_PROD_KEY")
 api_secret = os.getenv("AMPLITUDE_EU_PROD_SECRET")
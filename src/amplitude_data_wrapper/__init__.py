@@ -0,0 +1,232 @@
+"""
+Python wrapper for the Amplitude analytics, export, cohort, privacy and taxonomy APIs
+
+The names below are imported from their submodules on first use, so importing the package does
+not load requests, aiohttp or any other dependency until they are needed.
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+_EXPORTS = {
+    "analytics_api": (
+        "AmplitudeClient",
+        "register_region",
+        "shared_client",
+        "close_shared_clients",
+        "get_chart",
+        "find_user",
+        "get_cohort",
+        "delete_user_data",
+        "get_deletion_jobs",
+        "export_project_data",
+        "get_all_event_types",
+        "delete_event_type",
+        "update_event_type",
+        "get_event_segmentation",
+    ),
+    "async_api": (
+        "AsyncAmplitudeClient",
+        "build_headers",
+        "download_charts",
+        "download_cohorts",
+        "fetch_chart_json",
+    ),
+    "cache": ("MemoryCache", "SQLiteCache"),
+    "cohort": ("download_cohort_columns", "convert_cohort_file", "read_cohort_arrays"),
+    "deletion": ("delete_users_bulk", "track_deletion_jobs"),
+    "export_convert": ("convert_export",),
+    "export_engine": ("export_range",),
+    "export_index": ("build_export_index", "ExportIndex"),
+    "export_stream": ("iter_export_events", "iter_export_file_events"),
+    "export_sync": ("ExportSyncState", "sync_exports", "sync_exports_forever"),
+    "instrumentation": ("add_hook", "remove_hook", "RequestRecord"),
+    "ratelimit": ("AsyncRateLimiter", "BudgetLimiter", "RateLimiter"),
+    "scheduler": ("Job", "load_jobs", "run_jobs"),
+    "segmentation": (
+        "get_event_segmentation_split",
+        "get_event_segmentation_incremental",
+        "SegmentationStore",
+    ),
+    "taxonomy": (
+        "TaxonomyStore",
+        "apply_taxonomy_changes",
+        "delete_event_types_bulk",
+        "diff_taxonomy",
+        "fetch_taxonomy",
+    ),
+    "users": ("UserIdCache", "resolve_users", "resolve_users_bulk"),
+}
+
+_SUBMODULES = (*_EXPORTS, "mock_server")
+_ATTRIBUTES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+# a literal list, so linters and type checkers can read it; it matches _EXPORTS
+__all__ = [
+    "AmplitudeClient",
+    "register_region",
+    "shared_client",
+    "close_shared_clients",
+    "get_chart",
+    "find_user",
+    "get_cohort",
+    "delete_user_data",
+    "get_deletion_jobs",
+    "export_project_data",
+    "get_all_event_types",
+    "delete_event_type",
+    "update_event_type",
+    "get_event_segmentation",
+    "AsyncAmplitudeClient",
+    "build_headers",
+    "download_charts",
+    "download_cohorts",
+    "fetch_chart_json",
+    "MemoryCache",
+    "SQLiteCache",
+    "download_cohort_columns",
+    "convert_cohort_file",
+    "read_cohort_arrays",
+    "delete_users_bulk",
+    "track_deletion_jobs",
+    "convert_export",
+    "export_range",
+    "build_export_index",
+    "ExportIndex",
+    "iter_export_events",
+    "iter_export_file_events",
+    "ExportSyncState",
+    "sync_exports",
+    "sync_exports_forever",
+    "add_hook",
+    "remove_hook",
+    "RequestRecord",
+    "AsyncRateLimiter",
+    "BudgetLimiter",
+    "RateLimiter",
+    "Job",
+    "load_jobs",
+    "run_jobs",
+    "get_event_segmentation_split",
+    "get_event_segmentation_incremental",
+    "SegmentationStore",
+    "TaxonomyStore",
+    "apply_taxonomy_changes",
+    "delete_event_types_bulk",
+    "diff_taxonomy",
+    "fetch_taxonomy",
+    "UserIdCache",
+    "resolve_users",
+    "resolve_users_bulk",
+    "analytics_api",
+    "async_api",
+    "cache",
+    "cohort",
+    "deletion",
+    "export_convert",
+    "export_engine",
+    "export_index",
+    "export_stream",
+    "export_sync",
+    "instrumentation",
+    "ratelimit",
+    "scheduler",
+    "segmentation",
+    "taxonomy",
+    "users",
+    "mock_server",
+    "__version__",
+]
+
+
+def __getattr__(name: str):
+    if name in _ATTRIBUTES:
+        module = importlib.import_module(f".{_ATTRIBUTES[name]}", __name__)
+        value = getattr(module, name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module(f".{name}", __name__)
+    elif name == "__version__":
+        from importlib import metadata
+
+        try:
+            value = metadata.version("amplitude-data-wrapper")
+        except metadata.PackageNotFoundError:
+            value = "unknown"
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
+
+
+# the same names for type checkers and editors, which do not see __getattr__
+if TYPE_CHECKING:
+    from . import (
+        analytics_api,
+        async_api,
+        cache,
+        cohort,
+        deletion,
+        export_convert,
+        export_engine,
+        export_index,
+        export_stream,
+        export_sync,
+        instrumentation,
+        mock_server,
+        ratelimit,
+        scheduler,
+        segmentation,
+        taxonomy,
+        users,
+    )
+    from .analytics_api import (
+        AmplitudeClient,
+        close_shared_clients,
+        delete_event_type,
+        delete_user_data,
+        export_project_data,
+        find_user,
+        get_all_event_types,
+        get_chart,
+        get_cohort,
+        get_deletion_jobs,
+        get_event_segmentation,
+        register_region,
+        shared_client,
+        update_event_type,
+    )
+    from .async_api import (
+        AsyncAmplitudeClient,
+        build_headers,
+        download_charts,
+        download_cohorts,
+        fetch_chart_json,
+    )
+    from .cache import MemoryCache, SQLiteCache
+    from .cohort import convert_cohort_file, download_cohort_columns, read_cohort_arrays
+    from .deletion import delete_users_bulk, track_deletion_jobs
+    from .export_convert import convert_export
+    from .export_engine import export_range
+    from .export_index import ExportIndex, build_export_index
+    from .export_stream import iter_export_events, iter_export_file_events
+    from .export_sync import ExportSyncState, sync_exports, sync_exports_forever
+    from .instrumentation import RequestRecord, add_hook, remove_hook
+    from .ratelimit import AsyncRateLimiter, BudgetLimiter, RateLimiter
+    from .scheduler import Job, load_jobs, run_jobs
+    from .segmentation import (
+        SegmentationStore,
+        get_event_segmentation_incremental,
+        get_event_segmentation_split,
+    )
+    from .taxonomy import (
+        TaxonomyStore,
+        apply_taxonomy_changes,
+        delete_event_types_bulk,
+        diff_taxonomy,
+        fetch_taxonomy,
+    )
+    from .users import UserIdCache, resolve_users, resolve_users_bulk
@@ -0,0 +1,25 @@
+# %%
+from typing import Generic, Iterable, TypeVar
+
+Item = TypeVar("Item")
+
+
+# %%
+class StatusReport(Generic[Item]):
+    """
+    Base for the reports of the bulk functions, over items that each have a status
+
+    Subclasses are dataclasses that return their items from _items.
+    """
+
+    def _items(self) -> Iterable[Item]:
+        raise NotImplementedError
+
+    def count(self, status: str) -> int:
+        """Number of items with the given status"""
+        return sum(1 for item in self._items() if item.status == status)
+
+    @property
+    def failed(self) -> list[Item]:
+        """Items with the status 'failed'"""
+        return [item for item in self._items() if item.status == "failed"]
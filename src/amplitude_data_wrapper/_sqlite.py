@@ -0,0 +1,73 @@
+# %%
+import contextlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterator, TypeVar
+
+Store = TypeVar("Store", bound="SQLiteStore")
+
+
+# %%
+def connect(path: Path) -> sqlite3.Connection:
+    """
+    Open a SQLite file for use from several threads, creating its directory
+
+    The connection is in autocommit mode, so statements hold no transaction open unless they run
+    between BEGIN and COMMIT, and the file is in write-ahead log mode, so readers in other
+    processes do not block writers.
+
+    Parameters
+    ----------
+    path: Path, required
+        path to the SQLite database file
+
+    Returns
+    -------
+    sqlite3.Connection
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    return db
+
+
+class SQLiteStore:
+    """
+    Base for the caches and stores in a local SQLite file
+
+    Subclasses create their tables after calling __init__, and hold _lock while they use _db.
+
+    Parameters
+    ----------
+    path: str | Path, required
+        path to the SQLite database file
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._db = connect(self.path)
+
+    def close(self) -> None:
+        """Close the database connection"""
+        self._db.close()
+
+    @classmethod
+    @contextlib.contextmanager
+    def opened(
+        cls: type[Store], store: "Store | str | Path | None"
+    ) -> Iterator[Store | None]:
+        """
+        Use a store, or open one at a path and close it afterwards
+
+        Used by the blocking wrappers, which take either. None is passed through for no store.
+        """
+        if store is None or isinstance(store, cls):
+            yield store
+            return
+        own_store = cls(store)
+        try:
+            yield own_store
+        finally:
+            own_store.close()
@@ -1,21 +1,601 @@
 # %%
 import json
 import logging
+import threading
 import time
+from collections import OrderedDict
 from typing import Any
+from urllib.parse import quote
 
 import requests
 from requests.adapters import HTTPAdapter
-from tqdm.auto import tqdm
 from urllib3.util import Retry
 
-logging.basicConfig(level=logging.INFO)
+from . import instrumentation
+from .cache import MemoryCache, SQLiteCache, cache_key
+
+logger = logging.getLogger(__name__)
+
 # %%
 API_DOMAINS = {
     "eu": "https://analytics.eu.amplitude.com",
     "us": "https://amplitude.com",
 }
 
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+# the export API answers 400 and 504 when a time range is too large, retrying those does not help
+EXPORT_RETRY_STATUSES = (429, 500, 502, 503)
+# pooled clients kept by shared_client, the least recently used are closed first
+SHARED_CLIENTS_MAX = 32
+
+
+# %%
+def register_region(region: str, base_url: str) -> None:
+    """
+    Add a region, or point an existing one at another base URL, for both the sync and async APIs
+
+    Useful for a proxy or for the local stand-in server in amplitude_data_wrapper.mock_server.
+
+    Parameters
+    ----------
+    region: str, required
+        name to pass as region, for example "local"
+    base_url: str, required
+        scheme and host, without a trailing slash. Example: "http://127.0.0.1:8080"
+    """
+    from . import async_api
+
+    base_url = base_url.rstrip("/")
+    API_DOMAINS[region] = base_url
+    async_api.BASE_DOMAINS[region] = base_url
+    async_api.API_DOMAINS[region] = f"{base_url}/api/3/chart"
+    close_shared_clients(region)
+
+
+class TimedRetry(Retry):
+    """urllib3 Retry that keeps the time slept between attempts, for instrumentation records"""
+
+    slept = 0.0
+
+    def new(self, **kwargs) -> "TimedRetry":
+        retry = super().new(**kwargs)
+        retry.slept = self.slept
+        return retry
+
+    def sleep(self, response=None) -> None:
+        started = time.monotonic()
+        super().sleep(response)
+        self.slept += time.monotonic() - started
+
+
+# %%
+class AmplitudeClient:
+    """
+    Long-lived client for the Amplitude REST APIs
+
+    Holds one requests.Session with a keep-alive connection pool, so repeated calls reuse open
+    TLS connections. All requests share the same retry policy, which backs off on 429 and 5xx
+    responses and honors Retry-After, and the same default timeout.
+
+    Parameters
+    ---------
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    proxy: dict | None = None, optional
+        Set proxy with custom domain and path. Example: {"http": "http://myproxy.example.org/path"}
+
+        Default is no proxy.
+    pool_size: int, optional
+        Maximum number of open connections kept in the pool. Default is 10
+    retries: int, optional
+        How many times to retry a request on connection errors, 429 and 5xx responses. Default is 5
+    backoff_factor: float, optional
+        Exponential backoff factor between retries, in seconds. Default is 1
+    timeout: float | tuple, optional
+        Default timeout in seconds for a request, or a (connect, read) tuple. Default is 600
+    cache: MemoryCache | SQLiteCache | None, optional
+        Cache for chart query results. Default is None for no caching
+    base_url: str | None, optional
+        Send requests to this base URL instead of the region's domain. Default is None
+    progress: bool, optional
+        Show progress bars for file downloads when tqdm is installed. Default is True
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        secret: str,
+        region: str = "eu",
+        proxy: dict | None = None,
+        pool_size: int = 10,
+        retries: int = 5,
+        backoff_factor: float = 1,
+        timeout: float | tuple[float, float] = 600,
+        cache: MemoryCache | SQLiteCache | None = None,
+        base_url: str | None = None,
+        progress: bool = True,
+    ):
+        self.region = region
+        self.cache = cache
+        self.progress = progress
+        self.base_url = base_url.rstrip("/") if base_url else API_DOMAINS[region]
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = (api_key, secret)
+        self.session.headers.update(
+            {"Content-Type": "application/json", "Accept": "application/json"}
+        )
+        if proxy:
+            self.session.proxies.update(proxy)
+
+        def adapter(statuses: tuple[int, ...]) -> HTTPAdapter:
+            retry = TimedRetry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=statuses,
+                raise_on_status=False,
+            )
+            return HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+            )
+
+        shared = adapter(RETRY_STATUSES)
+        self.session.mount("https://", shared)
+        self.session.mount("http://", shared)
+        self.session.mount(
+            f"{self.base_url}/api/2/export", adapter(EXPORT_RETRY_STATUSES)
+        )
+
+    def __enter__(self) -> "AmplitudeClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close all pooled connections"""
+        self.session.close()
+
+    def _progress(self, f, total: int, desc: str):
+        """Wrap a file in a tqdm progress bar for writes, or return it as is"""
+        if self.progress:
+            try:
+                from tqdm.auto import tqdm
+            except ImportError:
+                pass
+            else:
+                return tqdm.wrapattr(f, "write", miniters=1, total=total, desc=desc)
+        return f
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Send a request to an API path, for example "/api/2/taxonomy/event"
+
+        Keyword arguments are passed on to requests.Session.request. The client timeout is used
+        unless timeout is given.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.base_url}{path}"
+        if not instrumentation.enabled():
+            return self.session.request(method, url, **kwargs)
+        started = time.perf_counter()
+        try:
+            r = self.session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            instrumentation.emit(
+                instrumentation.build_record(
+                    method,
+                    url,
+                    None,
+                    time.perf_counter() - started,
+                    self.region,
+                    error=repr(e),
+                )
+            )
+            raise
+        instrumentation.emit(self._record(r, started, kwargs.get("stream", False)))
+        return r
+
+    def _record(
+        self, r: requests.Response, started: float, stream: bool
+    ) -> instrumentation.RequestRecord:
+        retry = getattr(r.raw, "retries", None)
+        history = retry.history if retry is not None else ()
+        # a streamed body is still unread here, so only its announced length is known
+        if not stream:
+            received = len(r.content)
+        elif r.headers.get("Content-Length") is not None:
+            received = int(r.headers["Content-Length"])
+        else:
+            received = None
+        body = r.request.body
+        return instrumentation.build_record(
+            r.request.method,
+            r.url,
+            r.status_code,
+            time.perf_counter() - started,
+            self.region,
+            bytes_sent=len(body) if body else 0,
+            bytes_received=received,
+            retries=len(history),
+            throttled=sum(1 for h in history if h.status == 429),
+            wait_seconds=getattr(retry, "slept", 0.0),
+        )
+
+    def get_chart(
+        self,
+        chart_id: str,
+        cache: MemoryCache | SQLiteCache | None = None,
+        refresh: bool = False,
+    ) -> requests.Response:
+        """
+        Get data for an existing chart in Amplitude
+
+        Parameters
+        ---------
+        chart_id: str, required
+            The ID of the chart. For example  https://analytics.amplitude.com/demo/chart/abc123
+        cache: MemoryCache | SQLiteCache | None, optional
+            Cache for the result. Default is the cache of the client
+        refresh: bool, optional
+            Skip the cached result and fetch the chart again. Default is False
+        """
+        cache = cache or self.cache
+        path = f"/api/3/chart/{chart_id}/query"
+        key = cache_key(self.region, chart_id)
+        if cache is not None and not refresh:
+            body = cache.get(key)
+            if body is not None:
+                logger.info("Retrieved data for chart_id %s from cache", chart_id)
+                return _cached_response(f"{self.base_url}{path}", body)
+        r = self.request("GET", path)
+        if r.status_code != 200:
+            logger.error("Chart %s failed with HTTP %s", chart_id, r.status_code)
+            return r
+        if cache is not None:
+            cache.set(key, r.content)
+        logger.info("Success. Retrieved data for chart_id %s", chart_id)
+        return r
+
+    def find_user(self, user: str) -> requests.Response:
+        """
+        Find the Amplitude ID for a user based on a type of ID, for example Device ID or User ID.
+
+        Parameters
+        ---------
+        user: str, required
+          The user you want to identify. Can use Device ID or User ID.
+        """
+        r = self.request("GET", "/api/2/usersearch", params={"user": user})
+        if r.status_code == 200:
+            logger.info("Success. Found user %s", user)
+        else:
+            logger.error("User search for %s failed with HTTP %s", user, r.status_code)
+        return r
+
+    def open_cohort(
+        self, cohort_id: str, props: int = 0, poll_interval: float = 5
+    ) -> requests.Response:
+        """
+        Request a cohort, wait until it is ready and open the file download as a stream
+
+        Use the response as a context manager and read it with iter_content.
+
+        Parameters
+        ---------
+        cohort_id: str, required
+            ID for the cohort
+        props: int, optional
+            Set to 0 if you only want Amplitude IDs, or 1 if you want more user data
+        poll_interval: float, optional
+            Seconds to wait between status checks. Default is 5
+
+        Returns
+        ---------
+        streaming requests object for the cohort csv
+        """
+        response = self.request(
+            "GET", f"/api/5/cohorts/request/{cohort_id}", params={"props": props}
+        )
+        response.raise_for_status()
+        json_response = response.json()
+        for key, value in json_response.items():
+            logger.info("%s : %s", key, value)
+        request_id = json_response["request_id"]
+        download_path = f"/api/5/cohorts/request/{request_id}/file"
+        while True:
+            status_response = self.request(
+                "GET", f"/api/5/cohorts/request-status/{request_id}"
+            )
+            status_response.raise_for_status()
+            if status_response.status_code == 200:
+                break
+            if status_response.status_code == 202:
+                logger.info("Waiting for request_id %s to be completed", request_id)
+                time.sleep(poll_interval)
+            else:
+                logger.error(
+                    "An error occurred, retrying to reach request ID %s and request URL %s in 10 seconds",
+                    request_id,
+                    f"{self.base_url}{download_path}",
+                )
+                time.sleep(10)
+
+        logger.info("Downloading from %s%s", self.base_url, download_path)
+        file_download = self.request("GET", download_path, stream=True)
+        file_download.raise_for_status()
+        return file_download
+
+    def get_cohort(
+        self, cohort_id: str, filename: str, props: int = 0, poll_interval: float = 5
+    ) -> str:
+        """
+        Downloads a cohort of users from Amplitude
+
+        Parameters
+        ---------
+        cohort_id: str, required
+            ID for the cohort
+        filename: str, required
+            Path and filename to store the results. Example: "data/cohortdata.csv"
+        props: int, optional
+            Set to 0 if you only want Amplitude IDs, or 1 if you want more user data
+        poll_interval: float, optional
+            Seconds to wait between status checks. Default is 5
+
+        Returns
+        ---------
+        filename: path filename as a string to a csv containing data for the cohort
+        """
+        with self.open_cohort(cohort_id, props, poll_interval) as file_download:
+            with self._progress(
+                open(filename, "wb"),
+                int(file_download.headers.get("content-length", 0)),
+                filename,
+            ) as fout:
+                for chunk in file_download.iter_content(chunk_size=8192):
+                    fout.write(chunk)
+        return filename
+
+    def delete_user_data(
+        self,
+        deletion_list: list,
+        user_ids: list,
+        email: str,
+        ignore_invalid_id: bool = False,
+        delete_from_org: bool = False,
+    ) -> requests.Response:
+        """
+        Delete user data for one or more users
+
+        Parameters
+        ---------
+        deletion_list: required
+          One or more Amplitude IDs you want to delete user data for
+        user_ids: required
+          One or more User IDs you want to delete user data for
+        email: required
+          email for the user in Amplitude requesting the data be deleted
+        ignored_invalid_id: bool, optional
+            Ignore any invalid user IDs(users that do no exist in the project) that were passed in
+        delete_from_org: bool, optional
+            delete from the entire org rather than just this project
+        """
+        r = self.request(
+            "POST",
+            "/api/2/deletions/users",
+            json={
+                "amplitude_ids": deletion_list,
+                "user_ids": user_ids,
+                "requester": email,
+                "ignore_invalid_id": ignore_invalid_id,
+                "delete_from_org": delete_from_org,
+            },
+        )
+        logger.info("Sletter brukere")
+        return r
+
+    def get_deletion_jobs(self, start: str, end: str) -> requests.Response:
+        """
+        Get an overview of all deletion jobs in Amplitude
+
+        Parameters
+        ---------
+        start: str, required
+            Start date for a period of deletion jobs. Formated as YYYY-MM-DD
+        end: str, required
+            End date for a period of deletion jobs. Formated as YYYY-MM-DD
+        """
+        return self.request(
+            "GET", "/api/2/deletions/users", params={"start_day": start, "end_day": end}
+        )
+
+    def export_project_data(self, start: str, end: str, filename: str) -> str:
+        """
+        Download all project data from an Amplitude project for a time period, max 365 days per request
+
+        Parameters
+        ---------
+        start: str, required
+            The date for the start of the requested timeperiod. Must be formated as YYYYMMDDTHH
+        end: str, required
+            The dat for the end of the requested timeperiode. Must be formated as YYYYMMDDTHH
+        filename: str, required
+            filename and path to the project data. Example: "data/projectdata.zip"
+
+        Returns
+        ----------
+        filename: zip-file containing multiple gzip files, one for each hour
+        """
+        with self.request(
+            "GET", "/api/2/export", params={"start": start, "end": end}, stream=True
+        ) as response:
+            logger.info("Export request submitted")
+            if response.status_code == 400:
+                logger.info(
+                    "The file size of the exported data is too large. Shorten the time ranges and try again. The limit size is 4GB."
+                )
+            elif response.status_code == 404:
+                logger.info(
+                    "Request data for a time range during which no data has been collected for the project, then you will receive a 404 response from our server."
+                )
+            elif response.status_code == 504:
+                logger.info(
+                    "The amount of data is large causing a timeout. For large amounts of data, the Amazon S3 destination is recommended."
+                )
+            response.raise_for_status()
+            logger.info("Success. Downloading file as %s", filename)
+            with self._progress(
+                open(filename, "wb"),
+                int(response.headers.get("content-length", 0)),
+                filename,
+            ) as fout:
+                for chunk in response.iter_content(chunk_size=8192):
+                    fout.write(chunk)
+        return filename
+
+    def get_all_event_types(self) -> requests.Response:
+        """Get a list of all event-types for the project"""
+        return self.request("GET", "/api/2/taxonomy/event")
+
+    def delete_event_type(self, event_type: str) -> requests.Response:
+        """
+        Delete an even type for the project
+
+        Parameters
+        ----------
+        event_type: str, required
+            name of the event type to be deleted from the Amplitude project
+        """
+        return self.request(
+            "DELETE", f"/api/2/taxonomy/event/{quote(event_type, safe='')}"
+        )
+
+    def update_event_type(
+        self,
+        event_type: str,
+        category: str | None = None,
+        display_name: str | None = None,
+        new_event_type: str | None = None,
+        description: str | None = None,
+        is_active: bool | None = None,
+    ) -> requests.Response:
+        """
+        Update an event type for the project, only the fields that are given are changed
+
+        See update_event_type for a description of the parameters
+        """
+        fields = {
+            "category": category,
+            "display_name": display_name,
+            "new_event_type": new_event_type,
+            "description": description,
+            "is_active": None if is_active is None else str(is_active).lower(),
+        }
+        return self.request(
+            "PUT",
+            f"/api/2/taxonomy/event/{quote(event_type, safe='')}",
+            data={k: v for k, v in fields.items() if v is not None},
+            headers={"Content-Type": FORM_CONTENT_TYPE},
+        )
+
+    def get_event_segmentation(
+        self,
+        start: str,
+        end: str,
+        event: dict,
+        metrics: Any,
+        interval: int = 1,
+        segment: Any = None,
+        group: Any = None,
+        limit: int = 100,
+    ) -> requests.Response:
+        """
+        Get metrics for an event with segmentation
+
+        See get_event_segmentation for a description of the parameters
+        """
+        return self.request(
+            "GET",
+            "/api/2/events/segmentation",
+            params={
+                "e": json.dumps(event),
+                "m": metrics,
+                "start": start,
+                "end": end,
+                "i": interval,
+                "s": json.dumps(segment)
+                if isinstance(segment, (list, dict))
+                else segment,
+                "g": group,
+                "limit": limit,
+            },
+        )
+
+
+def _cached_response(url: str, body: bytes) -> requests.Response:
+    """Build a successful response object around a cached body"""
+    r = requests.Response()
+    r.status_code = 200
+    r.url = url
+    r.encoding = "utf-8"
+    r.headers["Content-Type"] = "application/json"
+    r._content = body
+    return r
+
+
+_shared_clients: OrderedDict[tuple, AmplitudeClient] = OrderedDict()
+_shared_clients_lock = threading.Lock()
+
+
+def shared_client(
+    api_key: str, secret: str, region: str = "eu", proxy: dict | None = None
+) -> AmplitudeClient:
+    """
+    Return a pooled client shared by every call with the same credentials, region and proxy
+
+    The module level functions use this, so repeated calls reuse open connections. At most
+    SHARED_CLIENTS_MAX clients are kept; the least recently used one is closed when a new one is
+    needed.
+    """
+    key = (api_key, secret, region, tuple(sorted(proxy.items())) if proxy else None)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is not None:
+            _shared_clients.move_to_end(key)
+            return client
+        client = AmplitudeClient(api_key, secret, region=region, proxy=proxy)
+        _shared_clients[key] = client
+        evicted = []
+        while len(_shared_clients) > SHARED_CLIENTS_MAX:
+            evicted.append(_shared_clients.popitem(last=False)[1])
+    for old in evicted:
+        old.close()
+    return client
+
+
+def close_shared_clients(region: str | None = None) -> None:
+    """
+    Close and forget the pooled clients of shared_client, for one region or for all
+
+    register_region calls this for the region it changes, so the next call uses the new base URL.
+
+    Parameters
+    ----------
+    region: str | None, optional
+        only close the clients of this region. Default is None for every client
+    """
+    with _shared_clients_lock:
+        keys = [k for k in _shared_clients if region is None or k[2] == region]
+        closing = [_shared_clients.pop(k) for k in keys]
+    for client in closing:
+        client.close()
+
 
 # %%
 def get_chart(
@@ -24,6 +604,8 @@ def get_chart(
     chart_id: str,
     proxy: dict | None = None,
     region: str = "eu",
+    cache: MemoryCache | SQLiteCache | None = None,
+    refresh: bool = False,
 ) -> requests.Response:
     """
     Get data for an existing chart in Amplitude
@@ -44,22 +626,18 @@ def get_chart(
         Set proxy with custom domain and path. Example: {"http": "http://myproxy.example.org/path"}
 
         Default is no proxy.
+    cache: MemoryCache | SQLiteCache | None, optional
+        Cache for the result, see amplitude_data_wrapper.cache. Default is None for no caching
+    refresh: bool, optional
+        Skip the cached result and fetch the chart again. Default is False
 
     Returns
     ----------
     r: requests object with results
     """
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
-    url = API_DOMAINS
-    r = requests.get(
-        f"{url[region]}/api/3/chart/{chart_id}/query",
-        params={},
-        headers=headers,
-        auth=(api_key, secret),
-        proxies=proxy,
+    return shared_client(api_key, secret, region, proxy).get_chart(
+        chart_id, cache=cache, refresh=refresh
     )
-    logging.info("Success. Retrieved data for chart_id %s", chart_id)
-    return r
 
 
 # %%
@@ -90,17 +668,7 @@ def find_user(
     ----------
     user_id: requests object with results
     """
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
-    url = API_DOMAINS
-    r = requests.get(
-        f"{url[region]}/api/2/usersearch?user={user}",
-        params={},
-        headers=headers,
-        auth=(api_key, secret),
-        proxies=proxy,
-    )
-    logging.info("Success. Found user %s", user)
-    return r
+    return shared_client(api_key, secret, region, proxy).find_user(user)
 
 
 # %%
@@ -141,69 +709,9 @@ def get_cohort(
     ---------
     filename: path filename as a string to a csv containing data for the cohort
     """
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
-    s = requests.Session()
-    retries = Retry(total=5, backoff_factor=1, status_forcelist=[502, 503, 504])
-    s.mount("https://", HTTPAdapter(max_retries=retries))
-    url = API_DOMAINS
-    response = s.get(
-        f"{url[region]}/api/5/cohorts/request/{cohort_id}",
-        params={"props": props},
-        headers=headers,
-        auth=(api_key, api_secret),
-        stream=True,
-        timeout=600,
-        proxies=proxy,
+    return shared_client(api_key, api_secret, region, proxy).get_cohort(
+        cohort_id, filename, props=props
     )
-    response.raise_for_status()
-    json_response = response.json()
-    for key, value in json_response.items():
-        logging.info("%s : %s", key, value)
-    header_status = 0
-    request_id = json_response["request_id"]
-    while header_status != 200:
-        status_response = s.get(
-            f"{url[region]}/api/5/cohorts/request-status/{request_id}",
-            headers=headers,
-            auth=(api_key, api_secret),
-            stream=True,
-            timeout=600,
-            proxies=proxy,
-        )
-        status_response.raise_for_status()
-
-        if status_response.status_code == 202:
-            logging.info("Waiting for request_id %s to be completed", request_id)
-            time.sleep(5)
-        elif status_response.status_code == 200:
-            download_url = f"{url[region]}/api/5/cohorts/request/{request_id}/file"
-            logging.info("Downloading from %s", download_url)
-            file_download = s.get(
-                download_url,
-                headers=headers,
-                auth=(api_key, api_secret),
-                stream=True,
-                timeout=600,
-                proxies=proxy,
-            )
-            file_download.raise_for_status()
-            with tqdm.wrapattr(
-                open(filename, "wb"),
-                "write",
-                miniters=1,
-                total=int(file_download.headers.get("content-length", 0)),
-                desc=filename,
-            ) as fout:
-                for chunk in file_download.iter_content(chunk_size=8192):
-                    fout.write(chunk)
-            header_status = 200
-        else:
-            logging.error(
-                f"An error occurred, retrying to reach request ID {request_id} and request URL {download_url} in 10 seconds"
-            )
-            time.sleep(10)
-
-    return filename
 
 
 # %%
@@ -248,23 +756,13 @@ def delete_user_data(
     ----------
     r: requests object with results
     """
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
-    url = API_DOMAINS
-    r = requests.post(
-        f"{url[region]}/api/2/deletions/users",
-        data={
-            "amplitude_ids": deletion_list,
-            "user_ids": user_ids,
-            "requester": email,
-            "ignore_invalid_id": ignore_invalid_id,
-            "delete_from_org": delete_from_org,
-        },
-        headers=headers,
-        auth=(api_key, secret),
-        proxies=proxy,
+    return shared_client(api_key, secret, region, proxy).delete_user_data(
+        deletion_list,
+        user_ids,
+        email,
+        ignore_invalid_id=ignore_invalid_id,
+        delete_from_org=delete_from_org,
     )
-    logging.info("Sletter brukere")
-    return r
 
 
 # %%
@@ -302,16 +800,7 @@ def get_deletion_jobs(
     ---------
     r: requests object with results
     """
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
-    url = API_DOMAINS
-    r = requests.get(
-        f"{url[region]}/api/2/deletions/users",
-        params={"start_day": start, "end_day": end},
-        headers=headers,
-        auth=(api_key, secret),
-        proxies=proxy,
-    )
-    return r
+    return shared_client(api_key, secret, region, proxy).get_deletion_jobs(start, end)
 
 
 # %%
@@ -353,51 +842,9 @@ def export_project_data(
     ----------
     filename: zip-file containing multiple gzip files, one for each hour
     """
-    filename = filename
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
-    urls = API_DOMAINS
-    s = requests.Session()
-    response = s.get(
-        f"{urls[region]}/api/2/export",
-        params={"start": start, "end": end},
-        headers=headers,
-        auth=(api_key, secret),
-        stream=True,
-        proxies=proxy,
+    return shared_client(api_key, secret, region, proxy).export_project_data(
+        start, end, filename
     )
-    logging.info("Export request submitted")
-    response.raise_for_status()
-    header_status = 0
-    while header_status != 200:
-        logging.info("Waiting for response")
-        if response.status_code == 400:
-            logging.info(
-                "The file size of the exported data is too large. Shorten the time ranges and try again. The limit size is 4GB."
-            )
-        elif response.status_code == 404:
-            logging.info(
-                "Request data for a time range during which no data has been collected for the project, then you will receive a 404 response from our server."
-            )
-        elif response.status_code == 504:
-            logging.info(
-                "The amount of data is large causing a timeout. For large amounts of data, the Amazon S3 destination is recommended."
-            )
-        elif response.status_code == 200:
-            logging.info("Success. Downloading file as %s", filename)
-            with tqdm.wrapattr(
-                open(filename, "wb"),
-                "write",
-                miniters=1,
-                total=int(response.headers.get("content-length", 0)),
-                desc=filename,
-            ) as fout:
-                for chunk in response.iter_content(chunk_size=8192):
-                    fout.write(chunk)
-            header_status = 200
-        else:
-            logging.error("Some other error occurred. Retrying again in 10 seconds.")
-            time.sleep(10)
-    return filename
 
 
 # %%
@@ -426,15 +873,7 @@ def get_all_event_types(
     ----------
     r: requests object with results
     """
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
-    url = API_DOMAINS
-    r = requests.get(
-        f"{url[region]}/api/2/taxonomy/event",
-        headers=headers,
-        auth=(api_key, secret),
-        proxies=proxy,
-    )
-    return r
+    return shared_client(api_key, secret, region, proxy).get_all_event_types()
 
 
 # %%
@@ -470,15 +909,58 @@ def delete_event_type(
     r: requests object with status result
 
     """
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
-    url = API_DOMAINS
-    r = requests.delete(
-        f"{url[region]}/api/2/taxonomy/event/{event_type}",
-        headers=headers,
-        auth=(api_key, secret),
-        proxies=proxy,
+    return shared_client(api_key, secret, region, proxy).delete_event_type(event_type)
+
+
+def update_event_type(
+    api_key: str,
+    secret: str,
+    event_type: str,
+    category: str | None = None,
+    display_name: str | None = None,
+    new_event_type: str | None = None,
+    description: str | None = None,
+    is_active: bool | None = None,
+    proxy: dict | None = None,
+    region: str = "eu",
+) -> requests.Response:
+    """
+    Update an event type for a project in Amplitude, only the fields that are given are changed
+
+    See https://www.docs.developers.amplitude.com/analytics/apis/taxonomy-api/#update-an-event-type
+
+    Parameters
+    ----------
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    event_type: str, required
+        name of the event type to update
+    category: str | None, optional
+        name of the category for the event type
+    display_name: str | None, optional
+        name shown in Amplitude instead of the event type
+    new_event_type: str | None, optional
+        rename the event type
+    description: str | None, optional
+        description of the event type
+    is_active: bool | None, optional
+        False to mark the event type as inactive
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    proxy: dict | None = None, optional
+        Set proxy with custom domain and path. Example: {"http": "http://myproxy.example.org/path"}
+
+        Default is no proxy.
+
+    Returns
+    ----------
+    r: requests object with status result
+    """
+    return shared_client(api_key, secret, region, proxy).update_event_type(
+        event_type, category, display_name, new_event_type, description, is_active
     )
-    return r
 
 
 # %%
@@ -531,20 +1013,13 @@ def get_event_segmentation(
 
 
     """
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
-    url = API_DOMAINS
-    r = requests.get(
-        f"{url[region]}/api/2/events/segmentation",
-        params={
-            "e": json.dumps(event),
-            "m": metrics,
-            "start": start,
-            "end": end,
-            "i": interval,
-            "s": segment,
-            "limit": limit,
-        },
-        headers=headers,
-        auth=(api_key, secret),
+    return shared_client(api_key, secret, region).get_event_segmentation(
+        start,
+        end,
+        event,
+        metrics,
+        interval=interval,
+        segment=segment,
+        group=group,
+        limit=limit,
     )
-    return r
@@ -1,20 +1,47 @@
 # %%
 import asyncio
 import base64
+import contextlib
+import hashlib
 import json
-from typing import Any
-from pathlib import Path
 import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator
+from urllib.parse import quote
 
 import aiohttp
 
+from . import instrumentation
+from .cache import MemoryCache, SQLiteCache, cache_key
+from .ratelimit import (
+    AsyncRateLimiter,
+    backoff_delay,
+    default_limiter,
+    parse_retry_after,
+)
+
+logger = logging.getLogger(__name__)
+
 # %%
 API_DOMAINS = {
     "eu": "https://analytics.eu.amplitude.com/api/3/chart",
     "us": "https://analytics.amplitude.com/api/3/chart",
 }
 
-logging.basicConfig(level=logging.INFO)
+BASE_DOMAINS = {
+    "eu": "https://analytics.eu.amplitude.com",
+    "us": "https://analytics.amplitude.com",
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+# the export API answers 504 when a time range is too large, retrying that does not help
+EXPORT_RETRY_STATUSES = (429, 500, 502, 503)
 
 
 # %%
@@ -42,6 +69,149 @@ def build_headers(api_key: str, api_secret: str) -> dict:
     }
 
 
+def _body_size(kwargs: dict) -> int:
+    if kwargs.get("json") is not None:
+        return len(json.dumps(kwargs["json"]).encode())
+    data = kwargs.get("data")
+    if isinstance(data, (bytes, str)):
+        return len(data)
+    return 0
+
+
+def limiter_key(headers: dict) -> str:
+    """
+    Key that identifies a project for rate limiting, derived from the authorization header
+
+    Parameters
+    ----------
+    headers: dict, required
+        headers for requests, see build_headers
+
+    Returns
+    -------
+    key: str
+    """
+    return hashlib.sha256(headers.get("Authorization", "").encode()).hexdigest()[:16]
+
+
+@contextlib.asynccontextmanager
+async def request(
+    session: aiohttp.ClientSession,
+    method: str,
+    url: str,
+    headers: dict,
+    limiter: AsyncRateLimiter | None = None,
+    retries: int = 5,
+    timeout: float | aiohttp.ClientTimeout = 20,
+    retry_statuses: tuple[int, ...] = RETRY_STATUSES,
+    **kwargs: Any,
+) -> AsyncIterator[aiohttp.ClientResponse]:
+    """
+    Send a request with the retry and rate limit policy of the async API, as an async context manager
+
+    Timeouts, connection errors, 429 and 5xx responses are retried with jittered exponential
+    backoff, or after the Retry-After delay. A 429 pauses every request for the same project that
+    shares the limiter. The response of the last attempt is yielded, whatever its status, and a
+    limiter slot is held until the block exits.
+
+    Parameters
+    ----------
+    session: aiohttp.ClientSession, required
+        session for requests
+    method: str, required
+        HTTP method, for example "GET"
+    url: str, required
+        full URL of the request
+    headers: dict, required
+        headers for requests, see build_headers
+    limiter: AsyncRateLimiter | None, optional
+        shared limiter for concurrency and request rate. Default is a limiter shared per event loop
+    retries: int, optional
+        how many times to try the request. Default is 5
+    timeout: float | aiohttp.ClientTimeout, optional
+        how long to wait before timing out a request attempt. Default is 20
+    retry_statuses: tuple[int, ...], optional
+        response statuses to retry. Default is 429 and 5xx
+
+    Returns
+    -------
+    aiohttp.ClientResponse
+    """
+    limiter = limiter or default_limiter()
+    key = limiter_key(headers)
+    record = instrumentation.enabled()
+    started = time.perf_counter()
+    waited = 0.0
+    throttled = 0
+
+    def emit(status: int | None, seconds: float, attempt: int, **extra: Any) -> None:
+        instrumentation.emit(
+            instrumentation.build_record(
+                method,
+                url,
+                status,
+                seconds,
+                bytes_sent=_body_size(kwargs),
+                retries=attempt - 1,
+                throttled=throttled,
+                wait_seconds=waited,
+                client="async",
+                **extra,
+            )
+        )
+
+    for attempt in range(1, retries + 1):
+        async with limiter.slot(key) as slot_wait:
+            waited += slot_wait
+            try:
+                resp = await session.request(
+                    method, url, headers=headers, timeout=timeout, **kwargs
+                )
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                if attempt == retries:
+                    if record:
+                        emit(
+                            None, time.perf_counter() - started, attempt, error=repr(e)
+                        )
+                    raise
+                wait = backoff_delay(attempt)
+                logger.warning(f"[{type(e).__name__}] {method} {url} attempt {attempt}")
+            except aiohttp.ClientError as e:
+                if record:
+                    emit(None, time.perf_counter() - started, attempt, error=repr(e))
+                raise
+            else:
+                if resp.status not in retry_statuses or attempt == retries:
+                    seconds = time.perf_counter() - started
+                    if resp.status == 429:
+                        throttled += 1
+                    try:
+                        yield resp
+                    finally:
+                        resp.release()
+                        if record:
+                            emit(
+                                resp.status,
+                                seconds,
+                                attempt,
+                                bytes_received=resp.content.total_bytes,
+                            )
+                    return
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                wait = (
+                    retry_after if retry_after is not None else backoff_delay(attempt)
+                )
+                if resp.status == 429:
+                    throttled += 1
+                    limiter.block(key, wait)
+                resp.release()
+                logger.warning(
+                    f"{method} {url} retry {attempt}/{retries} — HTTP {resp.status} — waiting {wait:.1f}s"
+                )
+        waited += wait
+        await asyncio.sleep(wait)
+
+
 async def fetch_chart_json(
     session: aiohttp.ClientSession,
     chart_id: str,
@@ -50,10 +220,18 @@ async def fetch_chart_json(
     concurrency: int = 4,
     retries: int = 5,
     timeout: int = 20,
+    limiter: AsyncRateLimiter | None = None,
+    cache: MemoryCache | SQLiteCache | None = None,
+    refresh: bool = False,
+    proxy: str | None = None,
 ) -> Any | None:
     """
     Fetch chart data as json from amplitude
 
+    Retries on timeouts, connection errors, 429 and 5xx responses with jittered exponential
+    backoff, or after the delay given by the Retry-After header. A 429 pauses every request for
+    the same project that shares the limiter.
+
     Parameters
     ---------
     session:
@@ -65,74 +243,144 @@ async def fetch_chart_json(
     region: str, required
         select 'eu' or 'us' amplitude data centre
     concurrency: int, optional
-        how many concurrent processes to spawn. Default is 4
+        how many requests may be in flight at once, across all calls in the event loop that use the
+        same value. Ignored when limiter is given. Default is 4
     retries: int, optional
         how many times to retry a request. Default is 5
     timeout: int, optional
         how long to wait before timing out a request attempt. Default is 20
+    limiter: AsyncRateLimiter | None, optional
+        shared limiter for concurrency and request rate. Default is a limiter shared per event loop
+    cache: MemoryCache | SQLiteCache | None, optional
+        cache for the result, shared with the sync API. Default is None for no caching
+    refresh: bool, optional
+        skip the cached result and fetch the chart again. Default is False
+    proxy: str | None, optional
+        URL of a proxy for the requests. Default is no proxy
 
     Returns
     -------
     Chart data as Json or None
     """
     url = f"{API_DOMAINS[region]}/{chart_id}/query"
-    sem = asyncio.Semaphore(concurrency)
-    for attempt in range(1, retries + 1):
-        async with sem:
-            try:
-                async with session.get(url, headers=headers, timeout=timeout) as resp:
-                    if resp.status in (500, 502, 503, 504):
-                        wait = 2**attempt
-                        logging.warning(
-                            f"[{chart_id}] Retry {attempt}/{retries} — HTTP {resp.status} — waiting {wait}s"
-                        )
-                        await asyncio.sleep(wait)
-                        continue
+    chart_key = cache_key(region, chart_id)
+    if cache is not None and not refresh:
+        body = cache.get(chart_key)
+        if body is not None:
+            return json.loads(body)
+    limiter = limiter or default_limiter(concurrency)
+    try:
+        async with request(
+            session,
+            "GET",
+            url,
+            headers,
+            limiter,
+            retries=retries,
+            timeout=timeout,
+            proxy=proxy,
+        ) as resp:
+            if resp.status == 404:
+                logger.error(f"[404] Chart not found: {chart_id}")
+                return None
+            if resp.status != 200:
+                txt = await resp.text()
+                logger.error(
+                    f"[ERROR] Chart {chart_id} — HTTP {resp.status} → {txt[:200]}"
+                )
+                return None
+            body = await resp.read()
+    except asyncio.TimeoutError:
+        logger.error(f"[FAILED] {chart_id} timed out after {retries} attempts")
+        return None
+    if cache is not None:
+        cache.set(chart_key, body)
+    return json.loads(body)
 
-                    if resp.status == 429:
-                        wait = 300
-                        txt = await resp.text()
-                        logging.warning(
-                            f"Chart {chart_id} - HTTP {resp.status} -> {txt[:429]} - now waiting {wait / 60} minutes"
-                        )
-                        await asyncio.sleep(wait)
-                        continue
 
-                    if resp.status == 404:
-                        logging.error(f"[404] Chart not found: {chart_id}")
-                        return None
+def _json_backend():
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
 
-                    if resp.status != 200:
-                        txt = await resp.text()
-                        logging.error(
-                            f"[ERROR] Chart {chart_id} — HTTP {resp.status} → {txt[:200]}"
-                        )
-                        return None
 
-                    return await resp.json()
+def dump_json(data: Any, compact: bool = False) -> bytes:
+    """
+    Serialize data as UTF-8 json, with orjson when it is installed
 
-            except asyncio.TimeoutError:
-                logging.warning(f"[TIMEOUT] {chart_id} attempt {attempt}")
-                await asyncio.sleep(2**attempt)
+    Parameters
+    ----------
+    data: Any, required
+        the data to serialize
+    compact: bool, optional
+        leave out indentation and spaces. Default is False for an indent of 2
 
-    logging.error(f"[FAILED] {chart_id} after all retries")
-    return None
+    Returns
+    -------
+    json as bytes
+    """
+    orjson = _json_backend()
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if not compact:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    if compact:
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+    return json.dumps(data, indent=2, ensure_ascii=False).encode()
 
 
-async def save_json(path: Path, data: dict) -> None:
+def write_json(path: Path, data: Any, compact: bool = False) -> None:
+    """
+    Save data as a json file, written to a temporary file next to path and renamed when complete
+
+    A crash never leaves a truncated file at path. See save_json for the parameters.
+    """
+    path = Path(path)
+    body = dump_json(data, compact)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.part")
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+    tmp_path.replace(path)
+
+
+# writes are queued on a few threads, so serialization and disk I/O never block the event loop
+WRITE_WORKERS = 4
+_write_pool: ThreadPoolExecutor | None = None
+_write_pool_lock = threading.Lock()
+
+
+def _writer() -> ThreadPoolExecutor:
+    global _write_pool
+    with _write_pool_lock:
+        if _write_pool is None:
+            _write_pool = ThreadPoolExecutor(
+                WRITE_WORKERS, thread_name_prefix="amplitude-json-writer"
+            )
+        return _write_pool
+
+
+async def save_json(path: Path, data: dict, compact: bool = False) -> None:
     """
     Save chart dictionary as a json file at a given path
 
+    The data is serialized and written on a pool of WRITE_WORKERS threads, so the event loop keeps
+    serving other requests. The file is written to path.part and renamed when complete.
+
     Parameters
     ----------
     path: Path, required
         saves json as a file at a given path
     data: dict, require
         the chart data
+    compact: bool, optional
+        write json without indentation, smaller and faster to write. Default is False
     """
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_writer(), write_json, path, data, compact)
 
 
 async def download_one_chart(
@@ -144,6 +392,8 @@ async def download_one_chart(
     concurrency: int = 4,
     retries: int = 5,
     timeout: int = 20,
+    limiter: AsyncRateLimiter | None = None,
+    compact: bool = False,
 ) -> None:
     """
     Downloads data for a specific chart
@@ -162,11 +412,15 @@ async def download_one_chart(
     region: str, required
         select 'eu' or 'us' amplitude data centre
     concurrency: int, optional
-        how many concurrent processes to spawn. Default is 4
+        how many requests may be in flight at once, see fetch_chart_json. Default is 4
     retries: int, optional
         how many times to retry a request. Default is 5
     timeout: int, optional
         how long to wait before timing out a request attempt. Default is 20
+    limiter: AsyncRateLimiter | None, optional
+        shared limiter for concurrency and request rate, see fetch_chart_json
+    compact: bool, optional
+        save json without indentation. Default is False
     """
     data = await fetch_chart_json(
         session=session,
@@ -176,9 +430,857 @@ async def download_one_chart(
         concurrency=concurrency,
         retries=retries,
         timeout=timeout,
+        limiter=limiter,
     )
     if data is None:
         return
 
-    await save_json(out_path, data)
-    logging.info(f"Saved {out_path}")
+    await save_json(out_path, data, compact)
+    logger.info(f"Saved {out_path}")
+
+
+# %%
+@dataclass
+class ChartResult:
+    """Outcome of one chart in download_charts"""
+
+    project_id: str
+    chart_id: str
+    status: str
+    seconds: float = 0.0
+    path: Path | None = None
+    error: str | None = None
+
+
+@dataclass
+class DownloadSummary:
+    """Per-chart results and timing for a download_charts run"""
+
+    results: list[ChartResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def count(self, status: str) -> int:
+        """Number of charts with the given status: 'downloaded', 'skipped' or 'failed'"""
+        return sum(1 for r in self.results if r.status == status)
+
+    @property
+    def failed(self) -> list[ChartResult]:
+        return [r for r in self.results if r.status == "failed"]
+
+
+def _write_manifest(path: Path, missing: dict, failed: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"missing": missing, "failed": failed}, f, indent=2)
+    tmp_path.replace(path)
+
+
+def _check_projects(projects: dict[str, dict], region: str) -> None:
+    """Raise ValueError for a project config download_charts cannot use"""
+    for project_id, cfg in projects.items():
+        missing = [k for k in ("key", "secret", "charts") if k not in cfg]
+        if missing:
+            raise ValueError(f"Project {project_id} has no {', '.join(missing)}")
+        if isinstance(cfg["charts"], str):
+            raise ValueError(f"Charts of project {project_id} must be a list of IDs")
+        project_region = cfg.get("region", region)
+        if project_region not in API_DOMAINS:
+            raise ValueError(
+                f"Unknown region {project_region!r} for project {project_id}"
+            )
+
+
+async def download_charts(
+    projects: dict[str, dict],
+    out_dir: str | Path,
+    region: str = "eu",
+    workers: int = 8,
+    limiter: AsyncRateLimiter | None = None,
+    retries: int = 5,
+    timeout: int = 20,
+    session: aiohttp.ClientSession | None = None,
+    compact: bool = False,
+) -> DownloadSummary:
+    """
+    Download charts for several projects with a bounded pool of workers
+
+    Charts are saved as out_dir/<project_id>/<chart_id>.json. Charts that already have a file are
+    skipped. Chart IDs are fed through a queue to a fixed number of workers, so memory use does
+    not grow with the number of charts. The charts still missing when the run starts, and the
+    ones that failed, are written to out_dir/manifest.json.
+
+    Parameters
+    ----------
+    projects: dict[str, dict], required
+        project ID mapped to a dictionary with "key", "secret" and "charts", a list of chart IDs,
+        and optionally "region". Example: {"123": {"key": api_key, "secret": api_secret, "charts": ["abc123"]}}
+    out_dir: str | Path, required
+        directory to save charts in
+    region: str, optional
+        select 'eu' or 'us' amplitude data centre, for projects without a region. Default is 'eu'
+    workers: int, optional
+        number of charts processed at the same time. Default is 8
+    limiter: AsyncRateLimiter | None, optional
+        shared limiter for concurrency and request rate. Default is a limiter allowing workers requests in flight
+    retries: int, optional
+        how many times to retry a request. Default is 5
+    timeout: int, optional
+        how long to wait before timing out a request attempt. Default is 20
+    session: aiohttp.ClientSession | None, optional
+        session for requests. Default is a new session for this run
+    compact: bool, optional
+        save json without indentation. Default is False
+
+    Returns
+    -------
+    DownloadSummary with the status and time spent for every chart
+    """
+    started = time.perf_counter()
+    _check_projects(projects, region)
+    out_dir = Path(out_dir)
+    limiter = limiter or AsyncRateLimiter(workers)
+    summary = DownloadSummary()
+    missing: dict[str, list[str]] = {}
+    failed: dict[str, list[str]] = {}
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+
+    async def worker(client: aiohttp.ClientSession) -> None:
+        while (job := await queue.get()) is not None:
+            project_id, chart_id, headers, chart_region, out_path = job
+            chart_started = time.perf_counter()
+            status = "failed"
+            error = None
+            try:
+                data = await fetch_chart_json(
+                    session=client,
+                    chart_id=chart_id,
+                    headers=headers,
+                    region=chart_region,
+                    retries=retries,
+                    timeout=timeout,
+                    limiter=limiter,
+                )
+                if data is not None:
+                    await save_json(out_path, data, compact)
+                    status = "downloaded"
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                OSError,
+                ValueError,
+            ) as e:
+                error = repr(e)
+                logger.error(f"[ERROR] Chart {chart_id} — {error}")
+            if status == "failed":
+                failed.setdefault(project_id, []).append(chart_id)
+            summary.results.append(
+                ChartResult(
+                    project_id,
+                    chart_id,
+                    status,
+                    time.perf_counter() - chart_started,
+                    out_path if status == "downloaded" else None,
+                    error,
+                )
+            )
+
+    async def produce() -> None:
+        for project_id, cfg in projects.items():
+            project_dir = out_dir / project_id
+            project_dir.mkdir(parents=True, exist_ok=True)
+            existing = {f.stem for f in project_dir.glob("*.json")}
+            charts = list(dict.fromkeys(cfg["charts"]))
+            todo = [c for c in charts if c not in existing]
+            missing[project_id] = todo
+            logger.info(
+                f"Project {project_id}: {len(charts) - len(todo)} already downloaded, {len(todo)} missing"
+            )
+            for chart_id in charts:
+                if chart_id in existing:
+                    summary.results.append(ChartResult(project_id, chart_id, "skipped"))
+            headers = build_headers(cfg["key"], cfg["secret"])
+            chart_region = cfg.get("region", region)
+            for chart_id in todo:
+                out_path = project_dir / f"{chart_id}.json"
+                await queue.put((project_id, chart_id, headers, chart_region, out_path))
+        _write_manifest(out_dir / "manifest.json", missing, failed)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def run(client: aiohttp.ClientSession) -> None:
+        tasks = [
+            asyncio.ensure_future(produce()),
+            *(asyncio.ensure_future(worker(client)) for _ in range(workers)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # if one task fails the others would wait on the queue forever
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            await run(session)
+    else:
+        await run(session)
+
+    _write_manifest(out_dir / "manifest.json", missing, failed)
+    summary.seconds = time.perf_counter() - started
+    logger.info(
+        f"Downloaded {summary.count('downloaded')}, skipped {summary.count('skipped')}, "
+        f"failed {summary.count('failed')} charts in {summary.seconds:.1f}s"
+    )
+    return summary
+
+
+# %%
+async def request_cohort(
+    session: aiohttp.ClientSession,
+    cohort_id: str,
+    headers: dict,
+    region: str = "eu",
+    props: int = 0,
+    limiter: AsyncRateLimiter | None = None,
+    proxy: str | None = None,
+) -> str:
+    """
+    Ask amplitude to prepare a cohort for download
+
+    See https://developers.amplitude.com/docs/behavioral-cohorts-api#getting-one-cohort
+
+    Parameters
+    ----------
+    session: aiohttp.ClientSession, required
+        session for requests
+    cohort_id: str, required
+        ID for the cohort
+    headers: dict, required
+        headers for requests, see build_headers
+    region: str, optional
+        select 'eu' or 'us' amplitude data centre. Default is 'eu'
+    props: int, optional
+        Set to 0 if you only want Amplitude IDs, or 1 if you want more user data. Default is 0
+    limiter: AsyncRateLimiter | None, optional
+        shared limiter for concurrency and request rate
+    proxy: str | None, optional
+        URL of a proxy for the requests. Default is no proxy
+
+    Returns
+    -------
+    request_id: str, used to poll the status and download the file
+    """
+    url = f"{BASE_DOMAINS[region]}/api/5/cohorts/request/{cohort_id}"
+    async with request(
+        session, "GET", url, headers, limiter, params={"props": props}, proxy=proxy
+    ) as resp:
+        resp.raise_for_status()
+        body = await resp.json()
+    logger.info(f"Cohort {cohort_id} requested as {body['request_id']}")
+    return body["request_id"]
+
+
+async def wait_for_cohort(
+    session: aiohttp.ClientSession,
+    request_id: str,
+    headers: dict,
+    region: str = "eu",
+    limiter: AsyncRateLimiter | None = None,
+    min_interval: float = 2,
+    max_interval: float = 60,
+    max_wait: float | None = None,
+    proxy: str | None = None,
+) -> None:
+    """
+    Poll the status of a cohort request until the file is ready
+
+    The wait between polls starts at min_interval and grows by half each time, with jitter, up
+    to max_interval, so short requests finish quickly and long ones are not polled too often.
+
+    Parameters
+    ----------
+    session: aiohttp.ClientSession, required
+        session for requests
+    request_id: str, required
+        request ID returned by request_cohort
+    headers: dict, required
+        headers for requests, see build_headers
+    region: str, optional
+        select 'eu' or 'us' amplitude data centre. Default is 'eu'
+    limiter: AsyncRateLimiter | None, optional
+        shared limiter for concurrency and request rate
+    min_interval: float, optional
+        seconds to wait before the first poll. Default is 2
+    max_interval: float, optional
+        longest wait between polls in seconds. Default is 60
+    max_wait: float | None, optional
+        give up with asyncio.TimeoutError after this many seconds. Default is None for no limit
+    proxy: str | None, optional
+        URL of a proxy for the requests. Default is no proxy
+    """
+    url = f"{BASE_DOMAINS[region]}/api/5/cohorts/request-status/{request_id}"
+    started = time.monotonic()
+    interval = min_interval
+    while True:
+        async with request(session, "GET", url, headers, limiter, proxy=proxy) as resp:
+            resp.raise_for_status()
+            status = resp.status
+        if status == 200:
+            return
+        if max_wait is not None and time.monotonic() - started > max_wait:
+            raise asyncio.TimeoutError(
+                f"Cohort request {request_id} not ready after {max_wait}s"
+            )
+        logger.info(
+            f"Waiting for request_id {request_id} to be completed, HTTP {status}"
+        )
+        await asyncio.sleep(interval * random.uniform(0.8, 1.2))
+        interval = min(max_interval, interval * 1.5)
+
+
+async def download_cohort(
+    session: aiohttp.ClientSession,
+    cohort_id: str,
+    headers: dict,
+    out_path: Path,
+    region: str = "eu",
+    props: int = 0,
+    limiter: AsyncRateLimiter | None = None,
+    min_interval: float = 2,
+    max_interval: float = 60,
+    max_wait: float | None = None,
+    timeout: float = 600,
+    proxy: str | None = None,
+) -> Path:
+    """
+    Request, wait for and download a cohort of users from amplitude
+
+    The file is streamed to a temporary file next to out_path and renamed when complete.
+
+    Parameters
+    ----------
+    session: aiohttp.ClientSession, required
+        session for requests
+    cohort_id: str, required
+        ID for the cohort
+    headers: dict, required
+        headers for requests, see build_headers
+    out_path: Path, required
+        where to save the cohort csv
+    region: str, optional
+        select 'eu' or 'us' amplitude data centre. Default is 'eu'
+    props: int, optional
+        Set to 0 if you only want Amplitude IDs, or 1 if you want more user data. Default is 0
+    limiter: AsyncRateLimiter | None, optional
+        shared limiter for concurrency and request rate
+    min_interval: float, optional
+        seconds to wait before the first status poll. Default is 2
+    max_interval: float, optional
+        longest wait between status polls in seconds. Default is 60
+    max_wait: float | None, optional
+        give up waiting for the cohort after this many seconds. Default is None for no limit
+    timeout: float, optional
+        longest pause in seconds while reading the file. Default is 600
+    proxy: str | None, optional
+        URL of a proxy for the requests. Default is no proxy
+
+    Returns
+    -------
+    out_path: Path to the csv file
+    """
+    out_path = Path(out_path)
+    request_id = await request_cohort(
+        session, cohort_id, headers, region, props, limiter, proxy
+    )
+    await wait_for_cohort(
+        session,
+        request_id,
+        headers,
+        region,
+        limiter,
+        min_interval,
+        max_interval,
+        max_wait,
+        proxy,
+    )
+    url = f"{BASE_DOMAINS[region]}/api/5/cohorts/request/{request_id}/file"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(f"{out_path.name}.part")
+    download_timeout = aiohttp.ClientTimeout(total=None, sock_read=timeout)
+    async with request(
+        session, "GET", url, headers, limiter, timeout=download_timeout, proxy=proxy
+    ) as resp:
+        resp.raise_for_status()
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            async for chunk in resp.content.iter_chunked(1048576):
+                await asyncio.to_thread(f.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+    tmp_path.replace(out_path)
+    logger.info(f"Saved cohort {cohort_id} as {out_path}")
+    return out_path
+
+
+async def download_cohorts(
+    cohort_ids: list[str],
+    headers: dict,
+    out_dir: str | Path,
+    region: str = "eu",
+    props: int = 0,
+    limiter: AsyncRateLimiter | None = None,
+    session: aiohttp.ClientSession | None = None,
+    **kwargs: Any,
+) -> dict[str, Path | BaseException]:
+    """
+    Download many cohorts at once from one event loop
+
+    All cohorts are requested and polled concurrently, and each file is saved as
+    out_dir/<cohort_id>.csv as soon as it is ready. A failing cohort does not stop the others.
+
+    Parameters
+    ----------
+    cohort_ids: list[str], required
+        IDs of the cohorts
+    headers: dict, required
+        headers for requests, see build_headers
+    out_dir: str | Path, required
+        directory to save the cohorts in
+    region: str, optional
+        select 'eu' or 'us' amplitude data centre. Default is 'eu'
+    props: int, optional
+        Set to 0 if you only want Amplitude IDs, or 1 if you want more user data. Default is 0
+    limiter: AsyncRateLimiter | None, optional
+        shared limiter for concurrency and request rate
+    session: aiohttp.ClientSession | None, optional
+        session for requests. Default is a new session for this run
+
+    Other keyword arguments are passed on to download_cohort.
+
+    Returns
+    -------
+    dictionary of cohort ID to the saved Path, or the exception that stopped it
+    """
+    out_dir = Path(out_dir)
+
+    async def run(client: aiohttp.ClientSession) -> list:
+        return await asyncio.gather(
+            *(
+                download_cohort(
+                    client,
+                    cohort_id,
+                    headers,
+                    out_dir / f"{cohort_id}.csv",
+                    region=region,
+                    props=props,
+                    limiter=limiter,
+                    **kwargs,
+                )
+                for cohort_id in cohort_ids
+            ),
+            return_exceptions=True,
+        )
+
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            results = await run(session)
+    else:
+        results = await run(session)
+    for cohort_id, result in zip(cohort_ids, results):
+        if isinstance(result, BaseException):
+            logger.error(f"[FAILED] cohort {cohort_id} — {result}")
+    return dict(zip(cohort_ids, results))
+
+
+# %%
+class AsyncAmplitudeClient:
+    """
+    Async client for the Amplitude REST APIs, the asyncio counterpart of AmplitudeClient
+
+    Every call goes through one aiohttp.ClientSession and one limiter, with the retry policy of
+    request: timeouts, connection errors, 429 and 5xx responses are retried with backoff or after
+    Retry-After, and a 429 pauses the other requests of the client. Export and cohort files are streamed to disk.
+
+    Use it as an async context manager, or call close when done:
+
+        async with AsyncAmplitudeClient(api_key, secret) as client:
+            chart, events = await asyncio.gather(
+                client.get_chart("abc123"), client.get_all_event_types()
+            )
+
+    Methods that return json raise aiohttp.ClientResponseError when the request fails, except
+    get_chart which returns None like fetch_chart_json.
+
+    Parameters
+    ----------
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    proxy: str | None, optional
+        URL of a proxy for every request. Example: "http://myproxy.example.org/path". Default is no proxy
+    max_concurrency: int, optional
+        requests in flight at once. Ignored when limiter is given. Default is 4
+    limiter: AsyncRateLimiter | None, optional
+        limiter to share with other clients or download_charts. Default is a new limiter for this client
+    retries: int, optional
+        how many times to try a request. Default is 5
+    timeout: float, optional
+        timeout in seconds for a request attempt, and for pauses while reading a file. Default is 600
+    cache: MemoryCache | SQLiteCache | None, optional
+        Cache for chart query results. Default is None for no caching
+    session: aiohttp.ClientSession | None, optional
+        session to send requests with. It is not closed by the client. Default is a new session
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        secret: str,
+        region: str = "eu",
+        proxy: str | None = None,
+        max_concurrency: int = 4,
+        limiter: AsyncRateLimiter | None = None,
+        retries: int = 5,
+        timeout: float = 600,
+        cache: MemoryCache | SQLiteCache | None = None,
+        session: aiohttp.ClientSession | None = None,
+    ):
+        self.region = region
+        self.base_url = BASE_DOMAINS[region]
+        self.headers = build_headers(api_key, secret)
+        self.proxy = proxy
+        self.limiter = limiter or AsyncRateLimiter(max_concurrency)
+        self.retries = retries
+        self.timeout = timeout
+        self.cache = cache
+        self._session = session
+        self._owns_session = session is None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session, created on first use"""
+        if self._session is None or self._session.closed and self._owns_session:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def __aenter__(self) -> "AsyncAmplitudeClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the session if the client created it"""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def request(
+        self, method: str, path: str, **kwargs: Any
+    ) -> contextlib.AbstractAsyncContextManager[aiohttp.ClientResponse]:
+        """
+        Send a request to an API path, for example "/api/2/taxonomy/event", as an async context manager
+
+        Keyword arguments are passed on to request, and from there to aiohttp. The client
+        timeout, retries and proxy are used unless given, and headers are added to the client
+        headers.
+        """
+        headers = {**self.headers, **kwargs.pop("headers", {})}
+        kwargs.setdefault("retries", self.retries)
+        kwargs.setdefault("timeout", self.timeout)
+        if self.proxy:
+            kwargs.setdefault("proxy", self.proxy)
+        return request(
+            self.session,
+            method,
+            f"{self.base_url}{path}",
+            headers,
+            self.limiter,
+            **kwargs,
+        )
+
+    async def _json(self, method: str, path: str, **kwargs: Any) -> Any:
+        async with self.request(method, path, **kwargs) as resp:
+            resp.raise_for_status()
+            return await resp.json(content_type=None)
+
+    def _stream_timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=None, sock_read=self.timeout)
+
+    async def get_chart(
+        self,
+        chart_id: str,
+        cache: MemoryCache | SQLiteCache | None = None,
+        refresh: bool = False,
+    ) -> Any | None:
+        """
+        Get data for an existing chart in Amplitude
+
+        Parameters
+        ---------
+        chart_id: str, required
+            The ID of the chart. For example  https://analytics.amplitude.com/demo/chart/abc123
+        cache: MemoryCache | SQLiteCache | None, optional
+            Cache for the result. Default is the cache of the client
+        refresh: bool, optional
+            Skip the cached result and fetch the chart again. Default is False
+
+        Returns
+        -------
+        Chart data as Json or None
+        """
+        return await fetch_chart_json(
+            self.session,
+            chart_id,
+            self.headers,
+            region=self.region,
+            retries=self.retries,
+            timeout=self.timeout,
+            limiter=self.limiter,
+            cache=cache or self.cache,
+            refresh=refresh,
+            proxy=self.proxy,
+        )
+
+    async def find_user(self, user: str) -> Any:
+        """
+        Find the Amplitude ID for a user based on a type of ID, for example Device ID or User ID.
+
+        Parameters
+        ---------
+        user: str, required
+          The user you want to identify. Can use Device ID or User ID.
+        """
+        return await self._json("GET", "/api/2/usersearch", params={"user": user})
+
+    async def get_cohort(
+        self, cohort_id: str, filename: str | Path, props: int = 0, **kwargs: Any
+    ) -> Path:
+        """
+        Request, wait for and download a cohort of users, streamed to filename
+
+        Parameters
+        ---------
+        cohort_id: str, required
+            ID for the cohort
+        filename: str | Path, required
+            Path and filename to store the results. Example: "data/cohortdata.csv"
+        props: int, optional
+            Set to 0 if you only want Amplitude IDs, or 1 if you want more user data
+
+        Other keyword arguments, like min_interval and max_wait, are passed on to download_cohort.
+
+        Returns
+        -------
+        Path to the csv file
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("proxy", self.proxy)
+        return await download_cohort(
+            self.session,
+            cohort_id,
+            self.headers,
+            Path(filename),
+            region=self.region,
+            props=props,
+            limiter=self.limiter,
+            **kwargs,
+        )
+
+    async def delete_user_data(
+        self,
+        deletion_list: list,
+        user_ids: list,
+        email: str,
+        ignore_invalid_id: bool = False,
+        delete_from_org: bool = False,
+    ) -> Any:
+        """
+        Delete user data for one or more users
+
+        Parameters
+        ---------
+        deletion_list: required
+          One or more Amplitude IDs you want to delete user data for
+        user_ids: required
+          One or more User IDs you want to delete user data for
+        email: required
+          email for the user in Amplitude requesting the data be deleted
+        ignored_invalid_id: bool, optional
+            Ignore any invalid user IDs(users that do no exist in the project) that were passed in
+        delete_from_org: bool, optional
+            delete from the entire org rather than just this project
+        """
+        return await self._json(
+            "POST",
+            "/api/2/deletions/users",
+            json={
+                "amplitude_ids": deletion_list,
+                "user_ids": user_ids,
+                "requester": email,
+                "ignore_invalid_id": ignore_invalid_id,
+                "delete_from_org": delete_from_org,
+            },
+        )
+
+    async def get_deletion_jobs(self, start: str, end: str) -> Any:
+        """
+        Get an overview of all deletion jobs in Amplitude
+
+        Parameters
+        ---------
+        start: str, required
+            Start date for a period of deletion jobs. Formated as YYYY-MM-DD
+        end: str, required
+            End date for a period of deletion jobs. Formated as YYYY-MM-DD
+        """
+        return await self._json(
+            "GET", "/api/2/deletions/users", params={"start_day": start, "end_day": end}
+        )
+
+    async def iter_export_chunks(
+        self, start: str, end: str, chunk_size: int = 1048576
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream the export zip for a time period as chunks of bytes
+
+        400 and 504, which the export API returns for too much data, are not retried and raise
+        aiohttp.ClientResponseError. See export_project_data.
+        """
+        async with self.request(
+            "GET",
+            "/api/2/export",
+            params={"start": start, "end": end},
+            timeout=self._stream_timeout(),
+            retry_statuses=EXPORT_RETRY_STATUSES,
+        ) as resp:
+            if resp.status == 400:
+                logger.info(
+                    "The file size of the exported data is too large. Shorten the time ranges and try again. The limit size is 4GB."
+                )
+            elif resp.status == 404:
+                logger.info(
+                    "No data has been collected for the project in this time range."
+                )
+            elif resp.status == 504:
+                logger.info(
+                    "The amount of data is large causing a timeout. For large amounts of data, the Amazon S3 destination is recommended."
+                )
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def export_project_data(self, start: str, end: str, filename: str) -> str:
+        """
+        Download all project data from an Amplitude project for a time period, max 365 days per request
+
+        The zip is streamed to a temporary file next to filename and renamed when complete.
+
+        Parameters
+        ---------
+        start: str, required
+            The date for the start of the requested timeperiod. Must be formated as YYYYMMDDTHH
+        end: str, required
+            The dat for the end of the requested timeperiode. Must be formated as YYYYMMDDTHH
+        filename: str, required
+            filename and path to the project data. Example: "data/projectdata.zip"
+
+        Returns
+        ----------
+        filename: zip-file containing multiple gzip files, one for each hour
+        """
+        tmp_path = Path(f"{filename}.part")
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            async for chunk in self.iter_export_chunks(start, end):
+                await asyncio.to_thread(f.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(f.close)
+            tmp_path.unlink(missing_ok=True)
+            raise
+        await asyncio.to_thread(f.close)
+        tmp_path.replace(filename)
+        logger.info(f"Saved export {start}-{end} as {filename}")
+        return filename
+
+    async def get_all_event_types(self) -> Any:
+        """Get a list of all event-types for the project"""
+        return await self._json("GET", "/api/2/taxonomy/event")
+
+    async def delete_event_type(self, event_type: str) -> Any:
+        """
+        Delete an even type for the project
+
+        Parameters
+        ----------
+        event_type: str, required
+            name of the event type to be deleted from the Amplitude project
+        """
+        return await self._json(
+            "DELETE", f"/api/2/taxonomy/event/{quote(event_type, safe='')}"
+        )
+
+    async def update_event_type(
+        self,
+        event_type: str,
+        category: str | None = None,
+        display_name: str | None = None,
+        new_event_type: str | None = None,
+        description: str | None = None,
+        is_active: bool | None = None,
+    ) -> Any:
+        """
+        Update an event type for the project, only the fields that are given are changed
+
+        See analytics_api.update_event_type for a description of the parameters
+        """
+        fields = {
+            "category": category,
+            "display_name": display_name,
+            "new_event_type": new_event_type,
+            "description": description,
+            "is_active": None if is_active is None else str(is_active).lower(),
+        }
+        return await self._json(
+            "PUT",
+            f"/api/2/taxonomy/event/{quote(event_type, safe='')}",
+            data={k: v for k, v in fields.items() if v is not None},
+            headers={"Content-Type": FORM_CONTENT_TYPE},
+        )
+
+    async def get_event_segmentation(
+        self,
+        start: str,
+        end: str,
+        event: dict,
+        metrics: Any,
+        interval: int = 1,
+        segment: Any = None,
+        group: Any = None,
+        limit: int = 100,
+    ) -> Any:
+        """
+        Get metrics for an event with segmentation
+
+        See analytics_api.get_event_segmentation for a description of the parameters
+        """
+        params = {
+            "e": json.dumps(event),
+            "m": metrics,
+            "start": start,
+            "end": end,
+            "i": interval,
+            "s": json.dumps(segment) if isinstance(segment, (list, dict)) else segment,
+            "g": group,
+            "limit": limit,
+        }
+        return await self._json(
+            "GET",
+            "/api/2/events/segmentation",
+            params={k: v for k, v in params.items() if v is not None},
+        )
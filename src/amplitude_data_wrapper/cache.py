@@ -0,0 +1,154 @@
+# %%
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from ._sqlite import SQLiteStore
+
+
+# %%
+def cache_key(region: str, chart_id: str, params: dict[str, Any] | None = None) -> str:
+    """
+    Build the cache key for a chart query
+
+    Parameters
+    ----------
+    region: str, required
+        'eu' or 'us' amplitude data centre
+    chart_id: str, required
+        chart ID
+    params: dict | None, optional
+        query parameters of the request. Default is None
+
+    Returns
+    -------
+    key: str
+    """
+    raw = json.dumps([region, chart_id, params or {}], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# %%
+class MemoryCache:
+    """
+    In-memory cache with a time to live and least recently used eviction
+
+    Safe to share between threads and between the sync and async APIs.
+
+    Parameters
+    ----------
+    ttl: float, optional
+        seconds an entry stays valid. Default is 3600
+    max_entries: int, optional
+        maximum number of entries, the least recently used are evicted first. Default is 1024
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        """Return the cached value, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes) -> None:
+        """Store a value, evicting the least recently used entries if the cache is full"""
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Remove an entry"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(SQLiteStore):
+    """
+    Persistent cache in a local SQLite file, with a time to live and least recently used eviction
+
+    Entries survive restarts and can be shared between processes on the same machine.
+
+    Parameters
+    ----------
+    path: str | Path, required
+        path to the SQLite database file
+    ttl: float, optional
+        seconds an entry stays valid. Default is 3600
+    max_entries: int, optional
+        maximum number of entries, the least recently used are evicted first. Default is 10000
+    """
+
+    def __init__(self, path: str | Path, ttl: float = 3600, max_entries: int = 10000):
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+        )
+
+    def get(self, key: str) -> bytes | None:
+        """Return the cached value, or None if it is missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._db.execute(
+                "UPDATE entries SET accessed = ? WHERE key = ?", (now, key)
+            )
+            return row[0]
+
+    def set(self, key: str, value: bytes) -> None:
+        """Store a value, evicting the least recently used entries if the cache is full"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl, now),
+            )
+            self._db.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str) -> None:
+        """Remove an entry"""
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
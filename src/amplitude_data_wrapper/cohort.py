@@ -0,0 +1,367 @@
+# %%
+import codecs
+import contextlib
+import csv
+import json
+import logging
+import os
+import shutil
+import sys
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .analytics_api import shared_client
+
+logger = logging.getLogger(__name__)
+
+# %%
+AMPLITUDE_ID = "amplitude_id"
+FORMATS = ("auto", "parquet", "arrow", "arrays")
+
+
+# %%
+def iter_text_lines(
+    chunks: Iterable[bytes], encoding: str = "utf-8-sig"
+) -> Iterator[str]:
+    """
+    Decode byte chunks into lines of text as they arrive, keeping line endings for the csv module
+
+    Parameters
+    ----------
+    chunks: Iterable[bytes], required
+        bytes of a text file
+    encoding: str, optional
+        text encoding. Default is 'utf-8-sig', which drops a byte order mark
+
+    Returns
+    -------
+    Iterator over lines of text
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def _column_name(name: str) -> str:
+    return name.strip().lower().replace(" ", "_")
+
+
+class _DictionaryColumn:
+    """Dictionary encoded string column, with the codes of the current batch"""
+
+    def __init__(self):
+        self.values: list[str] = []
+        self.index: dict[str, int] = {}
+        self.codes = array("i")
+
+    def new_batch(self, keep_dictionary: bool) -> None:
+        self.codes = array("i")
+        if not keep_dictionary:
+            self.values = []
+            self.index = {}
+
+    def append(self, value: str) -> None:
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+
+# %%
+def _array_file(name: str) -> str:
+    return f"{name}.int64" if name == AMPLITUDE_ID else f"{name}.codes"
+
+
+class _ArrayWriter:
+    """Writes typed arrays to a directory: int64 ids, int32 codes and json dictionaries"""
+
+    keep_dictionary = True
+
+    def __init__(self, dest: Path, names: list[str]):
+        self.dest = dest
+        self.names = names
+        self.tmp = dest.with_name(f"{dest.name}.tmp")
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        self.tmp.mkdir(parents=True)
+        self.files = {name: open(self.tmp / _array_file(name), "wb") for name in names}
+
+    def write(self, ids: array, columns: dict[str, _DictionaryColumn]) -> None:
+        ids.tofile(self.files[AMPLITUDE_ID])
+        for name, column in columns.items():
+            column.codes.tofile(self.files[name])
+
+    def close(self, rows: int, columns: dict[str, _DictionaryColumn]) -> None:
+        for f in self.files.values():
+            f.close()
+        schema = {"rows": rows, "byteorder": sys.byteorder, "columns": {}}
+        for name in self.names:
+            if name == AMPLITUDE_ID:
+                schema["columns"][name] = {"type": "int64", "file": _array_file(name)}
+                continue
+            with open(self.tmp / f"{name}.dict.json", "w", encoding="utf-8") as f:
+                json.dump(columns[name].values, f, ensure_ascii=False)
+            schema["columns"][name] = {
+                "type": "dictionary",
+                "file": _array_file(name),
+                "dictionary": f"{name}.dict.json",
+            }
+        with open(self.tmp / "schema.json", "w", encoding="utf-8") as f:
+            json.dump(schema, f, indent=2)
+        shutil.rmtree(self.dest, ignore_errors=True)
+        os.replace(self.tmp, self.dest)
+
+    def abort(self) -> None:
+        """Close the files and remove the partial output"""
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+class _ArrowWriter:
+    """Writes record batches to a parquet file or an arrow IPC stream, with a dictionary per batch"""
+
+    keep_dictionary = False
+
+    def __init__(self, dest: Path, names: list[str], file_format: str):
+        import pyarrow as pa
+
+        self.pa = pa
+        self.dest = dest
+        self.tmp = dest.with_name(f"{dest.name}.tmp")
+        self.names = names
+        string_type = pa.dictionary(pa.int32(), pa.string())
+        self.schema = pa.schema(
+            [
+                pa.field(n, pa.int64() if n == AMPLITUDE_ID else string_type)
+                for n in names
+            ]
+        )
+        if file_format == "parquet":
+            import pyarrow.parquet as pq
+
+            self.writer = pq.ParquetWriter(self.tmp, self.schema, compression="zstd")
+        else:
+            self.writer = pa.ipc.new_stream(str(self.tmp), self.schema)
+
+    def write(self, ids: array, columns: dict[str, _DictionaryColumn]) -> None:
+        pa = self.pa
+        arrays = []
+        for name in self.names:
+            if name == AMPLITUDE_ID:
+                arrays.append(pa.array(ids, type=pa.int64()))
+            else:
+                column = columns[name]
+                arrays.append(
+                    pa.DictionaryArray.from_arrays(
+                        pa.array(column.codes, type=pa.int32()),
+                        pa.array(column.values, type=pa.string()),
+                    )
+                )
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+
+    def close(self, rows: int, columns: dict[str, _DictionaryColumn]) -> None:
+        self.writer.close()
+        os.replace(self.tmp, self.dest)
+
+    def abort(self) -> None:
+        """Close the writer and remove the partial output"""
+        # the partial file is removed anyway, so an error while closing it does not matter
+        with contextlib.suppress(Exception):
+            self.writer.close()
+        self.tmp.unlink(missing_ok=True)
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# %%
+def write_cohort_columns(
+    lines: Iterable[str],
+    dest: str | Path,
+    file_format: str = "auto",
+    batch_size: int = 100000,
+) -> Path:
+    """
+    Parse cohort csv rows incrementally and write them as compact columns
+
+    The amplitude_id column is stored as int64 and every other column is dictionary encoded, so
+    repeated property values are stored once. Rows are converted in batches of batch_size. With
+    parquet and arrow every batch has its own dictionaries, so memory use depends only on the
+    batch size. The arrays format keeps one dictionary per column for the whole file.
+
+    Parameters
+    ----------
+    lines: Iterable[str], required
+        lines of the cohort csv, including the header
+    dest: str | Path, required
+        output path. A file for 'parquet' and 'arrow', a directory for 'arrays'
+    file_format: str, optional
+        'parquet' or 'arrow' (IPC stream), which need pyarrow, or 'arrays' for raw typed arrays
+        with a schema.json. Default is 'auto', which is 'parquet' when pyarrow is installed and
+        'arrays' otherwise
+    batch_size: int, optional
+        rows per batch. Default is 100000
+
+    Returns
+    -------
+    dest: Path to the output
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"file_format must be one of {FORMATS}, not {file_format!r}")
+    if file_format == "auto":
+        file_format = "parquet" if _has_pyarrow() else "arrays"
+    if file_format in ("parquet", "arrow") and not _has_pyarrow():
+        raise ImportError(
+            f"Writing {file_format} needs pyarrow. Install it with: pip install amplitude-data-wrapper[arrow]"
+        )
+
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("The cohort file is empty")
+    names = [_column_name(name) for name in header]
+    if AMPLITUDE_ID not in names:
+        raise ValueError(f"The cohort file has no {AMPLITUDE_ID} column: {header}")
+    id_position = names.index(AMPLITUDE_ID)
+    others = [(i, name) for i, name in enumerate(names) if i != id_position]
+
+    writer = (
+        _ArrayWriter(dest, names)
+        if file_format == "arrays"
+        else _ArrowWriter(dest, names, file_format)
+    )
+    columns = {name: _DictionaryColumn() for _, name in others}
+    ids = array("q")
+    rows = 0
+    try:
+        for row in reader:
+            if not row:
+                continue
+            ids.append(int(row[id_position]))
+            for i, name in others:
+                columns[name].append(row[i] if i < len(row) else "")
+            if len(ids) >= batch_size:
+                writer.write(ids, columns)
+                rows += len(ids)
+                ids = array("q")
+                for column in columns.values():
+                    column.new_batch(writer.keep_dictionary)
+        if ids or rows == 0:
+            writer.write(ids, columns)
+            rows += len(ids)
+        writer.close(rows, columns)
+    except BaseException:
+        writer.abort()
+        raise
+    logger.info("Wrote %s cohort rows to %s", rows, dest)
+    return dest
+
+
+def convert_cohort_file(
+    filename: str | Path,
+    dest: str | Path,
+    file_format: str = "auto",
+    batch_size: int = 100000,
+) -> Path:
+    """
+    Convert a cohort csv saved by get_cohort to compact columns
+
+    See write_cohort_columns for the parameters and output formats.
+    """
+    with open(filename, encoding="utf-8-sig", newline="") as f:
+        return write_cohort_columns(f, dest, file_format, batch_size)
+
+
+def read_cohort_arrays(path: str | Path) -> dict[str, array | list[str]]:
+    """
+    Load a cohort written with file_format='arrays'
+
+    Returns
+    -------
+    dictionary of column name to an int64 array for amplitude_id, or a list of strings for other columns
+    """
+    path = Path(path)
+    with open(path / "schema.json", encoding="utf-8") as f:
+        schema = json.load(f)
+    result: dict[str, array | list[str]] = {}
+    for name, column in schema["columns"].items():
+        values = array("q" if column["type"] == "int64" else "i")
+        with open(path / column["file"], "rb") as f:
+            values.fromfile(f, schema["rows"])
+        if schema["byteorder"] != sys.byteorder:
+            values.byteswap()
+        if column["type"] == "dictionary":
+            with open(path / column["dictionary"], encoding="utf-8") as f:
+                dictionary = json.load(f)
+            result[name] = [dictionary[code] for code in values]
+        else:
+            result[name] = values
+    return result
+
+
+# %%
+def download_cohort_columns(
+    api_key: str,
+    secret: str,
+    cohort_id: str,
+    dest: str | Path,
+    props: int = 0,
+    file_format: str = "auto",
+    proxy: dict | None = None,
+    region: str = "eu",
+    batch_size: int = 100000,
+) -> Path:
+    """
+    Download a cohort of users from Amplitude straight into compact columns, without saving the csv
+
+    See https://developers.amplitude.com/docs/behavioral-cohorts-api#getting-one-cohort
+
+    Parameters
+    ---------
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    cohort_id: str, required
+        ID for the cohort
+    dest: str | Path, required
+        output path, see write_cohort_columns
+    props: int, optional
+        Set to 0 if you only want Amplitude IDs, or 1 if you want more user data. Default is 0
+    file_format: str, optional
+        'auto', 'parquet', 'arrow' or 'arrays', see write_cohort_columns. Default is 'auto'
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    proxy: dict | None = None, optional
+        Set proxy with custom domain and path. Example: {"http": "http://myproxy.example.org/path"}
+
+        Default is no proxy.
+    batch_size: int, optional
+        rows per batch. Default is 100000
+
+    Returns
+    -------
+    dest: Path to the output
+    """
+    client = shared_client(api_key, secret, region, proxy)
+    with client.open_cohort(cohort_id, props=props) as response:
+        chunks = response.iter_content(chunk_size=1048576)
+        return write_cohort_columns(
+            iter_text_lines(chunks), dest, file_format, batch_size
+        )
@@ -0,0 +1,306 @@
+# %%
+import itertools
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+import requests
+
+from ._report import StatusReport
+from .analytics_api import AmplitudeClient, shared_client
+from .ratelimit import RateLimiter, backoff_delay, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# %%
+MAX_IDS_PER_REQUEST = 100
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class DeletionBatch:
+    """One deletion request and what happened to it"""
+
+    index: int
+    amplitude_ids: list = field(default_factory=list)
+    user_ids: list = field(default_factory=list)
+    status: str = "pending"
+    attempts: int = 0
+    days: list[str] = field(default_factory=list)
+    job_status: str | None = None
+    error: str | None = None
+
+
+@dataclass
+class DeletionReport(StatusReport[DeletionBatch]):
+    """Per-batch results of delete_users_bulk, with the status 'submitted', 'failed' or 'done'"""
+
+    batches: list[DeletionBatch] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def _items(self) -> list[DeletionBatch]:
+        return self.batches
+
+
+# %%
+def chunk_ids(ids: Iterable, size: int = MAX_IDS_PER_REQUEST) -> Iterator[list]:
+    """
+    Split an iterable of IDs into lists of at most size IDs, without loading it all in memory
+
+    Parameters
+    ----------
+    ids: Iterable, required
+        IDs to split
+    size: int, optional
+        maximum IDs per list. Default is 100, the limit of the deletion API
+
+    Returns
+    -------
+    Iterator over lists of IDs
+    """
+    iterator = iter(ids)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _submit_batch(
+    client: AmplitudeClient,
+    batch: DeletionBatch,
+    email: str,
+    limiter: RateLimiter,
+    retries: int,
+    ignore_invalid_id: bool,
+    delete_from_org: bool,
+) -> DeletionBatch:
+    """
+    Send one deletion batch, retrying on connection errors, timeouts, 429 and 5xx responses
+
+    Deleting the same IDs twice has no further effect, so the request is safe to repeat. A batch
+    that still fails, or gets a response that is not valid json, is marked failed with the error.
+    """
+    for attempt in range(1, retries + 1):
+        batch.attempts = attempt
+        limiter.acquire()
+        try:
+            r = client.delete_user_data(
+                batch.amplitude_ids,
+                batch.user_ids,
+                email,
+                ignore_invalid_id=ignore_invalid_id,
+                delete_from_org=delete_from_org,
+            )
+        except requests.RequestException as e:
+            batch.error = repr(e)
+            wait_seconds = backoff_delay(attempt)
+        else:
+            if r.status_code == 200:
+                try:
+                    jobs = r.json()
+                except ValueError as e:
+                    batch.error = f"Invalid response: {e!r}"
+                    break
+                batch.status = "submitted"
+                batch.error = None
+                batch.days = sorted({job.get("day") for job in jobs if job.get("day")})
+                return batch
+            batch.error = f"HTTP {r.status_code}: {r.text[:200]}"
+            if r.status_code not in RETRY_STATUSES:
+                break
+            retry_after = parse_retry_after(r.headers.get("Retry-After"))
+            wait_seconds = (
+                retry_after if retry_after is not None else backoff_delay(attempt)
+            )
+            if r.status_code == 429:
+                limiter.block(wait_seconds)
+        if attempt < retries:
+            logger.warning(
+                "Deletion batch %s failed with %s, retry %s/%s in %.1fs",
+                batch.index,
+                batch.error,
+                attempt,
+                retries,
+                wait_seconds,
+            )
+            time.sleep(wait_seconds)
+    batch.status = "failed"
+    logger.error("Deletion batch %s failed: %s", batch.index, batch.error)
+    return batch
+
+
+def delete_users_bulk(
+    email: str,
+    api_key: str,
+    secret: str,
+    amplitude_ids: Iterable = (),
+    user_ids: Iterable = (),
+    proxy: dict | None = None,
+    region: str = "eu",
+    batch_size: int = MAX_IDS_PER_REQUEST,
+    workers: int = 4,
+    rate: float = 1.0,
+    retries: int = 5,
+    ignore_invalid_id: bool = False,
+    delete_from_org: bool = False,
+) -> DeletionReport:
+    """
+    Delete user data for any number of users, in batches sent concurrently under a rate limit
+
+    The IDs are read lazily and split into batches of at most batch_size IDs. Batches are sent by
+    a pool of workers, limited to rate requests per second, and retried on connection errors,
+    timeouts, 429 and 5xx responses. Use track_deletion_jobs on the report to follow the deletion jobs.
+
+    See https://developers.amplitude.com/docs/user-deletion#post
+
+    Parameters
+    ---------
+    email: str, required
+      email for the user in Amplitude requesting the data be deleted
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    amplitude_ids: Iterable, optional
+        Amplitude IDs to delete user data for
+    user_ids: Iterable, optional
+        User IDs to delete user data for
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    proxy: dict | None = None, optional
+        Set proxy with custom domain and path. Example: {"http": "http://myproxy.example.org/path"}
+
+        Default is no proxy.
+    batch_size: int, optional
+        IDs per request, at most 100. Default is 100
+    workers: int, optional
+        number of requests in flight. Default is 4
+    rate: float, optional
+        requests per second. Default is 1
+    retries: int, optional
+        how many times to try a batch. Default is 5
+    ignore_invalid_id: bool, optional
+        Ignore any invalid user IDs(users that do no exist in the project) that were passed in
+    delete_from_org: bool, optional
+        delete from the entire org rather than just this project. Can only be used with portfolio orgs and with user ids only
+
+    Returns
+    -------
+    DeletionReport with the IDs, status and deletion days of every batch
+    """
+    if not 1 <= batch_size <= MAX_IDS_PER_REQUEST:
+        raise ValueError(f"batch_size must be between 1 and {MAX_IDS_PER_REQUEST}")
+    started = time.perf_counter()
+    client = shared_client(api_key, secret, region, proxy)
+    limiter = RateLimiter(rate)
+    report = DeletionReport()
+    batches = itertools.chain(
+        (
+            DeletionBatch(0, amplitude_ids=chunk)
+            for chunk in chunk_ids(amplitude_ids, batch_size)
+        ),
+        (DeletionBatch(0, user_ids=chunk) for chunk in chunk_ids(user_ids, batch_size)),
+    )
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending: set[Future] = set()
+        for index, batch in enumerate(batches):
+            batch.index = index
+            report.batches.append(batch)
+            pending.add(
+                pool.submit(
+                    _submit_batch,
+                    client,
+                    batch,
+                    email,
+                    limiter,
+                    retries,
+                    ignore_invalid_id,
+                    delete_from_org,
+                )
+            )
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+        for future in wait(pending).done:
+            future.result()
+
+    report.seconds = time.perf_counter() - started
+    logger.info(
+        "Submitted %s deletion batches, %s failed, in %.1fs",
+        report.count("submitted"),
+        report.count("failed"),
+        report.seconds,
+    )
+    return report
+
+
+# %%
+def track_deletion_jobs(
+    report: DeletionReport,
+    api_key: str,
+    secret: str,
+    proxy: dict | None = None,
+    region: str = "eu",
+    poll_interval: float = 300,
+    max_wait: float | None = 0,
+) -> DeletionReport:
+    """
+    Follow the deletion jobs of submitted batches with get_deletion_jobs
+
+    Each batch gets the status of the deletion jobs for the days it was scheduled on. A batch is
+    'done' when all its jobs are done.
+
+    See https://developers.amplitude.com/docs/user-deletion#get
+
+    Parameters
+    ----------
+    report: DeletionReport, required
+        report returned by delete_users_bulk
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    proxy: dict | None = None, optional
+        Set proxy with custom domain and path. Example: {"http": "http://myproxy.example.org/path"}
+
+        Default is no proxy.
+    poll_interval: float, optional
+        seconds between checks while waiting. Default is 300
+    max_wait: float | None, optional
+        keep polling until all batches are done or this many seconds have passed. Default is 0 to
+        check once, None waits until everything is done
+
+    Returns
+    -------
+    the same report, with job_status set and finished batches marked 'done'
+    """
+    client = shared_client(api_key, secret, region, proxy)
+    started = time.monotonic()
+    while True:
+        open_batches = [b for b in report.batches if b.status == "submitted" and b.days]
+        if not open_batches:
+            return report
+        days = sorted({day for b in open_batches for day in b.days})
+        r = client.get_deletion_jobs(days[0], days[-1])
+        r.raise_for_status()
+        statuses = {job.get("day"): job.get("status") for job in r.json()}
+        for batch in open_batches:
+            batch_statuses = {statuses.get(day) for day in batch.days}
+            batch.job_status = ",".join(sorted(s or "unknown" for s in batch_statuses))
+            if batch_statuses == {"done"}:
+                batch.status = "done"
+        logger.info(
+            "Deletion jobs: %s batches done, %s waiting",
+            report.count("done"),
+            report.count("submitted"),
+        )
+        if (
+            max_wait is not None
+            and time.monotonic() - started + poll_interval > max_wait
+        ):
+            return report
+        time.sleep(poll_interval)
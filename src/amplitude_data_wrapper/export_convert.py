@@ -0,0 +1,280 @@
+# %%
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from .export_stream import iter_export_lines
+
+logger = logging.getLogger(__name__)
+
+# %%
+FORMATS = ("parquet", "arrow")
+PARTITIONS = ("day", "hour", None)
+
+INT_COLUMNS = {"amplitude_id", "app", "event_id", "session_id"}
+
+_EVENT_TIME = re.compile(rb'"event_time"\s*:\s*"([^"]*)"')
+
+
+# %%
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError(
+            "Converting exports needs pyarrow. Install it with: pip install amplitude-data-wrapper[arrow]"
+        ) from e
+    return pyarrow
+
+
+def _event_type_patterns(event_types: Iterable[str]) -> list[bytes]:
+    """Byte strings of which at least one must occur in a line with one of the event types"""
+    patterns = set()
+    for event_type in event_types:
+        patterns.add(json.dumps(event_type).encode())
+        patterns.add(json.dumps(event_type, ensure_ascii=False).encode())
+    return list(patterns)
+
+
+def _maybe_in_time_range(line: bytes, start: str | None, end: str | None) -> bool:
+    """
+    Cheap check on the raw line. False means no event_time in the line is in range, so the
+    event can be dropped without parsing it.
+    """
+    for match in _EVENT_TIME.finditer(line):
+        value = match.group(1).decode(errors="replace")
+        if (start is None or value >= start) and (end is None or value < end):
+            return True
+    return False
+
+
+def _get_path(event: dict, path: list[str]) -> Any:
+    value: Any = event
+    for part in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _cell(name: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if name in INT_COLUMNS:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def filter_export_lines(
+    lines: Iterable[bytes],
+    columns: list[str] | None = None,
+    event_types: Iterable[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    Parse raw export lines, keeping only matching events and the requested columns
+
+    Lines are checked for the event types and event time before they are parsed, so most events
+    that are filtered out are never turned into Python objects.
+
+    Parameters
+    ----------
+    lines: Iterable[bytes], required
+        raw json lines, for example from iter_export_events(raw=True)
+    columns: list[str] | None, optional
+        columns to keep. Nested fields are given with dots, for example "event_properties.app".
+        Default is None for all top level fields
+    event_types: Iterable[str] | None, optional
+        keep only these event types. Default is None for all event types
+    start: str | None, optional
+        keep only events with event_time at or after this time, formated as "YYYY-MM-DD HH:MM:SS".
+        A prefix like "2022-06-01" works too. Default is None
+    end: str | None, optional
+        keep only events with event_time before this time, in the same format as start. Default is None
+
+    Returns
+    -------
+    Iterator over dictionaries of column name to value
+    """
+    wanted = set(event_types) if event_types is not None else None
+    patterns = _event_type_patterns(wanted) if wanted is not None else None
+    paths = [(name, name.split(".")) for name in columns] if columns else None
+    for line in lines:
+        if patterns is not None and not any(p in line for p in patterns):
+            continue
+        if (start or end) and not _maybe_in_time_range(line, start, end):
+            continue
+        event = json.loads(line)
+        if wanted is not None and event.get("event_type") not in wanted:
+            continue
+        event_time = event.get("event_time") or ""
+        if (start and event_time < start) or (end and event_time >= end):
+            continue
+        if paths is None:
+            yield {name: _cell(name, value) for name, value in event.items()}
+        else:
+            yield {name: _cell(name, _get_path(event, path)) for name, path in paths}
+
+
+# %%
+class _PartitionWriter:
+    """Buffers rows per partition and writes each full buffer as a new file"""
+
+    def __init__(self, out_dir: Path, file_format: str, batch_size: int):
+        self.pa = _import_pyarrow()
+        self.out_dir = out_dir
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.buffers: dict[str, list[dict]] = {}
+        self.parts: dict[str, int] = {}
+        self.buffered = 0
+        self.written: list[Path] = []
+
+    def add(self, partition: str, row: dict) -> None:
+        buffer = self.buffers.setdefault(partition, [])
+        buffer.append(row)
+        self.buffered += 1
+        if len(buffer) >= self.batch_size:
+            self.flush(partition)
+        elif self.buffered >= 4 * self.batch_size:
+            self.flush(max(self.buffers, key=lambda p: len(self.buffers[p])))
+
+    def _schema(self, names: list[str]):
+        pa = self.pa
+        return pa.schema(
+            [(n, pa.int64() if n in INT_COLUMNS else pa.string()) for n in names]
+        )
+
+    def flush(self, partition: str) -> None:
+        rows = self.buffers.pop(partition, [])
+        if not rows:
+            return
+        self.buffered -= len(rows)
+        names = list(dict.fromkeys(name for row in rows for name in row))
+        table = self.pa.Table.from_pylist(rows, schema=self._schema(names))
+        part = self.parts.get(partition, 0)
+        self.parts[partition] = part + 1
+        directory = self.out_dir / partition if partition else self.out_dir
+        directory.mkdir(parents=True, exist_ok=True)
+        suffix = "parquet" if self.file_format == "parquet" else "arrow"
+        path = directory / f"part-{part:05d}.{suffix}"
+        if self.file_format == "parquet":
+            import pyarrow.parquet as pq
+
+            pq.write_table(table, path, compression="zstd")
+        else:
+            import pyarrow.feather as feather
+
+            feather.write_feather(table, path, compression="zstd")
+        self.written.append(path)
+
+    def close(self) -> list[Path]:
+        for partition in list(self.buffers):
+            self.flush(partition)
+        return self.written
+
+
+def _partition(event_time: str, partition_by: str | None) -> str:
+    if partition_by is None:
+        return ""
+    if len(event_time) < 13:
+        return "date=unknown"
+    if partition_by == "day":
+        return f"date={event_time[:10]}"
+    return f"date={event_time[:10]}/hour={event_time[11:13]}"
+
+
+def convert_export(
+    source: str | Path | Iterable[bytes],
+    out_dir: str | Path,
+    columns: list[str] | None = None,
+    event_types: Iterable[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    partition_by: str | None = "day",
+    file_format: str = "parquet",
+    batch_size: int = 100000,
+) -> list[Path]:
+    """
+    Convert exported events to partitioned Parquet or Arrow files
+
+    Reads an export zip written by export_project_data, or raw lines streamed with
+    iter_export_events(raw=True), and writes out_dir/date=YYYY-MM-DD/part-00000.parquet files.
+    Events are filtered by event type and time while parsing, and only the requested columns
+    are kept. amplitude_id, app, event_id and session_id are stored as int64, other columns as
+    strings, with nested objects as json.
+
+    Parameters
+    ----------
+    source: str | Path | Iterable[bytes], required
+        path to an export zip, or raw json lines
+    out_dir: str | Path, required
+        directory for the output files
+    columns: list[str] | None, optional
+        columns to keep, nested fields with dots like "event_properties.app". Default is None for all top level fields
+    event_types: Iterable[str] | None, optional
+        keep only these event types. Default is None for all event types
+    start: str | None, optional
+        keep only events with event_time at or after this time, for example "2022-06-01" or "2022-06-01 12:00:00". Default is None
+    end: str | None, optional
+        keep only events with event_time before this time. Default is None
+    partition_by: str | None, optional
+        'day', 'hour' or None for no partitions, based on event_time. Default is 'day'
+    file_format: str, optional
+        'parquet' or 'arrow' (Feather v2). Default is 'parquet'
+    batch_size: int, optional
+        rows per output file. Default is 100000
+
+    Returns
+    -------
+    list of the files written
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"file_format must be one of {FORMATS}, not {file_format!r}")
+    if partition_by not in PARTITIONS:
+        raise ValueError(
+            f"partition_by must be one of {PARTITIONS}, not {partition_by!r}"
+        )
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as f:
+            chunks = iter(lambda: f.read(1048576), b"")
+            lines = (line for _, line in iter_export_lines(chunks))
+            return convert_export(
+                lines,
+                out_dir,
+                columns,
+                event_types,
+                start,
+                end,
+                partition_by,
+                file_format,
+                batch_size,
+            )
+
+    out_dir = Path(out_dir)
+    projected = list(columns) if columns else None
+    if projected is not None and partition_by and "event_time" not in projected:
+        read_columns = projected + ["event_time"]
+    else:
+        read_columns = projected
+    writer = _PartitionWriter(out_dir, file_format, batch_size)
+    count = 0
+    for row in filter_export_lines(source, read_columns, event_types, start, end):
+        event_time = row.get("event_time") or ""
+        if read_columns is not projected:
+            del row["event_time"]
+        writer.add(_partition(event_time, partition_by), row)
+        count += 1
+    written = writer.close()
+    logger.info("Converted %s events to %s files in %s", count, len(written), out_dir)
+    return written
@@ -0,0 +1,436 @@
+# %%
+import hashlib
+import json
+import logging
+import os
+import shutil
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from .analytics_api import AmplitudeClient
+
+logger = logging.getLogger(__name__)
+
+# %%
+EXPORT_TIME_FORMAT = "%Y%m%dT%H"
+SPLIT_STATUSES = (400, 504)
+
+MANIFEST_NAME = "manifest.json"
+
+Window = tuple[str, str]
+
+
+class WindowTooLargeError(Exception):
+    """Raised when the export API rejects a window as too large (400) or times out (504)"""
+
+    def __init__(self, window: Window, status: int):
+        super().__init__(
+            f"Export window {window[0]}-{window[1]} failed with HTTP {status}"
+        )
+        self.window = window
+        self.status = status
+
+
+# %%
+def parse_export_hour(value: str) -> datetime:
+    """Parse an export API timestamp formated as YYYYMMDDTHH"""
+    return datetime.strptime(value, EXPORT_TIME_FORMAT)
+
+
+def format_export_hour(value: datetime) -> str:
+    """Format a datetime as an export API timestamp, YYYYMMDDTHH"""
+    return value.strftime(EXPORT_TIME_FORMAT)
+
+
+def window_hours(window: Window) -> int:
+    """Number of hours covered by an inclusive export window"""
+    start, end = (parse_export_hour(w) for w in window)
+    return int((end - start) / timedelta(hours=1)) + 1
+
+
+def split_time_range(start: str, end: str, hours: int = 24) -> list[Window]:
+    """
+    Split an inclusive export time range into consecutive windows
+
+    Parameters
+    ----------
+    start: str, required
+        first hour of the range, formated as YYYYMMDDTHH
+    end: str, required
+        last hour of the range, formated as YYYYMMDDTHH
+    hours: int, optional
+        length of each window in hours. Default is 24
+
+    Returns
+    -------
+    windows: list of (start, end) tuples formated as YYYYMMDDTHH
+    """
+    if hours < 1:
+        raise ValueError("hours must be at least 1")
+    first, last = parse_export_hour(start), parse_export_hour(end)
+    if last < first:
+        raise ValueError(f"end {end} is before start {start}")
+    one_hour = timedelta(hours=1)
+    windows = []
+    cursor = first
+    while cursor <= last:
+        window_end = min(cursor + hours * one_hour - one_hour, last)
+        windows.append((format_export_hour(cursor), format_export_hour(window_end)))
+        cursor = window_end + one_hour
+    return windows
+
+
+def halve_window(window: Window) -> tuple[Window, Window]:
+    """Split a window of at least two hours into two halves"""
+    total = window_hours(window)
+    if total < 2:
+        raise ValueError(f"Cannot split a single hour window {window[0]}")
+    start = parse_export_hour(window[0])
+    middle = start + timedelta(hours=total // 2 - 1)
+    return (
+        (window[0], format_export_hour(middle)),
+        (format_export_hour(middle + timedelta(hours=1)), window[1]),
+    )
+
+
+def iter_window_hours(window: Window):
+    """Iterate over every hour in an inclusive export window, formated as YYYYMMDDTHH"""
+    cursor, last = (parse_export_hour(w) for w in window)
+    while cursor <= last:
+        yield format_export_hour(cursor)
+        cursor += timedelta(hours=1)
+
+
+def missing_windows(
+    start: str, end: str, done: list[Window], hours: int = 24
+) -> list[Window]:
+    """
+    Find the windows still needed to cover start..end, given windows that are already done
+
+    Parameters
+    ----------
+    start: str, required
+        first hour of the range, formated as YYYYMMDDTHH
+    end: str, required
+        last hour of the range, formated as YYYYMMDDTHH
+    done: list[Window], required
+        windows already exported
+    hours: int, optional
+        maximum length of each new window in hours. Default is 24
+
+    Returns
+    -------
+    windows: list of (start, end) tuples covering the hours not in done
+    """
+    covered = {hour for window in done for hour in iter_window_hours(window)}
+    windows: list[Window] = []
+    run_start = previous = None
+    for hour in iter_window_hours((start, end)):
+        if hour in covered:
+            if run_start is not None:
+                windows.extend(split_time_range(run_start, previous, hours))
+                run_start = None
+        elif run_start is None:
+            run_start = hour
+        previous = hour
+    if run_start is not None:
+        windows.extend(split_time_range(run_start, previous, hours))
+    return windows
+
+
+def file_sha256(path: Path) -> str:
+    """Compute the sha256 checksum of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1048576):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# %%
+class ExportManifest:
+    """
+    Checkpoint manifest recording which export windows are finished
+
+    Each finished window is stored with its zip file name, byte count and sha256 checksum, or with
+    no file if the window held no data. The manifest is rewritten atomically after every window,
+    so an interrupted export can resume from the windows that are already on disk.
+
+    Parameters
+    ----------
+    path: Path, required
+        path to the manifest json file
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.windows: dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.windows = json.load(f).get("windows", {})
+
+    def record(
+        self, window: Window, file: Path | None, size: int, sha256: str | None
+    ) -> None:
+        """Mark a window as finished and save the manifest"""
+        self.windows[f"{window[0]}_{window[1]}"] = {
+            "start": window[0],
+            "end": window[1],
+            "file": file.name if file is not None else None,
+            "bytes": size,
+            "sha256": sha256,
+        }
+        self.save()
+
+    def save(self) -> None:
+        """Write the manifest to a temporary file and move it into place"""
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"windows": self.windows}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def completed(
+        self, start: str, end: str, verify: bool = False
+    ) -> dict[Window, Path | None]:
+        """
+        Return finished windows inside start..end whose files are intact
+
+        Files are checked by size, and by checksum when verify is True. Windows that fail the check
+        are dropped from the manifest so they are downloaded again.
+
+        Parameters
+        ----------
+        start: str, required
+            first hour of the range, formated as YYYYMMDDTHH
+        end: str, required
+            last hour of the range, formated as YYYYMMDDTHH
+        verify: bool, optional
+            recompute the sha256 checksum of every file. Default is False
+
+        Returns
+        -------
+        dictionary of window to zip path, or None for windows without data
+        """
+        result: dict[Window, Path | None] = {}
+        covered: set[str] = set()
+        for key, entry in sorted(self.windows.items()):
+            window = (entry["start"], entry["end"])
+            if window[0] < start or window[1] > end:
+                continue
+            hours = set(iter_window_hours(window))
+            if hours & covered:
+                continue
+            file = self.path.parent / entry["file"] if entry["file"] else None
+            if file is not None and not self._intact(file, entry, verify):
+                logger.warning(
+                    "Checkpoint for %s-%s is damaged, exporting again", *window
+                )
+                del self.windows[key]
+                continue
+            result[window] = file
+            covered |= hours
+        return result
+
+    @staticmethod
+    def _intact(file: Path, entry: dict, verify: bool) -> bool:
+        if not file.exists() or file.stat().st_size != entry["bytes"]:
+            return False
+        return not verify or file_sha256(file) == entry["sha256"]
+
+
+# %%
+def _download_window(
+    client: AmplitudeClient, window: Window, part_dir: Path, timeout: int
+) -> tuple[Path | None, int, str | None]:
+    """
+    Download one export window to a zip file in part_dir
+
+    Returns the path to the zip, its size and sha256 checksum, or None, 0, None if the window
+    holds no data (404).
+    """
+    path = part_dir / f"{window[0]}_{window[1]}.zip"
+    tmp_path = path.with_suffix(".zip.part")
+    with client.request(
+        "GET",
+        "/api/2/export",
+        params={"start": window[0], "end": window[1]},
+        stream=True,
+        timeout=timeout,
+    ) as response:
+        if response.status_code in SPLIT_STATUSES:
+            raise WindowTooLargeError(window, response.status_code)
+        if response.status_code == 404:
+            logger.info("No data for %s-%s", *window)
+            return None, 0, None
+        response.raise_for_status()
+        digest = hashlib.sha256()
+        size = 0
+        with open(tmp_path, "wb") as fout:
+            for chunk in response.iter_content(chunk_size=1048576):
+                fout.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+            fout.flush()
+            os.fsync(fout.fileno())
+    os.replace(tmp_path, path)
+    logger.info("Downloaded %s-%s", *window)
+    return path, size, digest.hexdigest()
+
+
+def merge_export_zips(parts: list[Path], filename: str) -> str:
+    """
+    Merge export zip files into a single zip, keeping the order of parts
+
+    The hourly members are already gzip compressed, so they are copied without recompression.
+
+    Parameters
+    ----------
+    parts: list[Path], required
+        zip files to merge, in the order they should appear
+    filename: str, required
+        path of the merged zip
+
+    Returns
+    -------
+    filename: path to the merged zip
+    """
+    tmp_filename = f"{filename}.tmp"
+    seen = set()
+    with zipfile.ZipFile(tmp_filename, "w", compression=zipfile.ZIP_STORED) as zout:
+        for part in parts:
+            with zipfile.ZipFile(part) as zin:
+                for info in zin.infolist():
+                    if info.is_dir() or info.filename in seen:
+                        continue
+                    seen.add(info.filename)
+                    target = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                    with (
+                        zin.open(info) as src,
+                        zout.open(target, "w", force_zip64=True) as dst,
+                    ):
+                        shutil.copyfileobj(src, dst, 1048576)
+    os.replace(tmp_filename, filename)
+    return filename
+
+
+# %%
+def export_range(
+    start: str,
+    end: str,
+    api_key: str,
+    secret: str,
+    filename: str,
+    proxy: dict | None = None,
+    region: str = "eu",
+    window_size: int = 24,
+    workers: int = 4,
+    retries: int = 5,
+    timeout: int = 600,
+    keep_parts: bool = False,
+    resume: bool = True,
+    verify: bool = False,
+) -> str:
+    """
+    Export project data for a long time range by downloading time windows in parallel
+
+    The range is split into windows of window_size hours that are downloaded concurrently. A window
+    that the API rejects as too large (400) or times out on (504) is split in half and retried,
+    down to single hours. The windows are merged into one zip in chronological order, with the
+    same layout as export_project_data.
+
+    Finished windows are written atomically to a directory next to filename and recorded in a
+    checkpoint manifest with byte counts and checksums. If an export is interrupted, running it
+    again with the same arguments only downloads the windows that are missing.
+
+    See https://developers.amplitude.com/docs/export-api
+
+    Parameters
+    ---------
+    start: str, required
+        The date for the start of the requested timeperiod. Must be formated as YYYYMMDDTHH, for example 20210101T00 = january 1 2021 at 00:00
+    end: str, required
+        The dat for the end of the requested timeperiode. Must be formated as YYYYMMDDTHH, for example 20210131T23 = january 31 2021 at 23:00
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    filename: str, required
+        filename and path to the project data. Example: "data/projectdata.zip"
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    proxy: dict | None = None, optional
+        Set proxy with custom domain and path. Example: {"http": "http://myproxy.example.org/path"}
+
+        Default is no proxy.
+    window_size: int, optional
+        Hours per window. Default is 24
+    workers: int, optional
+        Number of windows to download at the same time. Default is 4
+    retries: int, optional
+        How many times to retry a window on connection errors, 429 and 5xx responses. Default is 5
+    timeout: int, optional
+        Seconds to wait for the server before giving up on an attempt. Default is 600
+    keep_parts: bool, optional
+        Keep the per-window zip files and the manifest next to filename after merging. Default is False
+    resume: bool, optional
+        Reuse windows recorded in the manifest by an earlier run. Default is True
+    verify: bool, optional
+        Check the sha256 checksum of reused windows, not only their size. Default is False
+
+    Returns
+    ----------
+    filename: zip-file containing multiple gzip files, one for each hour
+    """
+    part_dir = Path(f"{filename}.parts")
+    part_dir.mkdir(parents=True, exist_ok=True)
+    manifest = ExportManifest(part_dir / MANIFEST_NAME)
+    if not resume:
+        manifest.windows = {}
+    completed = manifest.completed(start, end, verify=verify)
+    windows = missing_windows(start, end, list(completed), window_size)
+    logger.info(
+        "Exporting %s windows from %s to %s, %s windows already done",
+        len(windows),
+        start,
+        end,
+        len(completed),
+    )
+
+    client = AmplitudeClient(
+        api_key, secret, region=region, proxy=proxy, pool_size=workers, retries=retries
+    )
+    with client, ThreadPoolExecutor(max_workers=workers) as pool:
+
+        def submit(window: Window) -> Future:
+            return pool.submit(_download_window, client, window, part_dir, timeout)
+
+        pending = {submit(window): window for window in windows}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    window = pending.pop(future)
+                    try:
+                        path, size, sha256 = future.result()
+                    except WindowTooLargeError as e:
+                        if window_hours(window) < 2:
+                            raise
+                        logger.info("%s, splitting window", e)
+                        for half in halve_window(window):
+                            pending[submit(half)] = half
+                        continue
+                    manifest.record(window, path, size, sha256)
+                    completed[window] = path
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    parts = [completed[w] for w in sorted(completed) if completed[w] is not None]
+    merge_export_zips(parts, filename)
+    if not keep_parts:
+        shutil.rmtree(part_dir, ignore_errors=True)
+    logger.info("Success. Exported %s windows to %s", len(parts), filename)
+    return filename
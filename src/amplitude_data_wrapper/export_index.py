@@ -0,0 +1,166 @@
+# %%
+import json
+import logging
+import mmap
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from .export_stream import iter_export_lines
+
+logger = logging.getLogger(__name__)
+
+# %%
+EVENTS_FILE = "events.ndjson"
+INDEX_FILE = "index.sqlite"
+DEFAULT_KEYS = ("user_id", "amplitude_id", "device_id", "event_type")
+
+
+# %%
+def build_export_index(
+    source: str | Path | Iterable[bytes],
+    out_dir: str | Path,
+    keys: Iterable[str] = DEFAULT_KEYS,
+    batch_size: int = 50000,
+) -> "ExportIndex":
+    """
+    Decompress exported events to one NDJSON file and index the byte offset of every event by key
+
+    Parameters
+    ----------
+    source: str | Path | Iterable[bytes], required
+        path to an export zip written by export_project_data, or raw json lines, for example
+        from iter_export_events(raw=True) so the index is built while the export downloads
+    out_dir: str | Path, required
+        directory for events.ndjson and index.sqlite. An existing index there is replaced
+    keys: Iterable[str], optional
+        top level fields to index. Default is user_id, amplitude_id, device_id and event_type
+    batch_size: int, optional
+        offsets written to the index per transaction. Default is 50000
+
+    Returns
+    -------
+    ExportIndex for lookups
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as f:
+            chunks = iter(lambda: f.read(1048576), b"")
+            lines = (line for _, line in iter_export_lines(chunks))
+            return build_export_index(lines, out_dir, keys, batch_size)
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    keys = list(keys)
+    events_tmp = out_dir / f"{EVENTS_FILE}.tmp"
+    index_tmp = out_dir / f"{INDEX_FILE}.tmp"
+    index_tmp.unlink(missing_ok=True)
+    db = sqlite3.connect(index_tmp)
+    db.execute(
+        "CREATE TABLE offsets (key_type TEXT, key TEXT, offset INTEGER, length INTEGER)"
+    )
+    rows: list[tuple[str, str, int, int]] = []
+    offset = 0
+    count = 0
+    with open(events_tmp, "wb") as fout:
+        for line in source:
+            event = json.loads(line)
+            for key in keys:
+                value = event.get(key)
+                if value is not None and value != "":
+                    rows.append((key, str(value), offset, len(line)))
+            fout.write(line)
+            fout.write(b"\n")
+            offset += len(line) + 1
+            count += 1
+            if len(rows) >= batch_size:
+                db.executemany("INSERT INTO offsets VALUES (?, ?, ?, ?)", rows)
+                rows.clear()
+    db.executemany("INSERT INTO offsets VALUES (?, ?, ?, ?)", rows)
+    db.execute("CREATE INDEX offsets_key ON offsets (key_type, key, offset)")
+    db.commit()
+    db.close()
+    os.replace(events_tmp, out_dir / EVENTS_FILE)
+    os.replace(index_tmp, out_dir / INDEX_FILE)
+    logger.info("Indexed %s events in %s", count, out_dir)
+    return ExportIndex(out_dir)
+
+
+class ExportIndex:
+    """
+    Random access to events in an index built by build_export_index
+
+    Lookups read only the byte ranges of matching events from a memory-mapped events file.
+
+    Parameters
+    ----------
+    path: str | Path, required
+        directory with events.ndjson and index.sqlite
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._db = sqlite3.connect(f"file:{self.path / INDEX_FILE}?mode=ro", uri=True)
+        self._file = open(self.path / EVENTS_FILE, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        )
+
+    def __enter__(self) -> "ExportIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the index and the memory map"""
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+        self._db.close()
+
+    def keys(self, key_type: str) -> list[str]:
+        """All distinct values indexed for a key, for example every event_type"""
+        rows = self._db.execute(
+            "SELECT DISTINCT key FROM offsets WHERE key_type = ? ORDER BY key",
+            (key_type,),
+        )
+        return [row[0] for row in rows]
+
+    def count(self, key_type: str, key: Any) -> int:
+        """Number of events with the given value for a key"""
+        (n,) = self._db.execute(
+            "SELECT COUNT(*) FROM offsets WHERE key_type = ? AND key = ?",
+            (key_type, str(key)),
+        ).fetchone()
+        return n
+
+    def lookup(
+        self, key_type: str, key: Any, raw: bool = False
+    ) -> Iterator[dict[str, Any] | bytes]:
+        """
+        Read every event with the given value for a key, in export order
+
+        Parameters
+        ----------
+        key_type: str, required
+            indexed field, for example "user_id", "amplitude_id" or "event_type"
+        key: Any, required
+            value to look up
+        raw: bool, optional
+            yield raw json bytes instead of parsed dictionaries. Default is False
+
+        Returns
+        -------
+        Iterator over events
+        """
+        if self._map is None:
+            return
+        rows = self._db.execute(
+            "SELECT offset, length FROM offsets WHERE key_type = ? AND key = ? ORDER BY offset",
+            (key_type, str(key)),
+        )
+        for offset, length in rows:
+            line = self._map[offset : offset + length]
+            yield line if raw else json.loads(line)
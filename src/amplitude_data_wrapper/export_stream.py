@@ -0,0 +1,463 @@
+# %%
+import collections
+import gzip
+import json
+import logging
+import os
+import re
+import struct
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator
+
+from .analytics_api import shared_client
+
+logger = logging.getLogger(__name__)
+
+# %%
+LOCAL_FILE_HEADER = 0x04034B50
+CENTRAL_DIRECTORY_HEADER = 0x02014B50
+END_OF_CENTRAL_DIRECTORY = 0x06054B50
+DATA_DESCRIPTOR = 0x08074B50
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_ZIP64_EXTRA_ID = 0x0001
+_STORED = 0
+_DEFLATED = 8
+
+_MEMBER_HOUR = re.compile(r"(\d{4}-\d{2}-\d{2})_(\d{1,2})#(\d+)")
+
+
+# %%
+class _ChunkReader:
+    """
+    Pull-based reader over an iterable of byte chunks, with push back support
+
+    Parameters
+    ----------
+    chunks: Iterable[bytes], required
+        byte chunks as they arrive, for example from requests.Response.iter_content
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def _fill(self, size: int) -> None:
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return
+            self._buffer += chunk
+
+    def read(self, size: int) -> bytes:
+        """Read up to size bytes. Returns fewer bytes only at the end of the stream."""
+        self._fill(size)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def read_exact(self, size: int) -> bytes:
+        """Read exactly size bytes, or raise EOFError"""
+        data = self.read(size)
+        if len(data) != size:
+            raise EOFError(f"Unexpected end of stream, wanted {size} bytes")
+        return data
+
+    def read_chunk(self) -> bytes:
+        """Read whatever is buffered, or the next chunk from the stream"""
+        if self._buffer:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            return data
+        return next(self._chunks, b"")
+
+    def peek(self, size: int) -> bytes:
+        """Return up to size bytes without consuming them"""
+        self._fill(size)
+        return bytes(self._buffer[:size])
+
+    def unread(self, data: bytes) -> None:
+        """Push data back to the front of the stream"""
+        self._buffer[:0] = data
+
+
+# %%
+def _zip64_sizes(extra: bytes) -> tuple[int, int] | None:
+    """Return (uncompressed, compressed) sizes from a zip64 extra field, if present"""
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<HH", extra, pos)
+        if header_id == _ZIP64_EXTRA_ID and size >= 16:
+            return struct.unpack_from("<QQ", extra, pos + 4)
+        pos += 4 + size
+    return None
+
+
+def _iter_sized_member(
+    reader: _ChunkReader, compressed_size: int, method: int
+) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if method == _DEFLATED else None
+    remaining = compressed_size
+    while remaining > 0:
+        chunk = reader.read_chunk()
+        if not chunk:
+            raise EOFError("Unexpected end of stream inside zip member")
+        if len(chunk) > remaining:
+            reader.unread(chunk[remaining:])
+            chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        data = decompressor.decompress(chunk) if decompressor else chunk
+        if data:
+            yield data
+    if decompressor:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def _iter_deflated_member(reader: _ChunkReader) -> Iterator[bytes]:
+    """Inflate a member of unknown size, stopping at the end of the deflate stream"""
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    while not decompressor.eof:
+        chunk = reader.read_chunk()
+        if not chunk:
+            raise EOFError("Unexpected end of stream inside zip member")
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if decompressor.unused_data:
+        reader.unread(decompressor.unused_data)
+
+
+def _skip_data_descriptor(reader: _ChunkReader) -> None:
+    """Skip the data descriptor following a member, which may be signed and/or zip64"""
+    signed = struct.unpack("<I", reader.peek(4))[0] == DATA_DESCRIPTOR
+    offset = 4 if signed else 0
+    for size_fields in (8, 16):
+        length = offset + 4 + size_fields
+        following = reader.peek(length + 4)[length:]
+        if len(following) < 4 or following[:2] == b"PK":
+            reader.read_exact(length)
+            return
+    raise ValueError("Could not locate the end of a zip data descriptor")
+
+
+def iter_zip_members(chunks: Iterable[bytes]) -> Iterator[tuple[str, Iterator[bytes]]]:
+    """
+    Read a zip archive sequentially from a stream of bytes, without seeking
+
+    Each member is yielded as a tuple of its name and an iterator over its decompressed bytes.
+    The member iterator must be consumed before moving on to the next member. Any part left
+    unread is skipped.
+
+    Parameters
+    ----------
+    chunks: Iterable[bytes], required
+        the zip archive as byte chunks
+
+    Returns
+    -------
+    Iterator over (member name, iterator of decompressed byte chunks)
+    """
+    reader = _ChunkReader(chunks)
+    while True:
+        signature = reader.read(4)
+        if len(signature) < 4:
+            return
+        (signature_value,) = struct.unpack("<I", signature)
+        if signature_value in (CENTRAL_DIRECTORY_HEADER, END_OF_CENTRAL_DIRECTORY):
+            return
+        if signature_value != LOCAL_FILE_HEADER:
+            raise ValueError(f"Not a zip stream, unexpected signature {signature!r}")
+
+        header = _LOCAL_HEADER.unpack(signature + reader.read_exact(26))
+        flags, method = header[2], header[3]
+        compressed_size, name_length, extra_length = header[7], header[9], header[10]
+        name = reader.read_exact(name_length).decode("utf-8", errors="replace")
+        extra = reader.read_exact(extra_length)
+        if method not in (_STORED, _DEFLATED):
+            raise ValueError(f"Unsupported compression method {method} for {name}")
+
+        has_descriptor = bool(flags & 0x08)
+        if compressed_size == 0xFFFFFFFF:
+            sizes = _zip64_sizes(extra)
+            if sizes is None:
+                raise ValueError(f"Missing zip64 size information for {name}")
+            compressed_size = sizes[1]
+
+        if has_descriptor and method == _DEFLATED:
+            member = _iter_deflated_member(reader)
+        elif has_descriptor:
+            raise ValueError(f"Cannot stream stored member {name} of unknown size")
+        else:
+            member = _iter_sized_member(reader, compressed_size, method)
+
+        yield name, member
+        for _ in member:
+            pass
+        if has_descriptor:
+            _skip_data_descriptor(reader)
+
+
+# %%
+def iter_gzip_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Decompress gzip data and split it into lines as the bytes arrive
+
+    Concatenated gzip members are supported. Empty lines are skipped.
+
+    Parameters
+    ----------
+    chunks: Iterable[bytes], required
+        gzip compressed bytes
+
+    Returns
+    -------
+    Iterator over lines as bytes, without line endings
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    pending = b""
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            chunk = b""
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if not data:
+                continue
+            lines = (pending + data).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                line = line.rstrip(b"\r")
+                if line:
+                    yield line
+    pending = (pending + decompressor.flush()).strip()
+    if pending:
+        yield pending
+
+
+def iter_export_lines(chunks: Iterable[bytes]) -> Iterator[tuple[str, bytes]]:
+    """
+    Decode an export zip of gzipped NDJSON files as a stream of raw lines
+
+    Parameters
+    ----------
+    chunks: Iterable[bytes], required
+        the zip archive returned by the export API, as byte chunks
+
+    Returns
+    -------
+    Iterator over (member name, raw json line) tuples, in archive order
+    """
+    for name, member in iter_zip_members(chunks):
+        if name.endswith("/"):
+            continue
+        lines = iter_gzip_lines(member) if name.endswith(".gz") else _iter_lines(member)
+        for line in lines:
+            yield name, line
+
+
+def _iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    pending = b""
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            line = line.rstrip(b"\r")
+            if line:
+                yield line
+    if pending.strip():
+        yield pending.strip()
+
+
+def _iter_file_chunks(filename: str, chunk_size: int) -> Iterator[bytes]:
+    with open(filename, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+# %%
+def iter_export_events(
+    start: str,
+    end: str,
+    api_key: str,
+    secret: str,
+    proxy: dict | None = None,
+    region: str = "eu",
+    raw: bool = False,
+    chunk_size: int = 65536,
+) -> Iterator[dict[str, Any] | bytes]:
+    """
+    Stream events from the export API without writing anything to disk
+
+    The zip of hourly gzip files is decoded while it downloads, so memory use is bounded by
+    chunk_size and the length of a single event, and processing overlaps with the download.
+
+    See https://developers.amplitude.com/docs/export-api
+
+    Parameters
+    ---------
+    start: str, required
+        The date for the start of the requested timeperiod. Must be formated as YYYYMMDDTHH, for example 20210101T00 = january 1 2021 at 00:00
+    end: str, required
+        The dat for the end of the requested timeperiode. Must be formated as YYYYMMDDTHH, for example 20210101T23 = january 1 2021 at 23:00
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    proxy: dict | None = None, optional
+        Set proxy with custom domain and path. Example: {"http": "http://myproxy.example.org/path"}
+
+        Default is no proxy.
+    raw: bool, optional
+        Yield each event as raw json bytes instead of a parsed dictionary. Default is False
+    chunk_size: int, optional
+        Number of bytes to read from the network at a time. Default is 65536
+
+    Returns
+    ----------
+    Iterator over events, as dictionaries or raw json lines
+    """
+    client = shared_client(api_key, secret, region, proxy)
+    with client.request(
+        "GET", "/api/2/export", params={"start": start, "end": end}, stream=True
+    ) as response:
+        if response.status_code == 404:
+            logger.info("No data collected between %s and %s", start, end)
+            return
+        response.raise_for_status()
+        logger.info("Streaming export from %s to %s", start, end)
+        for _, line in iter_export_lines(response.iter_content(chunk_size=chunk_size)):
+            yield line if raw else json.loads(line)
+
+
+def export_member_sort_key(name: str) -> tuple:
+    """
+    Sort key that orders export members by hour, so that hour 2 comes before hour 10
+
+    Member names look like 123456/123456_2022-06-01_2#0.json.gz. Names that do not match sort
+    last, by name.
+    """
+    match = _MEMBER_HOUR.search(name)
+    if match is None:
+        return (1, "", 0, 0, name)
+    return (0, match.group(1), int(match.group(2)), int(match.group(3)), name)
+
+
+def _read_member(
+    filename: str, name: str, raw: bool, transform: Callable | None
+) -> Any:
+    """Decompress and parse one hourly member, runs in a worker process"""
+    with zipfile.ZipFile(filename) as z:
+        data = z.read(name)
+    if name.endswith(".gz"):
+        data = gzip.decompress(data)
+    lines = [line for line in data.split(b"\n") if line.strip()]
+    events = lines if raw else [json.loads(line) for line in lines]
+    return transform(events) if transform is not None else events
+
+
+def iter_export_file_members(
+    filename: str,
+    workers: int | None = None,
+    ordered: bool = True,
+    raw: bool = False,
+    transform: Callable[[list], Any] | None = None,
+) -> Iterator[tuple[str, Any]]:
+    """
+    Decompress and parse the hourly files of an export zip on a pool of processes
+
+    Every hourly file is independent, so they are spread across worker processes. At most two
+    files per worker are in progress at once, which bounds memory use.
+
+    Parameters
+    ----------
+    filename: str, required
+        path to a zip file written by export_project_data
+    workers: int | None, optional
+        number of worker processes. Default is None for one per CPU
+    ordered: bool, optional
+        yield files in hour order. Set to False to yield each file as soon as it is parsed, which
+        keeps all workers busy. Default is True
+    raw: bool, optional
+        return each event as raw json bytes instead of a parsed dictionary. Default is False
+    transform: Callable[[list], Any] | None, optional
+        function applied in the worker to the list of events of each file, for example to filter
+        or aggregate them before they are sent back. Must be a module level function so it can be
+        pickled. Default is None
+
+    Returns
+    -------
+    Iterator over (member name, list of events or result of transform)
+    """
+    with zipfile.ZipFile(filename) as z:
+        names = [info.filename for info in z.infolist() if not info.is_dir()]
+    names.sort(key=export_member_sort_key)
+    workers = workers or os.cpu_count() or 1
+    todo = iter(names)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        def submit(name: str):
+            return pool.submit(_read_member, filename, name, raw, transform)
+
+        if ordered:
+            queue = collections.deque()
+            for name in todo:
+                queue.append((name, submit(name)))
+                if len(queue) >= 2 * workers:
+                    done_name, future = queue.popleft()
+                    yield done_name, future.result()
+            while queue:
+                done_name, future = queue.popleft()
+                yield done_name, future.result()
+        else:
+            pending = {}
+            for name in todo:
+                pending[submit(name)] = name
+                if len(pending) >= 2 * workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+            for future in list(pending):
+                yield pending.pop(future), future.result()
+
+
+def iter_export_file_events(
+    filename: str,
+    raw: bool = False,
+    chunk_size: int = 1048576,
+    workers: int | None = 1,
+    ordered: bool = True,
+) -> Iterator[dict[str, Any] | bytes]:
+    """
+    Read events from an export zip on disk without unpacking it
+
+    Parameters
+    ----------
+    filename: str, required
+        path to a zip file written by export_project_data
+    raw: bool, optional
+        Yield each event as raw json bytes instead of a parsed dictionary. Default is False
+    chunk_size: int, optional
+        Number of bytes to read from the file at a time. Default is 1048576
+    workers: int | None, optional
+        Number of processes used to decompress and parse the hourly files, see
+        iter_export_file_members. None uses one per CPU. Default is 1 to read in this process
+    ordered: bool, optional
+        With more than one worker, yield events in hour order. Default is True
+
+    Returns
+    -------
+    Iterator over events, as dictionaries or raw json lines
+    """
+    if workers != 1:
+        for _, events in iter_export_file_members(filename, workers, ordered, raw):
+            yield from events
+        return
+    for _, line in iter_export_lines(_iter_file_chunks(filename, chunk_size)):
+        yield line if raw else json.loads(line)
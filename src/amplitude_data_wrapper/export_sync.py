@@ -0,0 +1,336 @@
+"""
+Incremental export: every run exports only the hours after the last exported hour of a project
+
+    projects = {"123": {"key": api_key, "secret": api_secret, "region": "eu"}}
+    sync_exports(projects, "data/export", start="20240101T00")   # from cron, or
+    sync_exports_forever(projects, "data/export", start="20240101T00")
+
+Export hours are in UTC.
+"""
+
+# %%
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from .export_engine import (
+    export_range,
+    format_export_hour,
+    parse_export_hour,
+    window_hours,
+)
+
+logger = logging.getLogger(__name__)
+
+# %%
+# Amplitude makes an hour available for export up to two hours after it ends
+EXPORT_LAG = timedelta(hours=2)
+STATE_NAME = "export_state.json"
+ONE_HOUR = timedelta(hours=1)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def last_final_hour(now: datetime | None = None, lag: timedelta = EXPORT_LAG) -> str:
+    """
+    The most recent hour that has ended at least lag ago, formated as YYYYMMDDTHH
+
+    Parameters
+    ----------
+    now: datetime | None, optional
+        the current time in UTC, without tzinfo. Default is None for the clock
+    lag: timedelta, optional
+        how long after an hour ends it is complete in the export API. Default is 2 hours
+    """
+    now = now or _utcnow()
+    return format_export_hour(_floor_hour(now - lag) - ONE_HOUR)
+
+
+# %%
+class ExportSyncState:
+    """
+    High-water mark per project: the last hour that has been exported
+
+    The state is a json file, rewritten atomically whenever a mark moves.
+
+    Parameters
+    ----------
+    path: Path, required
+        path to the state json file
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.projects: dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.projects = json.load(f).get("projects", {})
+
+    def last_hour(self, project: str) -> str | None:
+        """The last exported hour of a project, or None if it was never exported"""
+        return self.projects.get(project, {}).get("last_hour")
+
+    def advance(self, project: str, last_hour: str, filename: str) -> None:
+        """Move the mark of a project to last_hour, exported to filename, and save the state"""
+        self.projects[project] = {
+            "last_hour": last_hour,
+            "file": filename,
+            "updated": _utcnow().isoformat(timespec="seconds"),
+        }
+        self.save()
+
+    def save(self) -> None:
+        """Write the state to a temporary file and move it into place"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"projects": self.projects}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# %%
+def _requests_proxy(proxy: str | dict | None) -> dict | None:
+    """A proxy URL as the proxies dictionary of requests, which export_range takes"""
+    if isinstance(proxy, str):
+        return {"http": proxy, "https": proxy}
+    return proxy
+
+
+def _interrupted_end(out_dir: Path, start: str, last_final: str) -> str | None:
+    """End of an earlier export from start that was interrupted, so its windows are reused"""
+    for part_dir in sorted(out_dir.glob(f"{start}-*.zip.parts"), reverse=True):
+        end = part_dir.name[len(start) + 1 : -len(".zip.parts")]
+        if start <= end <= last_final:
+            return end
+    return None
+
+
+def sync_project_export(
+    project: str,
+    api_key: str,
+    secret: str,
+    out_dir: str | Path,
+    state: ExportSyncState,
+    start: str | None = None,
+    proxy: str | dict | None = None,
+    region: str = "eu",
+    lag: timedelta = EXPORT_LAG,
+    max_hours: int = 168,
+    now: datetime | None = None,
+    window_size: int = 24,
+    workers: int = 4,
+    retries: int = 5,
+    timeout: int = 600,
+) -> list[str]:
+    """
+    Export the hours of one project that are new since its high-water mark and already final
+
+    The hours after the mark, up to the last hour that ended at least lag ago, are exported with
+    export_range in files of at most max_hours hours, saved as out_dir/<start>-<end>.zip. The
+    mark moves after every file, so every hour is downloaded once. A file that was interrupted is
+    finished first, reusing the windows export_range already downloaded for it.
+
+    Parameters
+    ----------
+    project: str, required
+        name of the project in the state
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    out_dir: str | Path, required
+        directory for the export files of the project
+    state: ExportSyncState, required
+        high-water marks
+    start: str | None, optional
+        first hour to export, formated as YYYYMMDDTHH, when the project has no mark yet. Default is
+        None to start with the last final hour
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    proxy: str | dict | None, optional
+        URL of a proxy for the requests, as in run_jobs, or a proxies dictionary for requests.
+        Example: "http://myproxy.example.org/path". Default is no proxy
+    lag: timedelta, optional
+        how long after an hour ends it is exported. Default is 2 hours
+    max_hours: int, optional
+        most hours in one export file. Default is 168, one week
+    now: datetime | None, optional
+        the current time in UTC, without tzinfo. Default is None for the clock
+    window_size, workers, retries, timeout: optional
+        passed on to export_range
+
+    Returns
+    -------
+    list of the files written, oldest first
+    """
+    if max_hours < 1:
+        raise ValueError("max_hours must be at least 1")
+    last_final = last_final_hour(now, lag)
+    last_done = state.last_hour(project)
+    if last_done is not None:
+        first = format_export_hour(parse_export_hour(last_done) + ONE_HOUR)
+    else:
+        first = start or last_final
+    if first > last_final:
+        logger.info(f"Export {project}: up to date until {last_done}")
+        return []
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    logger.info(
+        f"Export {project}: {window_hours((first, last_final))} hours from {first} to {last_final}"
+    )
+    files = []
+    cursor = parse_export_hour(first)
+    while format_export_hour(cursor) <= last_final:
+        chunk_start = format_export_hour(cursor)
+        chunk_end = parse_export_hour(
+            _interrupted_end(out_dir, chunk_start, last_final)
+            or min(format_export_hour(cursor + (max_hours - 1) * ONE_HOUR), last_final)
+        )
+        chunk = (chunk_start, format_export_hour(chunk_end))
+        filename = str(out_dir / f"{chunk[0]}-{chunk[1]}.zip")
+        export_range(
+            chunk[0],
+            chunk[1],
+            api_key,
+            secret,
+            filename,
+            proxy=_requests_proxy(proxy),
+            region=region,
+            window_size=window_size,
+            workers=workers,
+            retries=retries,
+            timeout=timeout,
+        )
+        state.advance(project, chunk[1], filename)
+        files.append(filename)
+        cursor = chunk_end + ONE_HOUR
+    return files
+
+
+def sync_exports(
+    projects: dict[str, dict],
+    out_dir: str | Path,
+    state_path: str | Path | None = None,
+    start: str | None = None,
+    lag: timedelta = EXPORT_LAG,
+    max_hours: int = 168,
+    now: datetime | None = None,
+    **kwargs,
+) -> dict[str, list[str] | BaseException]:
+    """
+    Run one incremental export for every project
+
+    Each project is exported to out_dir/<project>, see sync_project_export. A project that
+    fails keeps its mark and is tried again on the next run, and does not stop the others.
+
+    Parameters
+    ----------
+    projects: dict[str, dict], required
+        project name mapped to a dictionary with "key", "secret" and optionally "region", "proxy"
+        and "start", the first hour to export. The proxy is a URL, the same projects work with
+        run_jobs. Example: {"123": {"key": api_key, "secret": api_secret}}
+    out_dir: str | Path, required
+        directory for the export files
+    state_path: str | Path | None, optional
+        path to the state file with the high-water marks. Default is out_dir/export_state.json
+    start: str | None, optional
+        first hour to export for projects without a mark or a "start". Default is None to start
+        with the last final hour
+    lag: timedelta, optional
+        how long after an hour ends it is exported. Default is 2 hours
+    max_hours: int, optional
+        most hours in one export file. Default is 168, one week
+    now: datetime | None, optional
+        the current time in UTC, without tzinfo. Default is None for the clock
+
+    Other keyword arguments are passed on to export_range, for example window_size and workers.
+
+    Returns
+    -------
+    dictionary of project to the files written, or the exception that stopped it
+    """
+    out_dir = Path(out_dir)
+    state = ExportSyncState(state_path or out_dir / STATE_NAME)
+    results: dict[str, list[str] | BaseException] = {}
+    for project, cfg in projects.items():
+        try:
+            results[project] = sync_project_export(
+                project,
+                cfg["key"],
+                cfg["secret"],
+                out_dir / project,
+                state,
+                start=cfg.get("start", start),
+                proxy=cfg.get("proxy"),
+                region=cfg.get("region", "eu"),
+                lag=lag,
+                max_hours=max_hours,
+                now=now,
+                **kwargs,
+            )
+        except Exception as e:
+            logger.exception(f"Export {project} failed, retrying on the next run")
+            results[project] = e
+    return results
+
+
+def seconds_until_next_hour(
+    now: datetime | None = None, lag: timedelta = EXPORT_LAG
+) -> float:
+    """Seconds until one more hour is final, see last_final_hour"""
+    now = now or _utcnow()
+    next_final = _floor_hour(now - lag) + ONE_HOUR + lag
+    return (next_final - now).total_seconds()
+
+
+def sync_exports_forever(
+    projects: dict[str, dict],
+    out_dir: str | Path,
+    state_path: str | Path | None = None,
+    start: str | None = None,
+    lag: timedelta = EXPORT_LAG,
+    delay: float = 60,
+    stop: threading.Event | None = None,
+    **kwargs,
+) -> None:
+    """
+    Keep the exports of every project up to date, running sync_exports each time an hour becomes final
+
+    Runs until stop is set, or forever. A failed project is retried on the next hour.
+
+    Parameters
+    ----------
+    projects: dict[str, dict], required
+        project name mapped to credentials, see sync_exports
+    out_dir: str | Path, required
+        directory for the export files
+    state_path: str | Path | None, optional
+        path to the state file. Default is out_dir/export_state.json
+    start: str | None, optional
+        first hour to export for projects without a mark, see sync_exports
+    lag: timedelta, optional
+        how long after an hour ends it is exported. Default is 2 hours
+    delay: float, optional
+        extra seconds to wait after an hour becomes final, to allow for clock skew. Default is 60
+    stop: threading.Event | None, optional
+        set it to end the loop. Default is None to run forever
+
+    Other keyword arguments are passed on to sync_exports.
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        sync_exports(projects, out_dir, state_path, start, lag, **kwargs)
+        wait = seconds_until_next_hour(lag=lag) + delay
+        logger.info(f"Next export sync in {wait / 60:.0f} minutes")
+        stop.wait(wait)
@@ -0,0 +1,184 @@
+"""
+Hooks that receive a structured record for every HTTP call made by the sync and async APIs
+
+    from amplitude_data_wrapper.instrumentation import add_hook
+
+    def to_statsd(record):
+        statsd.timing(f"amplitude.{record.endpoint}", record.seconds * 1000)
+
+    add_hook(to_statsd)
+
+Nothing is measured while no hook is registered.
+"""
+
+# %%
+import logging
+import re
+import sys
+from dataclasses import dataclass
+from typing import Callable
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# %%
+_ENDPOINTS = [
+    (re.compile(r"^/api/3/chart/[^/]+/query$"), "/api/3/chart/{chart_id}/query"),
+    (
+        re.compile(r"^/api/5/cohorts/request/[^/]+/file$"),
+        "/api/5/cohorts/request/{request_id}/file",
+    ),
+    (
+        re.compile(r"^/api/5/cohorts/request-status/[^/]+$"),
+        "/api/5/cohorts/request-status/{request_id}",
+    ),
+    (
+        re.compile(r"^/api/5/cohorts/request/[^/]+$"),
+        "/api/5/cohorts/request/{cohort_id}",
+    ),
+    (
+        re.compile(r"^/api/2/taxonomy/event/[^/]+$"),
+        "/api/2/taxonomy/event/{event_type}",
+    ),
+]
+
+# region tables of the sync and async clients, read only once the module is imported
+_DOMAIN_TABLES = (("analytics_api", "API_DOMAINS"), ("async_api", "BASE_DOMAINS"))
+
+
+@dataclass
+class RequestRecord:
+    """
+    One HTTP call, after any retries
+
+    Attributes
+    ----------
+    method: str
+        HTTP method
+    endpoint: str
+        URL path with IDs replaced by placeholders, for example "/api/3/chart/{chart_id}/query"
+    url: str
+        full URL without query string
+    region: str | None
+        region the URL belongs to, None for an unknown base URL
+    status: int | None
+        status of the last response, None if no response was received
+    seconds: float
+        time from the first attempt until the headers of the last response arrived, including
+        retries and waits
+    bytes_sent: int
+        size of the request body
+    bytes_received: int | None
+        size of the response body, None when it is not known, for example for a streamed sync
+        response without a Content-Length header
+    retries: int
+        attempts after the first one
+    throttled: int
+        attempts answered with 429
+    wait_seconds: float
+        time spent waiting for the rate limiter and before retries
+    error: str | None
+        the exception if the call failed without a response
+    client: str
+        "sync" or "async"
+    """
+
+    method: str
+    endpoint: str
+    url: str
+    region: str | None
+    status: int | None
+    seconds: float
+    bytes_sent: int = 0
+    bytes_received: int | None = None
+    retries: int = 0
+    throttled: int = 0
+    wait_seconds: float = 0.0
+    error: str | None = None
+    client: str = "sync"
+
+
+Hook = Callable[[RequestRecord], None]
+
+_hooks: tuple[Hook, ...] = ()
+
+
+# %%
+def add_hook(hook: Hook) -> Hook:
+    """
+    Call hook with a RequestRecord after every HTTP call
+
+    Hooks run in the thread or event loop that made the call, so they should be quick. An
+    exception in a hook is logged and does not affect the call. Returns the hook, so this can be
+    used as a decorator.
+    """
+    global _hooks
+    _hooks = (*_hooks, hook)
+    return hook
+
+
+def remove_hook(hook: Hook) -> None:
+    """Stop calling a hook added with add_hook"""
+    global _hooks
+    _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+def clear_hooks() -> None:
+    """Remove every hook"""
+    global _hooks
+    _hooks = ()
+
+
+def enabled() -> bool:
+    """True if any hook is registered"""
+    return bool(_hooks)
+
+
+def emit(record: RequestRecord) -> None:
+    """Pass a record to every hook"""
+    for hook in _hooks:
+        try:
+            hook(record)
+        except Exception:
+            logger.exception("Instrumentation hook %r failed", hook)
+
+
+# %%
+def endpoint_name(path: str) -> str:
+    """URL path with chart, cohort, request and event type IDs replaced by placeholders"""
+    for pattern, name in _ENDPOINTS:
+        if pattern.match(path):
+            return name
+    return path
+
+
+def region_for_url(url: str) -> str | None:
+    """The region whose base URL the url starts with, looked up in the client modules already imported"""
+    for module_name, attribute in _DOMAIN_TABLES:
+        module = sys.modules.get(f"{__package__}.{module_name}")
+        for region, base_url in getattr(module, attribute, {}).items():
+            if url.startswith(base_url):
+                return region
+    return None
+
+
+def build_record(
+    method: str,
+    url: str,
+    status: int | None,
+    seconds: float,
+    region: str | None = None,
+    **kwargs,
+) -> RequestRecord:
+    """Build a record, with the endpoint name and, unless given, the region taken from the url"""
+    parts = urlsplit(url)
+    base = f"{parts.scheme}://{parts.netloc}{parts.path}"
+    return RequestRecord(
+        method=method.upper(),
+        endpoint=endpoint_name(parts.path),
+        url=base,
+        region=region if region is not None else region_for_url(base),
+        status=status,
+        seconds=seconds,
+        **kwargs,
+    )
@@ -0,0 +1,582 @@
+"""
+Local stand-in for the Amplitude endpoints used by this package
+
+Start it in a background thread and point the clients at it:
+
+    with MockAmplitudeServer(latency=0.05) as server:
+        register_region("local", server.base_url)
+        amp.get_chart(api_key, secret, "abc123", region="local")
+
+Or run it from the command line:
+
+    python -m amplitude_data_wrapper.mock_server --port 8080
+"""
+
+# %%
+import argparse
+import asyncio
+import collections
+import gzip
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+
+# %%
+@dataclass
+class MockConfig:
+    """
+    Behaviour of the mock server
+
+    Parameters
+    ----------
+    latency: float | tuple[float, float], optional
+        seconds to wait before answering, or a (min, max) range. Default is 0
+    chart_bytes: int, optional
+        approximate size of a chart query response. Default is 2048
+    export_events_per_hour: int, optional
+        events in each hourly file of an export. Default is 100
+    export_max_hours: int, optional
+        longer export ranges get 400, like ranges over 4GB do. Default is 8784
+    cohort_rows: int, optional
+        users in a cohort file. Default is 1000
+    cohort_pending_polls: int, optional
+        status polls that answer 202 before a cohort is ready. Default is 2
+    event_types: int, optional
+        event types in the taxonomy. Default is 50
+    error_rate: float, optional
+        share of requests that get a random 500, 502, 503 or 504. Default is 0
+    rate_limit: float | None, optional
+        requests per second before answering 429 with Retry-After. Default is None for no limit
+    seed: int, optional
+        seed for the synthetic data. Default is 0
+    """
+
+    latency: float | tuple[float, float] = 0.0
+    chart_bytes: int = 2048
+    export_events_per_hour: int = 100
+    export_max_hours: int = 8784
+    cohort_rows: int = 1000
+    cohort_pending_polls: int = 2
+    event_types: int = 50
+    error_rate: float = 0.0
+    rate_limit: float | None = None
+    seed: int = 0
+
+
+@dataclass
+class _Injected:
+    status: int
+    retry_after: int | None = None
+    body: bytes | None = None
+
+
+@dataclass
+class MockStats:
+    """Requests received by the mock server, per endpoint and per status"""
+
+    requests: collections.Counter = field(default_factory=collections.Counter)
+    statuses: collections.Counter = field(default_factory=collections.Counter)
+
+    @property
+    def total(self) -> int:
+        return sum(self.requests.values())
+
+
+def _stable_int(*parts: object) -> int:
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+# %%
+class MockAmplitudeServer:
+    """
+    aiohttp server that imitates the Amplitude endpoints used by this package
+
+    Serves chart queries, user search, cohort request/status/file, export, deletions, taxonomy
+    and event segmentation with synthetic, deterministic data. Latency, payload sizes, random
+    errors and a rate limit are set with MockConfig, and specific responses can be queued with
+    inject.
+
+    Parameters
+    ----------
+    config: MockConfig | None, optional
+        server behaviour. Default is MockConfig()
+    host: str, optional
+        interface to listen on. Default is "127.0.0.1"
+    port: int, optional
+        port to listen on. Default is 0 for any free port
+
+    Other keyword arguments are used to build a MockConfig.
+    """
+
+    def __init__(
+        self,
+        config: MockConfig | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        **kwargs,
+    ):
+        self.config = config or MockConfig(**kwargs)
+        self.host = host
+        self.port = port
+        self.stats = MockStats()
+        self._injected: dict[str, collections.deque] = collections.defaultdict(
+            collections.deque
+        )
+        self._random = random.Random(self.config.seed)
+        self._cohort_polls: collections.Counter = collections.Counter()
+        self._deletions: list[dict] = []
+        self._deleted_event_types: set[str] = set()
+        self._event_type_changes: dict[str, dict] = {}
+        self._export_hours: dict[datetime, bytes] = {}
+        self._tokens = float(self.config.rate_limit or 0)
+        self._tokens_updated = time.monotonic()
+        self._runner: web.AppRunner | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def inject(
+        self,
+        path_prefix: str,
+        *statuses: int,
+        retry_after: int | None = None,
+        body: bytes | None = None,
+    ) -> None:
+        """
+        Queue statuses to return for the next requests to paths starting with path_prefix
+
+        Example: server.inject("/api/3/chart", 429, 503, retry_after=1) answers the next chart
+        query with 429 and Retry-After 1, the one after that with 503, and then normally.
+        With body, the responses carry that body instead of a json error, for example
+        server.inject("/api/3/chart", 200, body=b"not json") for a malformed chart.
+        """
+        for status in statuses:
+            self._injected[path_prefix].append(_Injected(status, retry_after, body))
+
+    # %%
+    def app(self) -> web.Application:
+        """The aiohttp application, for use with other aiohttp runners or test clients"""
+        app = web.Application(
+            middlewares=[self._middleware], client_max_size=64 * 1024**2
+        )
+        app.router.add_get("/api/3/chart/{chart_id}/query", self._chart)
+        app.router.add_get("/api/2/usersearch", self._usersearch)
+        app.router.add_get("/api/5/cohorts/request/{cohort_id}", self._cohort_request)
+        app.router.add_get(
+            "/api/5/cohorts/request-status/{request_id}", self._cohort_status
+        )
+        app.router.add_get(
+            "/api/5/cohorts/request/{request_id}/file", self._cohort_file
+        )
+        app.router.add_get("/api/2/export", self._export)
+        app.router.add_post("/api/2/deletions/users", self._delete_users)
+        app.router.add_get("/api/2/deletions/users", self._deletion_jobs)
+        app.router.add_get("/api/2/taxonomy/event", self._taxonomy)
+        app.router.add_delete(
+            "/api/2/taxonomy/event/{event_type}", self._delete_event_type
+        )
+        app.router.add_put(
+            "/api/2/taxonomy/event/{event_type}", self._update_event_type
+        )
+        app.router.add_get("/api/2/events/segmentation", self._segmentation)
+        return app
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        route = request.match_info.route.resource
+        endpoint = route.canonical if route is not None else request.path
+        self.stats.requests[f"{request.method} {endpoint}"] += 1
+        latency = self.config.latency
+        if isinstance(latency, tuple):
+            latency = self._random.uniform(*latency)
+        if latency:
+            await asyncio.sleep(latency)
+        response = self._injected_response(request.path) or self._rate_limited()
+        if response is None and self._random.random() < self.config.error_rate:
+            response = web.Response(status=self._random.choice((500, 502, 503, 504)))
+        if response is None:
+            response = await handler(request)
+        self.stats.statuses[response.status] += 1
+        return response
+
+    def _injected_response(self, path: str) -> web.Response | None:
+        for prefix, queue in self._injected.items():
+            if queue and path.startswith(prefix):
+                injected = queue.popleft()
+                headers = {}
+                if injected.retry_after is not None:
+                    headers["Retry-After"] = str(injected.retry_after)
+                if injected.body is not None:
+                    return web.Response(
+                        body=injected.body,
+                        status=injected.status,
+                        headers=headers,
+                        content_type="application/json",
+                    )
+                return web.json_response(
+                    {"error": f"injected {injected.status}"},
+                    status=injected.status,
+                    headers=headers,
+                )
+        return None
+
+    def _rate_limited(self) -> web.Response | None:
+        rate = self.config.rate_limit
+        if not rate:
+            return None
+        now = time.monotonic()
+        self._tokens = min(rate, self._tokens + (now - self._tokens_updated) * rate)
+        self._tokens_updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return None
+        retry_after = math.ceil((1 - self._tokens) / rate)
+        return web.json_response(
+            {"error": "Too many requests"},
+            status=429,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    # %%
+    async def _chart(self, request: web.Request) -> web.Response:
+        chart_id = request.match_info["chart_id"]
+        points = max(1, self.config.chart_bytes // 12)
+        seed = _stable_int(chart_id)
+        series = [[(seed + i * 7919) % 100000 for i in range(points)]]
+        return web.json_response(
+            {
+                "data": {
+                    "series": series,
+                    "seriesLabels": [0],
+                    "xValues": [
+                        f"2022-01-{i % 28 + 1:02d}" for i in range(min(points, 28))
+                    ],
+                },
+                "chart_id": chart_id,
+            }
+        )
+
+    async def _usersearch(self, request: web.Request) -> web.Response:
+        user = request.query.get("user", "")
+        if not user or user.startswith("unknown"):
+            return web.json_response({"matches": [], "type": "nomatch"})
+        return web.json_response(
+            {
+                "matches": [
+                    {
+                        "amplitude_id": _stable_int(user) % 10**12,
+                        "user_id": user,
+                        "platform": "Web",
+                    }
+                ],
+                "type": "match_user_or_device_id",
+            }
+        )
+
+    async def _cohort_request(self, request: web.Request) -> web.Response:
+        cohort_id = request.match_info["cohort_id"]
+        props = request.query.get("props", "0")
+        request_id = (
+            f"{cohort_id}-{props}-{_stable_int(cohort_id, time.time_ns()) % 10**8}"
+        )
+        return web.json_response({"request_id": request_id, "cohort_id": cohort_id})
+
+    async def _cohort_status(self, request: web.Request) -> web.Response:
+        request_id = request.match_info["request_id"]
+        self._cohort_polls[request_id] += 1
+        if self._cohort_polls[request_id] <= self.config.cohort_pending_polls:
+            return web.json_response(
+                {"request_id": request_id, "async_status": "JOB INPROGRESS"}, status=202
+            )
+        return web.json_response(
+            {"request_id": request_id, "async_status": "JOB COMPLETED"}
+        )
+
+    async def _cohort_file(self, request: web.Request) -> web.StreamResponse:
+        request_id = request.match_info["request_id"]
+        props = request_id.rsplit("-", 2)[1] == "1"
+        response = web.StreamResponse(headers={"Content-Type": "text/csv"})
+        await response.prepare(request)
+        header = (
+            "amplitude_id,user_id,country,platform\n" if props else "amplitude_id\n"
+        )
+        await response.write(header.encode())
+        countries = ("Norway", "Sweden", "Denmark", "Finland")
+        rows = []
+        for i in range(self.config.cohort_rows):
+            if props:
+                rows.append(f"{10**9 + i},user{i},{countries[i % 4]},Web\n")
+            else:
+                rows.append(f"{10**9 + i}\n")
+            if len(rows) >= 10000:
+                await response.write("".join(rows).encode())
+                rows = []
+        await response.write("".join(rows).encode())
+        await response.write_eof()
+        return response
+
+    def _export_hour(self, hour: datetime) -> bytes:
+        """Gzipped events for one hour, generated once and then kept"""
+        cached = self._export_hours.get(hour)
+        if cached is not None:
+            return cached
+        lines = []
+        for i in range(self.config.export_events_per_hour):
+            user = _stable_int(hour, i) % 1000
+            event = {
+                "amplitude_id": 10**9 + user,
+                "app": 123456,
+                "device_id": f"device{user}",
+                "event_id": i,
+                "event_properties": {"app": f"app{i % 5}", "team": f"team{i % 3}"},
+                "event_time": f"{hour:%Y-%m-%d %H}:{i % 60:02d}:00.000000",
+                "event_type": f"event_{i % 10}",
+                "session_id": _stable_int(user, hour.date()) % 10**13,
+                "user_id": f"user{user}",
+            }
+            lines.append(json.dumps(event, separators=(",", ":")))
+        data = gzip.compress("\n".join(lines).encode() + b"\n", 1)
+        if len(self._export_hours) >= 1024:
+            self._export_hours.clear()
+        self._export_hours[hour] = data
+        return data
+
+    def _export_zip(self, start: datetime, end: datetime) -> bytes:
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_STORED) as z:
+            hour = start
+            while hour <= end:
+                name = f"123456/123456_{hour:%Y-%m-%d}_{hour.hour}#0.json.gz"
+                z.writestr(name, self._export_hour(hour))
+                hour += timedelta(hours=1)
+        return out.getvalue()
+
+    async def _export(self, request: web.Request) -> web.Response:
+        try:
+            start = datetime.strptime(request.query["start"], "%Y%m%dT%H")
+            end = datetime.strptime(request.query["end"], "%Y%m%dT%H")
+        except (KeyError, ValueError):
+            return web.json_response({"error": "Invalid start or end"}, status=400)
+        hours = int((end - start) / timedelta(hours=1)) + 1
+        if hours < 1:
+            return web.json_response({"error": "end before start"}, status=400)
+        if hours > self.config.export_max_hours:
+            return web.json_response(
+                {"error": "Raw data files were too large"}, status=400
+            )
+        body = await asyncio.to_thread(self._export_zip, start, end)
+        return web.Response(body=body, content_type="application/zip")
+
+    async def _delete_users(self, request: web.Request) -> web.Response:
+        if request.content_type == "application/json":
+            body = await request.json()
+        else:
+            form = await request.post()
+            body = {
+                "amplitude_ids": form.getall("amplitude_ids", []),
+                "user_ids": form.getall("user_ids", []),
+                "requester": form.get("requester"),
+            }
+        ids = list(body.get("amplitude_ids") or []) + list(body.get("user_ids") or [])
+        if len(ids) > 100:
+            return web.json_response({"error": "Too many ids, max is 100"}, status=400)
+        day = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+        job = {
+            "day": day,
+            "status": "staging",
+            "amplitude_ids": [
+                {
+                    "amplitude_id": i,
+                    "requester": body.get("requester"),
+                    "requested_on_day": day,
+                }
+                for i in ids
+            ],
+            "app": 123456,
+        }
+        self._deletions.append(job)
+        return web.json_response([job])
+
+    async def _deletion_jobs(self, request: web.Request) -> web.Response:
+        start = request.query.get("start_day", "")
+        end = request.query.get("end_day", "9999")
+        jobs: dict[str, dict] = {}
+        for job in self._deletions:
+            if start <= job["day"] <= end:
+                merged = jobs.setdefault(
+                    job["day"],
+                    {
+                        "day": job["day"],
+                        "status": "done",
+                        "amplitude_ids": [],
+                        "app": 123456,
+                    },
+                )
+                merged["amplitude_ids"].extend(job["amplitude_ids"])
+        return web.json_response(list(jobs.values()))
+
+    async def _taxonomy(self, request: web.Request) -> web.Response:
+        data = []
+        for i in range(self.config.event_types):
+            event_type = {
+                "event_type": f"event_{i}",
+                "category": {"name": f"category_{i % 4}"},
+                "description": f"Synthetic event {i}",
+            }
+            changes = self._event_type_changes.get(f"event_{i}", {})
+            if "new_event_type" in changes:
+                event_type["event_type"] = changes["new_event_type"]
+            if "category" in changes:
+                event_type["category"] = {"name": changes["category"]}
+            for name in ("display_name", "description", "is_active"):
+                if name in changes:
+                    event_type[name] = changes[name]
+            if event_type["event_type"] not in self._deleted_event_types:
+                data.append(event_type)
+        return web.json_response({"success": True, "data": data})
+
+    async def _delete_event_type(self, request: web.Request) -> web.Response:
+        event_type = request.match_info["event_type"]
+        self._deleted_event_types.add(event_type)
+        return web.json_response({"success": True})
+
+    async def _update_event_type(self, request: web.Request) -> web.Response:
+        event_type = request.match_info["event_type"]
+        form = await request.post()
+        self._event_type_changes.setdefault(event_type, {}).update(form)
+        return web.json_response({"success": True})
+
+    async def _segmentation(self, request: web.Request) -> web.Response:
+        try:
+            event = json.loads(request.query["e"])
+            start = datetime.strptime(request.query["start"], "%Y%m%d")
+            end = datetime.strptime(request.query["end"], "%Y%m%d")
+        except (KeyError, ValueError):
+            return web.json_response({"error": "Invalid parameters"}, status=400)
+        metric = request.query.get("m", "uniques")
+        interval = int(request.query.get("i", 1))
+        step = timedelta(hours=1) if interval == -3600000 else timedelta(days=1)
+        x_values = []
+        cursor = start
+        while cursor <= end + timedelta(days=1) - step:
+            fmt = "%Y-%m-%dT%H:00:00" if step < timedelta(days=1) else "%Y-%m-%d"
+            x_values.append(cursor.strftime(fmt))
+            cursor += step
+        groups = event.get("group_by") or []
+        labels = [f"group_{g}" for g in range(3)] if groups else [0]
+        event_type = event.get("event_type", "")
+        series = [
+            [_stable_int(event_type, metric, label, x) % 1000 for x in x_values]
+            for label in labels
+        ]
+        collapsed = [[{"setId": "", "value": sum(values)}] for values in series]
+        return web.json_response(
+            {
+                "data": {
+                    "series": series,
+                    "seriesLabels": labels,
+                    "seriesCollapsed": collapsed,
+                    "xValues": x_values,
+                }
+            }
+        )
+
+    # %%
+    async def start_async(self) -> str:
+        """Start serving on the running event loop, returns the base URL"""
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.base_url
+
+    async def stop_async(self) -> None:
+        """Stop a server started with start_async"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start(self) -> str:
+        """Start serving from a background thread, returns the base URL"""
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run() -> None:
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start_async())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="mock-amplitude", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.base_url
+
+    def stop(self) -> None:
+        """Stop a server started with start"""
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop_async(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self) -> "MockAmplitudeServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    async def __aenter__(self) -> "MockAmplitudeServer":
+        await self.start_async()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop_async()
+
+
+# %%
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Run a local stand-in for the Amplitude APIs"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--chart-bytes", type=int, default=2048)
+    parser.add_argument("--export-events-per-hour", type=int, default=100)
+    parser.add_argument("--cohort-rows", type=int, default=1000)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    args = parser.parse_args()
+    config = MockConfig(
+        latency=args.latency,
+        chart_bytes=args.chart_bytes,
+        export_events_per_hour=args.export_events_per_hour,
+        cohort_rows=args.cohort_rows,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+    )
+    server = MockAmplitudeServer(config, host=args.host, port=args.port)
+    web.run_app(server.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
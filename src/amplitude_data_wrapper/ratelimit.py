@@ -0,0 +1,328 @@
+# %%
+import asyncio
+import contextlib
+import email.utils
+import random
+import threading
+import time
+import weakref
+from typing import AsyncIterator
+
+
+# %%
+def backoff_delay(attempt: int, base: float = 1, cap: float = 300) -> float:
+    """
+    Exponential backoff with jitter
+
+    Half of the delay is fixed and half is random, so clients that fail together do not retry
+    together.
+
+    Parameters
+    ----------
+    attempt: int, required
+        attempt number, starting at 1
+    base: float, optional
+        delay in seconds for the first attempt. Default is 1
+    cap: float, optional
+        maximum delay in seconds. Default is 300
+
+    Returns
+    -------
+    delay in seconds
+    """
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a Retry-After header, given either as seconds or as an HTTP date
+
+    Returns
+    -------
+    seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+# %%
+class _TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def take(self) -> float:
+        """Wait for a token, returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+            delay = (1 - self.tokens) / self.rate
+            waited += delay
+            await asyncio.sleep(delay)
+
+
+class AsyncRateLimiter:
+    """
+    Shared limiter for requests to amplitude made from one event loop
+
+    Caps the number of requests in flight across every task that uses the limiter, and optionally
+    limits the request rate with a token bucket per key, for example per project. When the server
+    answers 429, call block with the Retry-After delay to pause every request for that key.
+
+    Parameters
+    ----------
+    max_concurrency: int, optional
+        maximum number of requests in flight. Default is 4
+    rate: float | None, optional
+        requests per second allowed for each key. Default is None for no rate limit
+    burst: float | None, optional
+        number of requests a key may send at once before the rate applies. Default is rate, at least 1
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        rate: float | None = None,
+        burst: float | None = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate or 1.0)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._buckets: dict[str, _TokenBucket] = {}
+        self._blocked_until: dict[str, float] = {}
+
+    def block(self, key: str, seconds: float) -> None:
+        """Pause new requests for key for the given number of seconds"""
+        until = time.monotonic() + seconds
+        self._blocked_until[key] = max(self._blocked_until.get(key, 0.0), until)
+
+    async def _wait_until_unblocked(self, key: str) -> float:
+        waited = 0.0
+        while (delay := self._blocked_until.get(key, 0.0) - time.monotonic()) > 0:
+            waited += delay
+            await asyncio.sleep(delay)
+        return waited
+
+    async def acquire(self, key: str = "default") -> float:
+        """
+        Wait for the key's rate budget and then for a free slot
+
+        A key that is blocked or out of budget waits without holding a slot, so it does not hold
+        up requests for other keys.
+
+        Returns
+        -------
+        seconds spent waiting for the rate limit or a block
+        """
+        waited = await self._wait_until_unblocked(key)
+        if self.rate:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = _TokenBucket(self.rate, self.burst)
+            waited += await bucket.take()
+        await self._semaphore.acquire()
+        return waited
+
+    def release(self) -> None:
+        """Free the slot taken by acquire"""
+        self._semaphore.release()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key: str = "default") -> AsyncIterator[float]:
+        """Async context manager around acquire and release, yields the seconds spent waiting"""
+        waited = await self.acquire(key)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+
+class ProjectLimiter(AsyncRateLimiter):
+    """
+    Limiter for one project, handed out by BudgetLimiter.project
+
+    A request first waits for a slot and the rate budget of its project, then for the rate budget
+    of its region, and only then for a slot under the global cap, so requests held back by their
+    own project's budget never occupy a global slot.
+    """
+
+    def __init__(
+        self,
+        budget: "BudgetLimiter",
+        region: str,
+        max_concurrency: int,
+        rate: float | None = None,
+        burst: float | None = None,
+    ):
+        super().__init__(max_concurrency, rate, burst)
+        self.budget = budget
+        self.region = region
+
+    async def acquire(self, key: str = "default") -> float:
+        waited = await super().acquire(key)
+        try:
+            waited += await self.budget._take_region(self.region)
+            await self.budget._semaphore.acquire()
+            return waited
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    def release(self) -> None:
+        self.budget._semaphore.release()
+        self._semaphore.release()
+
+
+class BudgetLimiter:
+    """
+    Request budgets for many projects in one event loop: a global cap on requests in flight, and
+    separate concurrency and rate budgets per project and a rate budget per region
+
+    A project can never hold more than project_concurrency of the max_concurrency global slots,
+    so one heavy project cannot use up the shared quota or starve the others. Get the limiter for
+    a project with project and pass it to AsyncAmplitudeClient or request; a 429 then pauses only
+    that project.
+
+    Parameters
+    ----------
+    max_concurrency: int, optional
+        maximum number of requests in flight over all projects. Default is 16
+    project_concurrency: int, optional
+        maximum number of requests in flight for one project. Default is 4
+    project_rate: float | None, optional
+        requests per second allowed for one project. Default is None for no rate limit
+    region_rate: float | None, optional
+        requests per second allowed for all projects in one region together. Default is None for
+        no rate limit
+    burst: float | None, optional
+        number of requests a project or region may send at once before its rate applies. Default
+        is the rate, at least 1
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        project_concurrency: int = 4,
+        project_rate: float | None = None,
+        region_rate: float | None = None,
+        burst: float | None = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.project_concurrency = project_concurrency
+        self.project_rate = project_rate
+        self.region_rate = region_rate
+        self.burst = burst
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._projects: dict[tuple[str, str], ProjectLimiter] = {}
+        self._regions: dict[str, _TokenBucket] = {}
+
+    def project(self, project_id: str, region: str = "eu") -> ProjectLimiter:
+        """Return the limiter for a project, the same object on every call"""
+        limiter = self._projects.get((project_id, region))
+        if limiter is None:
+            limiter = self._projects[(project_id, region)] = ProjectLimiter(
+                self,
+                region,
+                self.project_concurrency,
+                self.project_rate,
+                self.burst,
+            )
+        return limiter
+
+    async def _take_region(self, region: str) -> float:
+        if not self.region_rate:
+            return 0.0
+        bucket = self._regions.get(region)
+        if bucket is None:
+            burst = self.burst if self.burst is not None else max(1.0, self.region_rate)
+            bucket = self._regions[region] = _TokenBucket(self.region_rate, burst)
+        return await bucket.take()
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket for blocking code, for example a pool of worker threads
+
+    Parameters
+    ----------
+    rate: float, required
+        requests per second
+    burst: float | None, optional
+        number of requests that may be sent at once before the rate applies. Default is 1
+    """
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else 1.0
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def block(self, seconds: float) -> None:
+        """Pause all requests for the given number of seconds, for example after a 429"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def acquire(self) -> float:
+        """
+        Block until a request may be sent
+
+        Returns
+        -------
+        seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                else:
+                    delay = (1 - self._tokens) / self.rate
+            waited += delay
+            time.sleep(delay)
+
+
+_default_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[int, AsyncRateLimiter]]" = weakref.WeakKeyDictionary()
+
+
+def default_limiter(max_concurrency: int = 4) -> AsyncRateLimiter:
+    """
+    Return the limiter shared by every call in the running event loop with the same max_concurrency
+
+    This is used when no limiter is passed in, so that a concurrency setting limits all tasks of
+    a gather together rather than each call on its own.
+    """
+    loop = asyncio.get_running_loop()
+    limiters = _default_limiters.setdefault(loop, {})
+    if max_concurrency not in limiters:
+        limiters[max_concurrency] = AsyncRateLimiter(max_concurrency)
+    return limiters[max_concurrency]
@@ -0,0 +1,315 @@
+"""
+Run chart, cohort and export downloads for many projects from one declarative job list
+
+    jobs = [
+        {"project": "123", "kind": "charts", "targets": ["abc123", "def456"]},
+        {"project": "456", "region": "us", "kind": "cohorts", "targets": ["ghi789"]},
+        {"project": "123", "kind": "export", "targets": [["20240101T00", "20240101T23"]]},
+    ]
+    summary = await run_jobs(jobs, PROJECT_CREDENTIALS, "data", max_concurrency=16)
+
+Every request goes through one BudgetLimiter, so the global cap and the per-project and
+per-region budgets hold across all jobs.
+"""
+
+# %%
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+import aiohttp
+
+from .async_api import AsyncAmplitudeClient, save_json
+from .ratelimit import BudgetLimiter
+
+logger = logging.getLogger(__name__)
+
+# %%
+JOB_KINDS = ("charts", "cohorts", "export")
+
+
+@dataclass
+class Job:
+    """
+    One kind of download for one project
+
+    Attributes
+    ----------
+    project: str
+        project ID, a key of the projects passed to run_jobs
+    kind: str
+        "charts", "cohorts" or "export"
+    targets: list
+        chart IDs, cohort IDs, or [start, end] pairs of export hours formatted as YYYYMMDDTHH
+    region: str | None
+        'eu' or 'us'. Default is None for the region of the project, or 'eu'
+    name: str | None
+        name used in logs and results. Default is None for "<project>/<kind>"
+    options: dict
+        keyword arguments for every download, for example {"props": 1} for cohorts
+    """
+
+    project: str
+    kind: str
+    targets: list
+    region: str | None = None
+    name: str | None = None
+    options: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.kind not in JOB_KINDS:
+            raise ValueError(
+                f"Unknown job kind {self.kind!r}, expected one of {JOB_KINDS}"
+            )
+        self.project = str(self.project)
+        if self.name is None:
+            self.name = f"{self.project}/{self.kind}"
+
+
+@dataclass
+class TargetResult:
+    """Outcome of one chart, cohort or export window"""
+
+    target: Any
+    status: str
+    seconds: float = 0.0
+    path: Path | None = None
+    error: str | None = None
+
+
+@dataclass
+class JobResult:
+    """Progress and timing of one job, updated while it runs"""
+
+    job: Job
+    results: list[TargetResult] = field(default_factory=list)
+    started: float | None = None
+    seconds: float = 0.0
+
+    @property
+    def total(self) -> int:
+        return len(self.job.targets)
+
+    @property
+    def finished(self) -> int:
+        return len(self.results)
+
+    def count(self, status: str) -> int:
+        """Number of targets with the given status: 'downloaded', 'skipped' or 'failed'"""
+        return sum(1 for r in self.results if r.status == status)
+
+    @property
+    def status(self) -> str:
+        """'pending', 'running', 'failed' if any target failed, or 'done'"""
+        if self.started is None:
+            return "pending"
+        if self.finished < self.total:
+            return "running"
+        return "failed" if self.count("failed") else "done"
+
+
+@dataclass
+class ScheduleSummary:
+    """Results and timing for a run_jobs run"""
+
+    jobs: list[JobResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def failed(self) -> list[JobResult]:
+        return [j for j in self.jobs if j.status == "failed"]
+
+
+def load_jobs(path: str | Path) -> list[Job]:
+    """
+    Read a job list from a json file holding a list of objects with the fields of Job
+
+    Parameters
+    ----------
+    path: str | Path, required
+        path to the json file
+
+    Returns
+    -------
+    list of Job
+    """
+    with open(path, encoding="utf-8") as f:
+        return [Job(**job) for job in json.load(f)]
+
+
+# %%
+def _target_path(out_dir: Path, job: Job, target: Any) -> Path:
+    project_dir = out_dir / job.project
+    if job.kind == "charts":
+        return project_dir / "charts" / f"{target}.json"
+    if job.kind == "cohorts":
+        return project_dir / "cohorts" / f"{target}.csv"
+    start, end = target
+    return project_dir / "export" / f"{start}-{end}.zip"
+
+
+async def _download_target(
+    client: AsyncAmplitudeClient, job: Job, target: Any, path: Path, compact: bool
+) -> bool:
+    if job.kind == "charts":
+        data = await client.get_chart(target, **job.options)
+        if data is None:
+            return False
+        await save_json(path, data, compact)
+    elif job.kind == "cohorts":
+        await client.get_cohort(target, path, **job.options)
+    else:
+        start, end = target
+        path.parent.mkdir(parents=True, exist_ok=True)
+        await client.export_project_data(start, end, str(path))
+    return True
+
+
+async def run_jobs(
+    jobs: Iterable[Job | dict],
+    projects: dict[str, dict],
+    out_dir: str | Path,
+    max_concurrency: int = 16,
+    project_concurrency: int = 4,
+    project_rate: float | None = None,
+    region_rate: float | None = None,
+    limiter: BudgetLimiter | None = None,
+    retries: int = 5,
+    timeout: float = 600,
+    overwrite: bool = False,
+    compact: bool = False,
+    on_progress: Callable[[JobResult], None] | None = None,
+    session: aiohttp.ClientSession | None = None,
+) -> ScheduleSummary:
+    """
+    Run download jobs for many projects and regions with shared request budgets
+
+    All jobs run at once. Each job works through its targets with at most project_concurrency
+    of them in progress, and every request waits for the budget of its project, the budget of its
+    region and a slot under the global cap. Files are saved as
+    out_dir/<project>/charts/<chart_id>.json, out_dir/<project>/cohorts/<cohort_id>.csv and
+    out_dir/<project>/export/<start>-<end>.zip. Targets that already have a file are skipped
+    unless overwrite is set, and a failing target does not stop the others.
+
+    Parameters
+    ----------
+    jobs: Iterable[Job | dict], required
+        jobs to run, as Job objects or dictionaries with the fields of Job
+    projects: dict[str, dict], required
+        project ID mapped to a dictionary with "key", "secret" and optionally "region" and "proxy".
+        Example: {"123": {"key": api_key, "secret": api_secret, "region": "us"}}
+    out_dir: str | Path, required
+        directory to save files in
+    max_concurrency: int, optional
+        maximum number of requests in flight over all jobs. Ignored when limiter is given. Default is 16
+    project_concurrency: int, optional
+        maximum number of requests in flight for one project, and of targets in progress for
+        one job. Ignored when limiter is given. Default is 4
+    project_rate: float | None, optional
+        requests per second allowed for one project. Ignored when limiter is given. Default is None
+    region_rate: float | None, optional
+        requests per second allowed for one region. Ignored when limiter is given. Default is None
+    limiter: BudgetLimiter | None, optional
+        budgets to share with other runs. Default is a new BudgetLimiter from the arguments above
+    retries: int, optional
+        how many times to try a request. Default is 5
+    timeout: float, optional
+        timeout in seconds for a request attempt, and for pauses while reading a file. Default is 600
+    overwrite: bool, optional
+        download targets again even if their file exists. Default is False
+    compact: bool, optional
+        save chart json without indentation. Default is False
+    on_progress: Callable[[JobResult], None] | None, optional
+        called with the JobResult after every target of a job. Default is None
+    session: aiohttp.ClientSession | None, optional
+        session for requests. Default is a new session for this run
+
+    Returns
+    -------
+    ScheduleSummary with the status and time spent for every job and target
+    """
+    started = time.perf_counter()
+    out_dir = Path(out_dir)
+    jobs = [job if isinstance(job, Job) else Job(**job) for job in jobs]
+    unknown = {job.project for job in jobs} - set(projects)
+    if unknown:
+        raise KeyError(f"No credentials for projects {sorted(unknown)}")
+    limiter = limiter or BudgetLimiter(
+        max_concurrency, project_concurrency, project_rate, region_rate
+    )
+    summary = ScheduleSummary([JobResult(job) for job in jobs])
+
+    async def run_job(result: JobResult, client_session: aiohttp.ClientSession):
+        job = result.job
+        cfg = projects[job.project]
+        region = job.region or cfg.get("region", "eu")
+        client = AsyncAmplitudeClient(
+            cfg["key"],
+            cfg["secret"],
+            region=region,
+            proxy=cfg.get("proxy"),
+            limiter=limiter.project(job.project, region),
+            retries=retries,
+            timeout=timeout,
+            session=client_session,
+        )
+        targets = iter(job.targets)
+        result.started = time.perf_counter()
+        logger.info(f"Job {job.name}: {result.total} targets")
+
+        async def worker() -> None:
+            for target in targets:
+                path = _target_path(out_dir, job, target)
+                target_started = time.perf_counter()
+                if path.exists() and not overwrite:
+                    outcome = TargetResult(target, "skipped", path=path)
+                else:
+                    try:
+                        ok = await _download_target(client, job, target, path, compact)
+                        outcome = TargetResult(target, "downloaded" if ok else "failed")
+                    except (
+                        aiohttp.ClientError,
+                        asyncio.TimeoutError,
+                        OSError,
+                        ValueError,
+                        KeyError,
+                    ) as e:
+                        logger.error(f"[FAILED] {job.name} {target} — {e!r}")
+                        outcome = TargetResult(target, "failed", error=repr(e))
+                    outcome.seconds = time.perf_counter() - target_started
+                    if outcome.status == "downloaded":
+                        outcome.path = path
+                result.results.append(outcome)
+                result.seconds = time.perf_counter() - result.started
+                if on_progress is not None:
+                    on_progress(result)
+
+        await asyncio.gather(
+            *(worker() for _ in range(min(limiter.project_concurrency, result.total)))
+        )
+        result.seconds = time.perf_counter() - result.started
+        logger.info(
+            f"Job {job.name}: downloaded {result.count('downloaded')}, skipped "
+            f"{result.count('skipped')}, failed {result.count('failed')} in {result.seconds:.1f}s"
+        )
+
+    async def run(client_session: aiohttp.ClientSession) -> None:
+        await asyncio.gather(
+            *(run_job(result, client_session) for result in summary.jobs)
+        )
+
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            await run(session)
+    else:
+        await run(session)
+
+    summary.seconds = time.perf_counter() - started
+    logger.info(
+        f"Ran {len(summary.jobs)} jobs in {summary.seconds:.1f}s, {len(summary.failed)} with failures"
+    )
+    return summary
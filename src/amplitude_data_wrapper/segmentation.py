@@ -0,0 +1,605 @@
+# %%
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+from ._sqlite import SQLiteStore
+from .async_api import AsyncAmplitudeClient, limiter_key
+from .ratelimit import AsyncRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# %%
+DATE_FORMAT = "%Y%m%d"
+HOURLY = -3600000
+REALTIME = -300000
+WEEKLY = 7
+MONTHLY = 30
+# weeks may start on any day depending on the project settings, so weekly and realtime queries are
+# never split
+UNSPLIT_INTERVALS = (REALTIME, WEEKLY)
+# metrics where the total over a range is the sum of the totals of its parts
+ADDITIVE_METRICS = ("totals", "sums")
+# intervals with whole days in every x value, which can be stored per day
+DAILY_INTERVALS = (1, HOURLY)
+
+
+# %%
+def _parse_day(value: str) -> date:
+    return datetime.strptime(value, DATE_FORMAT).date()
+
+
+def _month_end(day: date) -> date:
+    next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+def split_date_range(
+    start: str, end: str, days: int = 31, interval: int = 1
+) -> list[tuple[str, str]]:
+    """
+    Split an inclusive YYYYMMDD range into consecutive ranges of at most days days
+
+    Monthly ranges end on the last day of a month, so no month is split between two queries.
+    Weekly and realtime queries are not split.
+
+    Parameters
+    ----------
+    start: str, required
+        first day, YYYYMMDD
+    end: str, required
+        last day, YYYYMMDD
+    days: int, optional
+        longest range in days. Default is 31
+    interval: int, optional
+        interval of the query, see get_event_segmentation. Default is 1 for daily
+
+    Returns
+    -------
+    list of (start, end) tuples in order
+    """
+    if days < 1:
+        raise ValueError("days must be at least 1")
+    first, last = _parse_day(start), _parse_day(end)
+    if last < first:
+        raise ValueError(f"end {end} is before start {start}")
+    if interval in UNSPLIT_INTERVALS:
+        return [(start, end)]
+    ranges = []
+    cursor = first
+    while cursor <= last:
+        range_end = cursor + timedelta(days=days - 1)
+        if interval == MONTHLY:
+            if _month_end(range_end) != range_end:
+                range_end = range_end.replace(day=1) - timedelta(days=1)
+            range_end = max(range_end, _month_end(cursor))
+        range_end = min(range_end, last)
+        ranges.append((cursor.strftime(DATE_FORMAT), range_end.strftime(DATE_FORMAT)))
+        cursor = range_end + timedelta(days=1)
+    return ranges
+
+
+def _label(label: Any, segment: int | None) -> Any:
+    """Series label with the segment index of a fanned out query, in the form amplitude uses"""
+    if segment is None:
+        return label
+    if isinstance(label, list) and len(label) == 2 and isinstance(label[0], int):
+        return [segment, label[1]]
+    if label == 0:
+        return segment
+    return [segment, label]
+
+
+def merge_segmentation(
+    responses: list[dict],
+    metrics: str = "uniques",
+    segments: list[int | None] | None = None,
+    limit: int | None = None,
+) -> dict:
+    """
+    Merge event segmentation responses for consecutive date ranges, and for different segments,
+    into one response
+
+    xValues are joined in order, and each series is the values of the same label in every
+    response, with 0 where a response has no value for the label. seriesCollapsed is the sum of
+    the series for additive metrics ('totals' and 'sums'), and left out for other metrics, like
+    'uniques', where the total over the whole range cannot be derived from the parts.
+
+    Parameters
+    ----------
+    responses: list[dict], required
+        json of the responses, ordered by date
+    metrics: str, optional
+        metric of the queries. Default is 'uniques'
+    segments: list[int | None] | None, optional
+        segment index of each response. Labels get the index as in a query with several
+        segments, for example [1, "iOS"]. Default is None for one segment
+    limit: int | None, optional
+        keep only the limit labels with the largest totals. Default is None for all labels
+
+    Returns
+    -------
+    dictionary in the format of the event segmentation response
+    """
+    x_values: dict[str, None] = {}
+    rows: dict[str, tuple[Any, dict[str, Any]]] = {}
+    for i, response in enumerate(responses):
+        data = response["data"]
+        segment = segments[i] if segments is not None else None
+        x_values.update(dict.fromkeys(data["xValues"]))
+        for label, values in zip(data["seriesLabels"], data["series"]):
+            label = _label(label, segment)
+            key = json.dumps(label)
+            if key not in rows:
+                rows[key] = (label, {})
+            rows[key][1].update(zip(data["xValues"], values))
+
+    merged_rows = list(rows.values())
+    if limit is not None and len(merged_rows) > limit:
+        totals = sorted(
+            range(len(merged_rows)),
+            key=lambda n: (
+                -sum(
+                    v for v in merged_rows[n][1].values() if isinstance(v, (int, float))
+                )
+            ),
+        )
+        keep = set(totals[:limit])
+        merged_rows = [row for n, row in enumerate(merged_rows) if n in keep]
+
+    x_list = list(x_values)
+    series = [[values.get(x, 0) for x in x_list] for _, values in merged_rows]
+    data: dict[str, Any] = {
+        "series": series,
+        "seriesLabels": [label for label, _ in merged_rows],
+        "xValues": x_list,
+    }
+    if metrics in ADDITIVE_METRICS:
+        data["seriesCollapsed"] = [
+            [{"setId": "", "value": sum(values)}] for values in series
+        ]
+    return {"data": data}
+
+
+# %%
+async def fetch_event_segmentation(
+    client: AsyncAmplitudeClient,
+    start: str,
+    end: str,
+    event: dict,
+    metrics: Any,
+    interval: int = 1,
+    segment: Any = None,
+    segments: list | None = None,
+    group: Any = None,
+    limit: int = 100,
+    days: int | None = None,
+) -> dict:
+    """
+    Event segmentation for long ranges, sent as concurrent queries for shorter ranges and merged
+
+    The range is split with split_date_range, and with segments one query is sent per segment
+    and range. The queries run concurrently under the limiter of the client, and the responses
+    are merged with merge_segmentation. A range that fits in one query is sent as is.
+
+    When the queries are split, each one returns up to limit groups for its own range, so the
+    groups kept can differ from an unsplit query; the limit groups with the largest totals are
+    kept.
+
+    Parameters
+    ----------
+    client: AsyncAmplitudeClient, required
+        client for the project
+    start: str, required
+        YYYYMMDD
+    end: str, required
+        YYYYMMDD
+    event: dict, required
+        1 or 2 event-types with filter
+    metrics: optional
+        non-property metrics
+    interval: int, optional
+        -300000, -3600000, 1, 7, or 30 for realtime, per hour, day, week and month. Default is 1
+    segment: optional
+        segment for all queries
+    segments: list | None, optional
+        segments to query separately instead of segment. Default is None
+    group: optional
+        group by
+    limit: int, optional
+        Number of rows. Default is 100, max is 1000.
+    days: int | None, optional
+        days per query. Default is 7 for hourly queries and 31 otherwise
+
+    Returns
+    -------
+    dictionary in the format of the event segmentation response
+    """
+    if days is None:
+        days = 7 if interval == HOURLY else 31
+    ranges = split_date_range(start, end, days, interval)
+    segment_list = segments if segments is not None else [segment]
+    jobs = [
+        (index if segments is not None else None, s, range_start, range_end)
+        for index, s in enumerate(segment_list)
+        for range_start, range_end in ranges
+    ]
+    responses = await asyncio.gather(
+        *(
+            client.get_event_segmentation(
+                range_start, range_end, event, metrics, interval, s, group, limit
+            )
+            for _, s, range_start, range_end in jobs
+        )
+    )
+    logger.info(f"Event segmentation {start}-{end} fetched with {len(jobs)} queries")
+    if len(responses) == 1:
+        return responses[0]
+    return merge_segmentation(
+        list(responses),
+        metrics,
+        segments=[index for index, *_ in jobs] if segments is not None else None,
+        limit=limit,
+    )
+
+
+def get_event_segmentation_split(
+    api_key: str,
+    secret: str,
+    start: str,
+    end: str,
+    event: dict,
+    metrics: Any,
+    interval: int = 1,
+    segment: Any = None,
+    segments: list | None = None,
+    group: Any = None,
+    limit: int = 100,
+    region: str = "eu",
+    days: int | None = None,
+    max_concurrency: int = 4,
+    rate: float | None = None,
+) -> dict:
+    """
+    Blocking version of fetch_event_segmentation, for code that is not async
+
+    Parameters are as for fetch_event_segmentation, and
+
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    max_concurrency: int, optional
+        queries in flight at once. Default is 4
+    rate: float | None, optional
+        queries per second. Default is None for no limit
+
+    Cannot be called from a running event loop, for example in a jupyter notebook; await
+    fetch_event_segmentation there instead.
+
+    Returns
+    -------
+    dictionary in the format of the event segmentation response
+    """
+
+    async def run() -> dict:
+        limiter = AsyncRateLimiter(max_concurrency, rate)
+        async with AsyncAmplitudeClient(
+            api_key, secret, region, limiter=limiter
+        ) as client:
+            return await fetch_event_segmentation(
+                client,
+                start,
+                end,
+                event,
+                metrics,
+                interval,
+                segment,
+                segments,
+                group,
+                limit,
+                days,
+            )
+
+    return asyncio.run(run())
+
+
+# %%
+def segmentation_query_key(
+    client: AsyncAmplitudeClient,
+    event: dict,
+    metrics: Any,
+    interval: int = 1,
+    segment: Any = None,
+    group: Any = None,
+    limit: int = 100,
+) -> str:
+    """
+    Hash that identifies an event segmentation query for a project, independent of its date range
+    """
+    raw = json.dumps(
+        [limiter_key(client.headers), event, metrics, interval, segment, group, limit],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def split_by_day(response: dict) -> dict[str, dict]:
+    """
+    Split an event segmentation response with daily or hourly x values into one response per day
+
+    Returns
+    -------
+    dictionary of day, YYYYMMDD, to the response for that day
+    """
+    data = response["data"]
+    columns: dict[str, list[int]] = {}
+    for i, x in enumerate(data["xValues"]):
+        columns.setdefault(x[:10].replace("-", ""), []).append(i)
+    return {
+        day: {
+            "data": {
+                "series": [[values[i] for i in indexes] for values in data["series"]],
+                "seriesLabels": data["seriesLabels"],
+                "xValues": [data["xValues"][i] for i in indexes],
+            }
+        }
+        for day, indexes in columns.items()
+    }
+
+
+class SegmentationStore(SQLiteStore):
+    """
+    Event segmentation results per query and day in a local SQLite file
+
+    Used by fetch_event_segmentation_incremental. Each day is stored with the date it was
+    fetched, so days that may still change can be told apart from settled ones.
+
+    Parameters
+    ----------
+    path: str | Path, required
+        path to the SQLite database file
+    """
+
+    def __init__(self, path: str | Path):
+        super().__init__(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS days "
+            "(query TEXT, day TEXT, fetched_on TEXT, data TEXT, updated REAL, "
+            "PRIMARY KEY (query, day))"
+        )
+
+    def get(self, query: str, start: str, end: str) -> dict[str, tuple[str, dict]]:
+        """
+        Stored days of a query between start and end, inclusive, formated as YYYYMMDD
+
+        Returns
+        -------
+        dictionary of day to (fetched_on, response for the day)
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT day, fetched_on, data FROM days "
+                "WHERE query = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (query, start, end),
+            ).fetchall()
+        return {day: (fetched_on, json.loads(data)) for day, fetched_on, data in rows}
+
+    def put(self, query: str, days: dict[str, dict], fetched_on: str) -> None:
+        """Store the responses of days fetched on fetched_on, replacing earlier results"""
+        now = time.time()
+        rows = [
+            (query, day, fetched_on, json.dumps(data, separators=(",", ":")), now)
+            for day, data in days.items()
+        ]
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._db.execute("COMMIT")
+
+    def delete(self, query: str | None = None) -> None:
+        """Remove the days of one query, or everything"""
+        with self._lock:
+            if query is None:
+                self._db.execute("DELETE FROM days")
+            else:
+                self._db.execute("DELETE FROM days WHERE query = ?", (query,))
+
+
+def _runs(days: list[date]) -> list[tuple[str, str]]:
+    """Consecutive days grouped into (start, end) ranges"""
+    runs: list[list[date]] = []
+    for day in days:
+        if runs and day - runs[-1][1] == timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [(a.strftime(DATE_FORMAT), b.strftime(DATE_FORMAT)) for a, b in runs]
+
+
+async def fetch_event_segmentation_incremental(
+    client: AsyncAmplitudeClient,
+    store: SegmentationStore,
+    start: str,
+    end: str,
+    event: dict,
+    metrics: Any,
+    interval: int = 1,
+    segment: Any = None,
+    group: Any = None,
+    limit: int = 100,
+    refetch_days: int = 3,
+    days: int | None = None,
+    today: date | None = None,
+) -> dict:
+    """
+    Event segmentation that only fetches the days that are missing or may still change
+
+    Results are stored per day in store. A day is fetched again until it has been fetched at
+    least refetch_days days after it, so late arriving events are picked up; older days are read
+    from the store. The days to fetch are sent with fetch_event_segmentation, and the full range
+    is merged from the stored days with merge_segmentation.
+
+    Only daily and hourly intervals can be stored per day.
+
+    Parameters
+    ----------
+    client: AsyncAmplitudeClient, required
+        client for the project
+    store: SegmentationStore, required
+        where the days are kept between runs
+    start: str, required
+        YYYYMMDD
+    end: str, required
+        YYYYMMDD
+    event: dict, required
+        1 or 2 event-types with filter
+    metrics: optional
+        non-property metrics
+    interval: int, optional
+        1 for daily or -3600000 for hourly. Default is 1
+    segment: optional
+        segment
+    group: optional
+        group by
+    limit: int, optional
+        Number of rows. Default is 100, max is 1000.
+    refetch_days: int, optional
+        days before today that are always fetched again. Default is 3
+    days: int | None, optional
+        days per query when fetching, see fetch_event_segmentation. Default is None
+    today: date | None, optional
+        the current date in the time zone of the project. Default is date.today()
+
+    Returns
+    -------
+    dictionary in the format of the event segmentation response
+    """
+    if interval not in DAILY_INTERVALS:
+        raise ValueError(
+            "Only daily (1) and hourly (-3600000) queries can be stored per day"
+        )
+    today = today or date.today()
+    settled_before = today - timedelta(days=refetch_days)
+    query = segmentation_query_key(
+        client, event, metrics, interval, segment, group, limit
+    )
+    stored = store.get(query, start, end)
+    first, last = _parse_day(start), _parse_day(end)
+    wanted = [first + timedelta(days=n) for n in range((last - first).days + 1)]
+    to_fetch = []
+    for day in wanted:
+        entry = stored.get(day.strftime(DATE_FORMAT))
+        if entry is None or _parse_day(entry[0]) - day < timedelta(days=refetch_days):
+            to_fetch.append(day)
+        elif day >= settled_before:
+            to_fetch.append(day)
+
+    runs = _runs(to_fetch)
+    responses = await asyncio.gather(
+        *(
+            fetch_event_segmentation(
+                client,
+                run_start,
+                run_end,
+                event,
+                metrics,
+                interval,
+                segment,
+                None,
+                group,
+                limit,
+                days,
+            )
+            for run_start, run_end in runs
+        )
+    )
+    fetched_on = today.strftime(DATE_FORMAT)
+    empty = {"data": {"series": [], "seriesLabels": [], "xValues": []}}
+    for (run_start, run_end), response in zip(runs, responses):
+        by_day = split_by_day(response)
+        run_days = split_date_range(run_start, run_end, days=1)
+        fresh = {day: by_day.get(day, empty) for day, _ in run_days}
+        store.put(query, fresh, fetched_on)
+        stored.update({day: (fetched_on, data) for day, data in fresh.items()})
+    logger.info(
+        f"Event segmentation {start}-{end}: fetched {len(to_fetch)} of {len(wanted)} days"
+    )
+    return merge_segmentation(
+        [stored[day.strftime(DATE_FORMAT)][1] for day in wanted], metrics, limit=limit
+    )
+
+
+def get_event_segmentation_incremental(
+    api_key: str,
+    secret: str,
+    store: SegmentationStore | str | Path,
+    start: str,
+    end: str,
+    event: dict,
+    metrics: Any,
+    interval: int = 1,
+    segment: Any = None,
+    group: Any = None,
+    limit: int = 100,
+    region: str = "eu",
+    refetch_days: int = 3,
+    days: int | None = None,
+    max_concurrency: int = 4,
+    rate: float | None = None,
+) -> dict:
+    """
+    Blocking version of fetch_event_segmentation_incremental, for code that is not async
+
+    Parameters are as for fetch_event_segmentation_incremental, and
+
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    store: SegmentationStore | str | Path, required
+        store, or path to the SQLite file of a store
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    max_concurrency: int, optional
+        queries in flight at once. Default is 4
+    rate: float | None, optional
+        queries per second. Default is None for no limit
+
+    Returns
+    -------
+    dictionary in the format of the event segmentation response
+    """
+
+    async def run(segmentation_store: SegmentationStore) -> dict:
+        limiter = AsyncRateLimiter(max_concurrency, rate)
+        async with AsyncAmplitudeClient(
+            api_key, secret, region, limiter=limiter
+        ) as client:
+            return await fetch_event_segmentation_incremental(
+                client,
+                segmentation_store,
+                start,
+                end,
+                event,
+                metrics,
+                interval,
+                segment,
+                group,
+                limit,
+                refetch_days,
+                days,
+            )
+
+    with SegmentationStore.opened(store) as segmentation_store:
+        return asyncio.run(run(segmentation_store))
@@ -0,0 +1,368 @@
+"""
+Snapshots of the event type taxonomy of a project, diffs between them, and bulk changes
+
+    async with AsyncAmplitudeClient(api_key, secret, limiter=AsyncRateLimiter(8, rate=5)) as client:
+        current = await fetch_taxonomy(client, store)
+        diff = diff_taxonomy(store.get(approved_id), current)
+        report = await apply_taxonomy_changes(client, delete=diff.added)
+"""
+
+# %%
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+import aiohttp
+
+from ._report import StatusReport
+from ._sqlite import SQLiteStore
+from .async_api import AsyncAmplitudeClient, limiter_key
+from .ratelimit import AsyncRateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+# %%
+@dataclass
+class TaxonomySnapshot:
+    """
+    The event types of a project at one point in time
+
+    Attributes
+    ----------
+    id: int | None
+        ID in the TaxonomyStore, None for a snapshot that is not stored
+    project: str
+        key of the project, see taxonomy_project_key
+    taken_at: float
+        unix time the taxonomy was fetched
+    event_types: dict[str, dict]
+        event type name mapped to its record from the taxonomy API
+    """
+
+    id: int | None
+    project: str
+    taken_at: float
+    event_types: dict[str, dict] = field(default_factory=dict)
+
+    @classmethod
+    def from_response(
+        cls, project: str, response: dict, taken_at: float | None = None
+    ) -> "TaxonomySnapshot":
+        """Snapshot of the json returned by get_all_event_types"""
+        return cls(
+            None,
+            project,
+            time.time() if taken_at is None else taken_at,
+            {record["event_type"]: record for record in response["data"]},
+        )
+
+
+@dataclass
+class TaxonomyDiff:
+    """Event type names that were added, removed or changed between two snapshots"""
+
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+def taxonomy_project_key(client: AsyncAmplitudeClient) -> str:
+    """Key that identifies the project of a client in a TaxonomyStore"""
+    return f"{client.region}:{limiter_key(client.headers)}"
+
+
+def diff_taxonomy(
+    old: TaxonomySnapshot | dict[str, dict], new: TaxonomySnapshot | dict[str, dict]
+) -> TaxonomyDiff:
+    """
+    Compare two snapshots, or two dictionaries of event type name to record
+
+    Returns
+    -------
+    TaxonomyDiff with sorted names: added are only in new, removed are only in old, and changed
+    are in both with a different record
+    """
+    old_types = old.event_types if isinstance(old, TaxonomySnapshot) else old
+    new_types = new.event_types if isinstance(new, TaxonomySnapshot) else new
+    return TaxonomyDiff(
+        added=sorted(new_types.keys() - old_types.keys()),
+        removed=sorted(old_types.keys() - new_types.keys()),
+        changed=sorted(
+            name
+            for name in old_types.keys() & new_types.keys()
+            if old_types[name] != new_types[name]
+        ),
+    )
+
+
+# %%
+class TaxonomyStore(SQLiteStore):
+    """
+    Taxonomy snapshots of any number of projects in a local SQLite file
+
+    Parameters
+    ----------
+    path: str | Path, required
+        path to the SQLite database file
+    """
+
+    def __init__(self, path: str | Path):
+        super().__init__(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, project TEXT, taken_at REAL, data TEXT)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS snapshots_project ON snapshots (project, taken_at)"
+        )
+
+    def save(self, snapshot: TaxonomySnapshot) -> TaxonomySnapshot:
+        """Store a snapshot and set its id"""
+        data = json.dumps(snapshot.event_types, separators=(",", ":"))
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO snapshots (project, taken_at, data) VALUES (?, ?, ?)",
+                (snapshot.project, snapshot.taken_at, data),
+            )
+        snapshot.id = cursor.lastrowid
+        return snapshot
+
+    def _snapshot(self, row: tuple | None) -> TaxonomySnapshot | None:
+        if row is None:
+            return None
+        snapshot_id, project, taken_at, data = row
+        return TaxonomySnapshot(snapshot_id, project, taken_at, json.loads(data))
+
+    def get(self, snapshot_id: int) -> TaxonomySnapshot | None:
+        """The snapshot with the given id, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, project, taken_at, data FROM snapshots WHERE id = ?",
+                (snapshot_id,),
+            ).fetchone()
+        return self._snapshot(row)
+
+    def latest(self, project: str) -> TaxonomySnapshot | None:
+        """The most recent snapshot of a project, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, project, taken_at, data FROM snapshots WHERE project = ? "
+                "ORDER BY taken_at DESC, id DESC LIMIT 1",
+                (project,),
+            ).fetchone()
+        return self._snapshot(row)
+
+    def history(self, project: str) -> list[tuple[int, float]]:
+        """(id, taken_at) of every snapshot of a project, oldest first"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, taken_at FROM snapshots WHERE project = ? ORDER BY taken_at, id",
+                (project,),
+            ).fetchall()
+
+    def delete(self, project: str | None = None, before: float | None = None) -> None:
+        """
+        Remove the snapshots of one project, or of every project, optionally only the ones taken
+        before a unix time
+        """
+        query, params = "DELETE FROM snapshots WHERE 1 = 1", []
+        if project is not None:
+            query += " AND project = ?"
+            params.append(project)
+        if before is not None:
+            query += " AND taken_at < ?"
+            params.append(before)
+        with self._lock:
+            self._db.execute(query, params)
+
+
+async def fetch_taxonomy(
+    client: AsyncAmplitudeClient,
+    store: TaxonomyStore | None = None,
+    max_age: float | None = None,
+) -> TaxonomySnapshot:
+    """
+    Get the event types of the project of a client as a snapshot, and save it in store
+
+    Parameters
+    ----------
+    client: AsyncAmplitudeClient, required
+        client for the project
+    store: TaxonomyStore | None, optional
+        where snapshots are kept. Default is None to not store the snapshot
+    max_age: float | None, optional
+        return the latest stored snapshot instead of downloading the taxonomy if it is at most
+        this many seconds old. Default is None to always download
+
+    Returns
+    -------
+    TaxonomySnapshot
+    """
+    project = taxonomy_project_key(client)
+    if store is not None and max_age is not None:
+        latest = store.latest(project)
+        if latest is not None and time.time() - latest.taken_at <= max_age:
+            return latest
+    snapshot = TaxonomySnapshot.from_response(
+        project, await client.get_all_event_types()
+    )
+    logger.info(f"Fetched taxonomy with {len(snapshot.event_types)} event types")
+    if store is not None:
+        store.save(snapshot)
+    return snapshot
+
+
+# %%
+@dataclass
+class EventTypeResult:
+    """Outcome of one change in apply_taxonomy_changes, with the HTTP status of a failed request"""
+
+    event_type: str
+    action: str
+    status: str = "pending"
+    http_status: int | None = None
+    seconds: float = 0.0
+    error: str | None = None
+
+
+@dataclass
+class TaxonomyReport(StatusReport[EventTypeResult]):
+    """Per-event-type results of apply_taxonomy_changes, with the status 'done' or 'failed'"""
+
+    results: list[EventTypeResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def _items(self) -> list[EventTypeResult]:
+        return self.results
+
+
+async def _apply_change(
+    client: AsyncAmplitudeClient, result: EventTypeResult, fields: dict
+) -> None:
+    started = time.perf_counter()
+    try:
+        if result.action == "delete":
+            await client.delete_event_type(result.event_type)
+        else:
+            await client.update_event_type(result.event_type, **fields)
+        result.status = "done"
+    except aiohttp.ClientResponseError as e:
+        result.status = "failed"
+        result.http_status = e.status
+        result.error = e.message
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result.status = "failed"
+        result.error = repr(e)
+    result.seconds = time.perf_counter() - started
+    if result.status == "failed":
+        logger.error(
+            f"[FAILED] {result.action} event type {result.event_type} — {result.error}"
+        )
+
+
+async def apply_taxonomy_changes(
+    client: AsyncAmplitudeClient,
+    delete: Iterable[str] = (),
+    update: dict[str, dict] | None = None,
+) -> TaxonomyReport:
+    """
+    Delete and update many event types concurrently
+
+    The changes are sent by as many workers as the limiter of the client allows requests in
+    flight, and every request follows its rate limit and retry policy, so give the client an
+    AsyncRateLimiter with a rate to stay under the limits of the taxonomy API. A failing change
+    does not stop the others.
+
+    Parameters
+    ----------
+    client: AsyncAmplitudeClient, required
+        client for the project
+    delete: Iterable[str], optional
+        names of event types to delete, for example diff_taxonomy(approved, current).added
+    update: dict[str, dict] | None, optional
+        event type name mapped to the keyword arguments of AsyncAmplitudeClient.update_event_type,
+        for example {"page_view": {"category": "Navigation"}}. Default is None
+
+    Returns
+    -------
+    TaxonomyReport with the status and time spent for every event type
+    """
+    started = time.perf_counter()
+    update = update or {}
+    report = TaxonomyReport(
+        [EventTypeResult(name, "delete") for name in dict.fromkeys(delete)]
+        + [EventTypeResult(name, "update") for name in update]
+    )
+    changes = iter(report.results)
+
+    async def worker() -> None:
+        for result in changes:
+            await _apply_change(client, result, update.get(result.event_type, {}))
+
+    workers = min(client.limiter.max_concurrency, len(report.results))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    report.seconds = time.perf_counter() - started
+    logger.info(
+        f"Applied {report.count('done')} taxonomy changes, {report.count('failed')} failed, "
+        f"in {report.seconds:.1f}s"
+    )
+    return report
+
+
+def delete_event_types_bulk(
+    api_key: str,
+    secret: str,
+    event_types: Iterable[str],
+    region: str = "eu",
+    max_concurrency: int = 8,
+    rate: float | None = 5,
+    store: TaxonomyStore | str | Path | None = None,
+) -> TaxonomyReport:
+    """
+    Delete many event types concurrently, a blocking wrapper of apply_taxonomy_changes
+
+    Parameters
+    ----------
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    event_types: Iterable[str], required
+        names of the event types to delete
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    max_concurrency: int, optional
+        requests in flight at once. Default is 8
+    rate: float | None, optional
+        requests per second. Default is 5
+    store: TaxonomyStore | str | Path | None, optional
+        store, or path to the SQLite file of a store, to save a snapshot of the taxonomy in
+        before and after the deletion. Default is None
+
+    Returns
+    -------
+    TaxonomyReport with the status and time spent for every event type
+    """
+
+    async def run(taxonomy_store: TaxonomyStore | None) -> TaxonomyReport:
+        limiter = AsyncRateLimiter(max_concurrency, rate)
+        async with AsyncAmplitudeClient(
+            api_key, secret, region, limiter=limiter
+        ) as client:
+            if taxonomy_store is not None:
+                await fetch_taxonomy(client, taxonomy_store)
+            report = await apply_taxonomy_changes(client, delete=event_types)
+            if taxonomy_store is not None:
+                await fetch_taxonomy(client, taxonomy_store)
+            return report
+
+    with TaxonomyStore.opened(store) as taxonomy_store:
+        return asyncio.run(run(taxonomy_store))
@@ -0,0 +1,282 @@
+# %%
+import asyncio
+import itertools
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+import aiohttp
+
+from ._report import StatusReport
+from ._sqlite import SQLiteStore
+from .async_api import AsyncAmplitudeClient, limiter_key
+from .ratelimit import AsyncRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# %%
+# SQLite allows 999 parameters in a statement in older versions
+LOOKUP_BATCH = 500
+DAY = 86400
+
+
+@dataclass
+class UserMatch:
+    """
+    Amplitude IDs found for one Device ID or User ID
+
+    status is 'cached' for a result read from the cache, 'found', 'nomatch' when the user search
+    found nothing, or 'failed'
+    """
+
+    user: str
+    amplitude_ids: list[int] = field(default_factory=list)
+    status: str = "pending"
+    error: str | None = None
+
+
+@dataclass
+class UserResolutionReport(StatusReport[UserMatch]):
+    """Per-user results of resolve_users, with the status of UserMatch"""
+
+    results: dict[str, UserMatch] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def _items(self) -> Iterable[UserMatch]:
+        return self.results.values()
+
+    @property
+    def amplitude_ids(self) -> dict[str, list[int]]:
+        """Device ID or User ID mapped to its Amplitude IDs, for every user that was resolved"""
+        return {
+            user: r.amplitude_ids
+            for user, r in self.results.items()
+            if r.status != "failed"
+        }
+
+
+# %%
+class UserIdCache(SQLiteStore):
+    """
+    Amplitude IDs of Device IDs and User IDs per project in a local SQLite file, with a time to live
+
+    A user that was not found is stored too, with its own shorter time to live, since it may show
+    up in Amplitude later.
+
+    Parameters
+    ----------
+    path: str | Path, required
+        path to the SQLite database file
+    ttl: float, optional
+        seconds a found user stays valid. Default is 30 days
+    nomatch_ttl: float, optional
+        seconds a user that was not found stays valid. Default is 1 day
+    """
+
+    def __init__(
+        self, path: str | Path, ttl: float = 30 * DAY, nomatch_ttl: float = DAY
+    ):
+        super().__init__(path)
+        self.ttl = ttl
+        self.nomatch_ttl = nomatch_ttl
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS users "
+            "(project TEXT, user TEXT, amplitude_ids TEXT, matched INTEGER, fetched REAL, "
+            "PRIMARY KEY (project, user))"
+        )
+
+    def get_many(self, project: str, users: Iterable[str]) -> dict[str, list[int]]:
+        """
+        Look up users with an entry younger than ttl, or nomatch_ttl for a user that was not found
+
+        Returns
+        -------
+        dictionary of user to its Amplitude IDs, an empty list for a user that was not found
+        """
+        found: dict[str, list[int]] = {}
+        valid_after = self._valid_after()
+        users = iter(users)
+        while batch := list(itertools.islice(users, LOOKUP_BATCH)):
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT user, amplitude_ids FROM users WHERE project = ? "
+                    "AND fetched > CASE WHEN matched THEN ? ELSE ? END "
+                    f"AND user IN ({','.join('?' * len(batch))})",
+                    (project, *valid_after, *batch),
+                ).fetchall()
+            found.update((user, json.loads(ids)) for user, ids in rows)
+        return found
+
+    def put_many(self, project: str, matches: dict[str, list[int]]) -> None:
+        """Store the Amplitude IDs of users, an empty list for a user that was not found"""
+        now = time.time()
+        rows = [
+            (project, user, json.dumps(ids), bool(ids), now)
+            for user, ids in matches.items()
+        ]
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._db.execute("COMMIT")
+
+    def delete(self, project: str | None = None, expired_only: bool = False) -> None:
+        """Remove the entries of one project, or of every project, optionally only expired ones"""
+        query, params = "DELETE FROM users WHERE 1 = 1", []
+        if project is not None:
+            query += " AND project = ?"
+            params.append(project)
+        if expired_only:
+            query += " AND fetched <= CASE WHEN matched THEN ? ELSE ? END"
+            params.extend(self._valid_after())
+        with self._lock:
+            self._db.execute(query, params)
+
+    def _valid_after(self) -> tuple[float, float]:
+        now = time.time()
+        return now - self.ttl, now - self.nomatch_ttl
+
+
+# %%
+async def _search(client: AsyncAmplitudeClient, match: UserMatch) -> None:
+    try:
+        body = await client.find_user(match.user)
+        amplitude_ids = [m["amplitude_id"] for m in body.get("matches", [])]
+    except aiohttp.ClientResponseError as e:
+        match.status = "failed"
+        match.error = f"HTTP {e.status}: {e.message}"
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+        match.status = "failed"
+        match.error = repr(e)
+    else:
+        match.amplitude_ids = amplitude_ids
+        match.status = "found" if amplitude_ids else "nomatch"
+    if match.status == "failed":
+        logger.error(f"[FAILED] user search for {match.user} — {match.error}")
+
+
+async def resolve_users(
+    client: AsyncAmplitudeClient,
+    users: Iterable[str],
+    cache: UserIdCache | None = None,
+    refresh: bool = False,
+    flush_every: int = LOOKUP_BATCH,
+) -> UserResolutionReport:
+    """
+    Find the Amplitude IDs of many Device IDs or User IDs
+
+    Duplicates are removed, users with a valid cache entry are read from the cache, and the rest
+    are searched by as many workers as the limiter of the client allows requests in flight, under
+    its rate limit and retry policy. Results are written to the cache every flush_every users, so
+    an interrupted run keeps what it found. Failed searches are not cached.
+
+    See https://developers.amplitude.com/docs/dashboard-rest-api#user-search
+
+    Parameters
+    ----------
+    client: AsyncAmplitudeClient, required
+        client for the project
+    users: Iterable[str], required
+        Device IDs or User IDs
+    cache: UserIdCache | None, optional
+        persistent cache of earlier results. Default is None for no cache
+    refresh: bool, optional
+        search every user again, and update the cache. Default is False
+    flush_every: int, optional
+        users searched between writes to the cache. Default is 500
+
+    Returns
+    -------
+    UserResolutionReport with the Amplitude IDs and status of every user
+    """
+    started = time.perf_counter()
+    project = f"{client.region}:{limiter_key(client.headers)}"
+    report = UserResolutionReport({str(user): UserMatch(str(user)) for user in users})
+    cached = (
+        cache.get_many(project, report.results)
+        if cache is not None and not refresh
+        else {}
+    )
+    for user, ids in cached.items():
+        report.results[user].amplitude_ids = ids
+        report.results[user].status = "cached"
+    todo = iter([r for r in report.results.values() if r.status == "pending"])
+    pending: dict[str, list[int]] = {}
+
+    def flush() -> None:
+        if cache is not None and pending:
+            cache.put_many(project, pending)
+        pending.clear()
+
+    async def worker() -> None:
+        for match in todo:
+            await _search(client, match)
+            if match.status != "failed":
+                pending[match.user] = match.amplitude_ids
+                if len(pending) >= flush_every:
+                    flush()
+
+    workers = min(client.limiter.max_concurrency, len(report.results) - len(cached))
+    try:
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    finally:
+        flush()
+    report.seconds = time.perf_counter() - started
+    logger.info(
+        f"Resolved {len(report.results)} users in {report.seconds:.1f}s: "
+        f"{report.count('cached')} cached, {report.count('found')} found, "
+        f"{report.count('nomatch')} not found, {report.count('failed')} failed"
+    )
+    return report
+
+
+def resolve_users_bulk(
+    api_key: str,
+    secret: str,
+    users: Iterable[str],
+    cache: UserIdCache | str | Path | None = None,
+    region: str = "eu",
+    max_concurrency: int = 5,
+    rate: float | None = 25,
+    refresh: bool = False,
+) -> UserResolutionReport:
+    """
+    Find the Amplitude IDs of many Device IDs or User IDs, a blocking wrapper of resolve_users
+
+    Parameters
+    ----------
+    api_key: str, required
+        API key for the project in Amplitude
+    secret: str, required
+        API secret for the project in Amplitude
+    users: Iterable[str], required
+        Device IDs or User IDs
+    cache: UserIdCache | str | Path | None, optional
+        cache, or path to the SQLite file of a cache. Default is None for no cache
+    region: str, optional
+        Region of the data centre. Default is 'eu' for Europe, and 'us' for USA.
+    max_concurrency: int, optional
+        requests in flight at once. Default is 5, the concurrency limit of the Dashboard REST API
+    rate: float | None, optional
+        requests per second. Default is 25, within the hourly cost limit of the Dashboard REST API
+    refresh: bool, optional
+        search every user again, and update the cache. Default is False
+
+    Returns
+    -------
+    UserResolutionReport with the Amplitude IDs and status of every user
+    """
+
+    async def run(user_cache: UserIdCache | None) -> UserResolutionReport:
+        limiter = AsyncRateLimiter(max_concurrency, rate)
+        async with AsyncAmplitudeClient(
+            api_key, secret, region, limiter=limiter
+        ) as client:
+            return await resolve_users(client, users, user_cache, refresh)
+
+    with UserIdCache.opened(cache) as user_cache:
+        return asyncio.run(run(user_cache))
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from amplitude_data_wrapper import analytics_api, async_api, instrumentation
+
+
+class RecordingServer(ThreadingHTTPServer):
+    """Answers every request with an empty json object and keeps what it received"""
+
+    def __init__(self, monkeypatch):
+        super().__init__(("127.0.0.1", 0), RecordingHandler)
+        self.received: list[dict] = []
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.region = f"test{self.server_address[1]}"
+        monkeypatch.setitem(analytics_api.API_DOMAINS, self.region, self.base_url)
+        monkeypatch.setitem(async_api.BASE_DOMAINS, self.region, self.base_url)
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    def _record(self) -> None:
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.server.received.append(
+            {
+                "method": self.command,
+                "path": url.path,
+                "query": parse_qs(url.query),
+                "content_type": self.headers.get("Content-Type"),
+                "body": self.rfile.read(length),
+            }
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    do_GET = do_POST = _record
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = RecordingServer(monkeypatch)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_delete_user_data_sends_json_body(server):
+    analytics_api.delete_user_data(
+        [123, 456], ["user1"], "me@example.com", "key", "secret", region=server.region
+    )
+    [received] = server.received
+    assert (received["method"], received["path"]) == ("POST", "/api/2/deletions/users")
+    assert received["content_type"] == "application/json"
+    assert json.loads(received["body"]) == {
+        "amplitude_ids": [123, 456],
+        "user_ids": ["user1"],
+        "requester": "me@example.com",
+        "ignore_invalid_id": False,
+        "delete_from_org": False,
+    }
+
+
+def test_event_segmentation_sends_group(server):
+    analytics_api.get_event_segmentation(
+        "key",
+        "secret",
+        "20240101",
+        "20240107",
+        {"event_type": "event_1"},
+        "uniques",
+        group="platform",
+        region=server.region,
+    )
+    [received] = server.received
+    assert received["path"] == "/api/2/events/segmentation"
+    assert received["query"]["g"] == ["platform"]
+
+
+SEGMENT = [{"prop": "platform", "op": "is", "values": ["iOS"]}]
+
+
+def test_segment_filters_are_sent_as_json(server):
+    for segment in (SEGMENT, json.dumps(SEGMENT)):
+        analytics_api.get_event_segmentation(
+            "key",
+            "secret",
+            "20240101",
+            "20240107",
+            {"event_type": "event_1"},
+            "uniques",
+            segment=segment,
+            region=server.region,
+        )
+    assert [r["query"]["s"] for r in server.received] == [[json.dumps(SEGMENT)]] * 2
+
+
+def test_async_segment_filters_are_sent_as_json(server):
+    async def run() -> None:
+        async with async_api.AsyncAmplitudeClient(
+            "key", "secret", server.region
+        ) as client:
+            await client.get_event_segmentation(
+                "20240101",
+                "20240107",
+                {"event_type": "event_1"},
+                "uniques",
+                segment=SEGMENT,
+            )
+
+    asyncio.run(run())
+    [received] = server.received
+    assert received["query"]["s"] == [json.dumps(SEGMENT)]
+
+
+def test_shared_clients_are_reused_and_evicted_clients_closed(monkeypatch):
+    closed = []
+    monkeypatch.setattr(analytics_api, "_shared_clients", OrderedDict())
+    monkeypatch.setattr(analytics_api, "SHARED_CLIENTS_MAX", 2)
+    monkeypatch.setattr(
+        analytics_api.AmplitudeClient, "close", lambda client: closed.append(client)
+    )
+    first = analytics_api.shared_client("key1", "secret", "eu")
+    assert analytics_api.shared_client("key1", "secret", "eu") is first
+    second = analytics_api.shared_client("key2", "secret", "eu")
+    analytics_api.shared_client("key1", "secret", "eu")
+    third = analytics_api.shared_client("key3", "secret", "eu")
+    assert closed == [second]
+    analytics_api.close_shared_clients()
+    assert closed[1:] == [first, third]
+    assert analytics_api.shared_client("key1", "secret", "eu") is not first
+
+
+def test_register_region_moves_shared_clients_to_new_url(monkeypatch):
+    old, new = RecordingServer(monkeypatch), RecordingServer(monkeypatch)
+    for server in (old, new):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        region = f"moved{old.server_address[1]}"
+        analytics_api.register_region(region, old.base_url)
+        analytics_api.get_all_event_types("key", "secret", region=region)
+        analytics_api.register_region(region, new.base_url)
+        analytics_api.get_all_event_types("key", "secret", region=region)
+    finally:
+        for server in (old, new):
+            server.shutdown()
+            server.server_close()
+    assert len(old.received) == 1
+    assert len(new.received) == 1
+
+
+def test_instrumentation_counts_received_bytes(server):
+    records = []
+    hook = instrumentation.add_hook(records.append)
+    try:
+        client = analytics_api.AmplitudeClient("key", "secret", region=server.region)
+        with client:
+            client.request("GET", "/api/2/taxonomy/event")
+            with client.request("GET", "/api/2/export", stream=True) as r:
+                assert records[-1].bytes_received == 2
+                assert r.content == b"{}"
+    finally:
+        instrumentation.remove_hook(hook)
+    assert [r.bytes_received for r in records] == [2, 2]
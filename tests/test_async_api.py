@@ -0,0 +1,150 @@
+import asyncio
+from pathlib import Path
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from amplitude_data_wrapper import async_api
+from amplitude_data_wrapper.mock_server import MockAmplitudeServer
+
+
+async def _flaky_server(drops: int) -> tuple[asyncio.AbstractServer, list[int]]:
+    """Server that closes the first drops connections without answering, then answers 200
+
+    Requests are sent as POST, which aiohttp does not resend by itself on a dropped connection.
+    """
+    connections = []
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connections.append(1)
+        await reader.readuntil(b"\r\n\r\n")
+        if len(connections) > drops:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                b"Content-Length: 2\r\nConnection: close\r\n\r\n{}"
+            )
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, connections
+
+
+def test_request_retries_connection_errors(monkeypatch):
+    monkeypatch.setattr(async_api, "backoff_delay", lambda attempt: 0)
+
+    async def run() -> tuple[int, int]:
+        server, connections = await _flaky_server(drops=2)
+        port = server.sockets[0].getsockname()[1]
+        async with server, aiohttp.ClientSession() as session:
+            async with async_api.request(
+                session, "POST", f"http://127.0.0.1:{port}/", {}, retries=3
+            ) as resp:
+                return resp.status, len(connections)
+
+    assert asyncio.run(run()) == (200, 3)
+
+
+def test_request_raises_connection_error_after_retries(monkeypatch):
+    monkeypatch.setattr(async_api, "backoff_delay", lambda attempt: 0)
+
+    async def run() -> int:
+        server, connections = await _flaky_server(drops=5)
+        port = server.sockets[0].getsockname()[1]
+        async with server, aiohttp.ClientSession() as session:
+            try:
+                async with async_api.request(
+                    session, "POST", f"http://127.0.0.1:{port}/", {}, retries=3
+                ):
+                    pass
+            except aiohttp.ClientConnectionError:
+                return len(connections)
+        return -1
+
+    assert asyncio.run(run()) == 3
+
+
+def test_download_charts_records_bad_charts_as_failed(tmp_path, monkeypatch):
+    async def chart(request: web.Request) -> web.Response:
+        if request.match_info["chart_id"] == "broken":
+            return web.Response(text="not json", content_type="application/json")
+        return web.json_response({"data": {"series": [[1]]}})
+
+    async def run() -> async_api.DownloadSummary:
+        app = web.Application()
+        app.router.add_get("/api/3/chart/{chart_id}/query", chart)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setitem(
+            async_api.API_DOMAINS, "local", f"http://127.0.0.1:{port}/api/3/chart"
+        )
+        try:
+            return await async_api.download_charts(
+                {"1": {"key": "k", "secret": "s", "charts": ["ok", "broken"]}},
+                tmp_path,
+                region="local",
+                workers=2,
+            )
+        finally:
+            await runner.cleanup()
+
+    summary = asyncio.run(run())
+    results = {r.chart_id: r for r in summary.results}
+    assert results["ok"].status == "downloaded"
+    assert results["broken"].status == "failed"
+    assert "JSONDecodeError" in results["broken"].error
+
+
+@pytest.mark.parametrize(
+    "cfg",
+    [
+        {"key": "k", "secret": "s"},
+        {"key": "k", "secret": "s", "charts": "abc123"},
+        {"key": "k", "secret": "s", "charts": ["abc123"], "region": "nowhere"},
+    ],
+)
+def test_download_charts_rejects_bad_projects_before_starting(tmp_path, cfg):
+    with pytest.raises(ValueError):
+        asyncio.run(async_api.download_charts({"1": cfg}, tmp_path))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_charts_stops_workers_when_producer_fails(tmp_path):
+    # the project directory cannot be created because a file has its name
+    (tmp_path / "1").write_text("")
+    projects = {"1": {"key": "k", "secret": "s", "charts": ["abc123"]}}
+
+    async def run() -> list[asyncio.Task]:
+        with pytest.raises(FileExistsError):
+            await asyncio.wait_for(async_api.download_charts(projects, tmp_path), 5)
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
+
+
+def test_client_sends_charts_and_cohorts_through_its_proxy(tmp_path, monkeypatch):
+    # the host does not resolve, so requests only succeed when they go through the proxy
+    monkeypatch.setitem(async_api.BASE_DOMAINS, "proxied", "http://amplitude.invalid")
+    monkeypatch.setitem(
+        async_api.API_DOMAINS, "proxied", "http://amplitude.invalid/api/3/chart"
+    )
+
+    async def run() -> tuple[object, Path, int]:
+        async with MockAmplitudeServer(cohort_pending_polls=0, cohort_rows=3) as proxy:
+            async with async_api.AsyncAmplitudeClient(
+                "k", "s", region="proxied", proxy=proxy.base_url, retries=1
+            ) as client:
+                chart = await client.get_chart("abc123")
+                cohort = await client.get_cohort(
+                    "c1", tmp_path / "cohort.csv", min_interval=0
+                )
+            return chart, cohort, proxy.stats.total
+
+    chart, cohort, proxied = asyncio.run(run())
+    assert chart is not None
+    assert cohort.read_text().count("\n") >= 3
+    assert proxied == 4
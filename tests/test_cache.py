@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import pytest
+
+from amplitude_data_wrapper import cache
+from amplitude_data_wrapper.cache import MemoryCache, SQLiteCache, cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    caches = []
+
+    def make(**kwargs):
+        if request.param == "memory":
+            result = MemoryCache(**kwargs)
+        else:
+            result = SQLiteCache(tmp_path / "cache.db", **kwargs)
+            caches.append(result)
+        return result
+
+    yield make
+    for result in caches:
+        result.close()
+
+
+def test_cache_key_ignores_param_order():
+    assert cache_key("eu", "abc", {"a": 1, "b": 2}) == cache_key(
+        "eu", "abc", {"b": 2, "a": 1}
+    )
+    assert cache_key("eu", "abc") != cache_key("us", "abc")
+    assert cache_key("eu", "abc") != cache_key("eu", "abc", {"a": 1})
+
+
+def test_entries_expire_after_ttl(make_cache, clock):
+    store = make_cache(ttl=60)
+    store.set("key", b"value")
+    clock.value += 60
+    assert store.get("key") == b"value"
+    clock.value += 1
+    assert store.get("key") is None
+
+
+def test_least_recently_used_entry_is_evicted(make_cache, clock):
+    store = make_cache(max_entries=2)
+    store.set("a", b"1")
+    clock.value += 1
+    store.set("b", b"2")
+    clock.value += 1
+    assert store.get("a") == b"1"
+    clock.value += 1
+    store.set("c", b"3")
+    assert store.get("b") is None
+    assert store.get("a") == b"1"
+    assert store.get("c") == b"3"
+
+
+def test_delete_and_clear(make_cache, clock):
+    store = make_cache()
+    store.set("a", b"1")
+    store.set("b", b"2")
+    store.delete("a")
+    assert store.get("a") is None
+    assert store.get("b") == b"2"
+    store.clear()
+    assert store.get("b") is None
+
+
+def test_sqlite_cache_survives_reopen(tmp_path, clock):
+    store = SQLiteCache(tmp_path / "cache.db", ttl=60)
+    store.set("key", b"value")
+    store.close()
+    store = SQLiteCache(tmp_path / "cache.db", ttl=60)
+    try:
+        assert store.get("key") == b"value"
+    finally:
+        store.close()
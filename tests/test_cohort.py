@@ -0,0 +1,22 @@
+import pytest
+
+from amplitude_data_wrapper.cohort import read_cohort_arrays, write_cohort_columns
+
+LINES = ["amplitude_id,country\n", "1,Norway\n", "2,Sweden\n", "3,Norway\n"]
+
+
+def test_arrays_round_trip(tmp_path):
+    dest = write_cohort_columns(LINES, tmp_path / "cohort", "arrays", batch_size=2)
+    result = read_cohort_arrays(dest)
+    assert list(result["amplitude_id"]) == [1, 2, 3]
+    assert result["country"] == ["Norway", "Sweden", "Norway"]
+
+
+@pytest.mark.parametrize("file_format", ["arrays", "parquet", "arrow"])
+def test_parse_error_leaves_no_partial_output(tmp_path, file_format):
+    if file_format != "arrays":
+        pytest.importorskip("pyarrow")
+    lines = [*LINES, "not-a-number,Denmark\n"]
+    with pytest.raises(ValueError):
+        write_cohort_columns(lines, tmp_path / "cohort", file_format, batch_size=2)
+    assert list(tmp_path.iterdir()) == []
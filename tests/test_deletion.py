@@ -0,0 +1,72 @@
+import json
+
+import requests
+
+from amplitude_data_wrapper import deletion
+from amplitude_data_wrapper.ratelimit import RateLimiter
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeClient:
+    """Answers every deletion request with the next outcome, an exception or a response"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+
+    def delete_user_data(self, *args, **kwargs):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def submit(client: FakeClient, retries: int = 2) -> deletion.DeletionBatch:
+    batch = deletion.DeletionBatch(0, amplitude_ids=[1, 2])
+    return deletion._submit_batch(
+        client, batch, "me@example.com", RateLimiter(1000), retries, False, False
+    )
+
+
+def test_timeouts_are_retried_and_reported(monkeypatch):
+    monkeypatch.setattr(deletion, "backoff_delay", lambda attempt: 0)
+    batch = submit(FakeClient(requests.ReadTimeout(), requests.ReadTimeout()))
+    assert batch.status == "failed"
+    assert batch.attempts == 2
+    assert "ReadTimeout" in batch.error
+
+    batch = submit(
+        FakeClient(requests.ReadTimeout(), FakeResponse(200, '[{"day": "2024-01-02"}]'))
+    )
+    assert batch.status == "submitted"
+    assert batch.days == ["2024-01-02"]
+
+
+def test_invalid_json_marks_batch_failed():
+    batch = submit(FakeClient(FakeResponse(200, "<html>")))
+    assert batch.status == "failed"
+    assert batch.attempts == 1
+    assert batch.error.startswith("Invalid response")
+
+
+def test_delete_users_bulk_reports_failed_batches(monkeypatch):
+    monkeypatch.setattr(deletion, "backoff_delay", lambda attempt: 0)
+    client = FakeClient(
+        FakeResponse(200, "[]"), requests.ReadTimeout(), FakeResponse(200, "[]")
+    )
+    monkeypatch.setattr(deletion, "shared_client", lambda *args: client)
+    report = deletion.delete_users_bulk(
+        "me@example.com", "k", "s", range(300), workers=1, rate=1000, retries=1
+    )
+    assert [b.status for b in report.batches] == ["submitted", "failed", "submitted"]
+    assert report.count("failed") == 1
+    assert report.count("submitted") == 2
+    assert report.failed == [report.batches[1]]
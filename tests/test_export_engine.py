@@ -0,0 +1,222 @@
+import gzip
+import io
+import json
+import threading
+import zipfile
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+from amplitude_data_wrapper import analytics_api
+from amplitude_data_wrapper.export_engine import (
+    WindowTooLargeError,
+    export_range,
+    halve_window,
+    missing_windows,
+    split_time_range,
+)
+
+
+def hours_in(start: str, end: str) -> list[str]:
+    first, last = (datetime.strptime(h, "%Y%m%dT%H") for h in (start, end))
+    count = (last - first) // timedelta(hours=1) + 1
+    return [f"{first + timedelta(hours=i):%Y%m%dT%H}" for i in range(count)]
+
+
+def hour_zip(start: str, end: str) -> bytes:
+    """Export zip with one gzipped event per hour, named like the export API names members"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        for hour in hours_in(start, end):
+            moment = datetime.strptime(hour, "%Y%m%dT%H")
+            name = f"123/123_{moment:%Y-%m-%d}_{moment.hour}#0.json.gz"
+            z.writestr(name, gzip.compress(json.dumps({"hour": hour}).encode() + b"\n"))
+    return buffer.getvalue()
+
+
+class ExportServer:
+    """
+    Local export API on a free port, registered under its own region name
+
+    respond(start, end) returns the status of a request, 200 answers with hour_zip. Every
+    requested window is kept in requests.
+    """
+
+    def __init__(self, monkeypatch):
+        self.respond = lambda start, end: 200
+        self.requests: list[tuple[str, str]] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlsplit(self.path).query)
+                window = (query["start"][0], query["end"][0])
+                server.requests.append(window)
+                status = server.respond(*window)
+                body = hour_zip(*window) if status == 200 else b""
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        host, port = self.httpd.server_address
+        self.region = f"test{port}"
+        monkeypatch.setitem(
+            analytics_api.API_DOMAINS, self.region, f"http://{host}:{port}"
+        )
+
+    def export(self, start: str, end: str, filename, **kwargs) -> str:
+        return export_range(
+            start, end, "key", "secret", str(filename), region=self.region, **kwargs
+        )
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = ExportServer(monkeypatch)
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def exported_hours(filename) -> list[str]:
+    with zipfile.ZipFile(filename) as z:
+        return [
+            json.loads(gzip.decompress(z.read(name)))["hour"] for name in z.namelist()
+        ]
+
+
+def test_split_time_range():
+    assert split_time_range("20240101T00", "20240101T09", 4) == [
+        ("20240101T00", "20240101T03"),
+        ("20240101T04", "20240101T07"),
+        ("20240101T08", "20240101T09"),
+    ]
+    with pytest.raises(ValueError):
+        split_time_range("20240102T00", "20240101T00")
+
+
+def test_halve_window():
+    assert halve_window(("20240101T00", "20240101T04")) == (
+        ("20240101T00", "20240101T01"),
+        ("20240101T02", "20240101T04"),
+    )
+    with pytest.raises(ValueError):
+        halve_window(("20240101T00", "20240101T00"))
+
+
+def test_export_range_merges_windows_in_hour_order(server, tmp_path):
+    filename = server.export(
+        "20240101T00", "20240102T05", tmp_path / "out.zip", window_size=8, workers=3
+    )
+    hours = hours_in("20240101T00", "20240102T05")
+    assert exported_hours(filename) == hours
+    assert sorted(server.requests) == split_time_range("20240101T00", "20240102T05", 8)
+    assert not (tmp_path / "out.zip.parts").exists()
+
+
+@pytest.mark.parametrize("status", [400, 504])
+def test_windows_that_are_too_large_are_halved(server, tmp_path, status):
+    server.respond = lambda start, end: status if len(hours_in(start, end)) > 6 else 200
+    filename = server.export("20240101T00", "20240101T23", tmp_path / "out.zip")
+    assert exported_hours(filename) == hours_in("20240101T00", "20240101T23")
+    assert sorted(server.requests) == [
+        ("20240101T00", "20240101T05"),
+        ("20240101T00", "20240101T11"),
+        ("20240101T00", "20240101T23"),
+        ("20240101T06", "20240101T11"),
+        ("20240101T12", "20240101T17"),
+        ("20240101T12", "20240101T23"),
+        ("20240101T18", "20240101T23"),
+    ]
+
+
+def test_single_hour_that_is_too_large_raises(server, tmp_path):
+    server.respond = lambda start, end: 400
+    with pytest.raises(WindowTooLargeError):
+        server.export("20240101T00", "20240101T01", tmp_path / "out.zip")
+
+
+def test_windows_without_data_are_left_out(server, tmp_path):
+    server.respond = lambda start, end: 404 if start == "20240101T04" else 200
+    filename = server.export(
+        "20240101T00", "20240101T11", tmp_path / "out.zip", window_size=4
+    )
+    assert exported_hours(filename) == [
+        f"20240101T{h:02d}" for h in (0, 1, 2, 3, 8, 9, 10, 11)
+    ]
+
+
+def test_missing_windows():
+    done = [("20240101T04", "20240101T07"), ("20240101T10", "20240101T10")]
+    assert missing_windows("20240101T00", "20240101T11", done, 3) == [
+        ("20240101T00", "20240101T02"),
+        ("20240101T03", "20240101T03"),
+        ("20240101T08", "20240101T09"),
+        ("20240101T11", "20240101T11"),
+    ]
+
+
+def test_interrupted_export_only_downloads_missing_windows(server, tmp_path):
+    filename = tmp_path / "out.zip"
+    server.respond = lambda start, end: 403 if start == "20240101T16" else 200
+    with pytest.raises(requests.HTTPError):
+        server.export("20240101T00", "20240101T23", filename, window_size=8, workers=1)
+    assert (tmp_path / "out.zip.parts" / "manifest.json").exists()
+
+    server.requests.clear()
+    server.respond = lambda start, end: 200
+    server.export("20240101T00", "20240101T23", filename, window_size=8, workers=1)
+    assert server.requests == [("20240101T16", "20240101T23")]
+    assert exported_hours(filename) == hours_in("20240101T00", "20240101T23")
+
+
+def damage_part(tmp_path, window: str, truncate: bool) -> None:
+    part = tmp_path / "out.zip.parts" / f"{window}.zip"
+    data = bytearray(part.read_bytes())
+    if truncate:
+        del data[-10:]
+    else:
+        data[100] ^= 0xFF
+    part.write_bytes(bytes(data))
+
+
+def test_damaged_checkpoint_is_downloaded_again(server, tmp_path):
+    filename = tmp_path / "out.zip"
+    options = {"window_size": 8, "keep_parts": True}
+    server.export("20240101T00", "20240101T23", filename, **options)
+    damage_part(tmp_path, "20240101T08_20240101T15", truncate=True)
+
+    server.requests.clear()
+    server.export("20240101T00", "20240101T23", filename, **options)
+    assert server.requests == [("20240101T08", "20240101T15")]
+    assert exported_hours(filename) == hours_in("20240101T00", "20240101T23")
+
+
+def test_verify_detects_changed_bytes(server, tmp_path):
+    filename = tmp_path / "out.zip"
+    options = {"window_size": 8, "keep_parts": True}
+    server.export("20240101T00", "20240101T23", filename, **options)
+    damage_part(tmp_path, "20240101T00_20240101T07", truncate=False)
+
+    server.requests.clear()
+    server.export("20240101T00", "20240101T23", filename, verify=True, **options)
+    assert server.requests == [("20240101T00", "20240101T07")]
+    assert exported_hours(filename) == hours_in("20240101T00", "20240101T23")
+
+
+def test_resume_false_downloads_everything(server, tmp_path):
+    filename = tmp_path / "out.zip"
+    options = {"window_size": 8, "keep_parts": True}
+    server.export("20240101T00", "20240101T23", filename, **options)
+    server.requests.clear()
+    server.export("20240101T00", "20240101T23", filename, resume=False, **options)
+    assert sorted(server.requests) == split_time_range("20240101T00", "20240101T23", 8)
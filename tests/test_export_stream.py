@@ -0,0 +1,116 @@
+import gzip
+import io
+import json
+import zipfile
+
+import pytest
+
+from amplitude_data_wrapper.export_stream import (
+    iter_export_file_events,
+    iter_export_lines,
+    iter_gzip_lines,
+    iter_zip_members,
+)
+
+EVENTS = {
+    "123/123_2024-01-01_0#0.json.gz": [{"event_type": "a", "i": i} for i in range(50)],
+    "123/123_2024-01-01_1#0.json.gz": [{"event_type": "b", "i": i} for i in range(30)],
+}
+
+
+class Unseekable(io.RawIOBase):
+    """Write-only stream, so zipfile writes members with data descriptors"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.data += b
+        return len(b)
+
+
+def ndjson_gz(events: list[dict]) -> bytes:
+    return gzip.compress(b"".join(json.dumps(e).encode() + b"\n" for e in events))
+
+
+def build_zip(
+    stream: bool = False,
+    force_zip64: bool = False,
+    compression: int = zipfile.ZIP_DEFLATED,
+) -> bytes:
+    out = Unseekable() if stream else io.BytesIO()
+    with zipfile.ZipFile(out, "w", compression=compression) as z:
+        for name, events in EVENTS.items():
+            with z.open(name, "w", force_zip64=force_zip64) as member:
+                member.write(ndjson_gz(events))
+    return bytes(out.data) if stream else out.getvalue()
+
+
+def chunked(data: bytes, size: int) -> list[bytes]:
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def read_events(data: bytes, chunk_size: int) -> dict[str, list[dict]]:
+    events: dict[str, list[dict]] = {}
+    for name, line in iter_export_lines(chunked(data, chunk_size)):
+        events.setdefault(name, []).append(json.loads(line))
+    return events
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096, 1 << 20])
+@pytest.mark.parametrize(
+    "options",
+    [
+        {},
+        {"stream": True},
+        {"force_zip64": True},
+        {"stream": True, "force_zip64": True},
+        {"compression": zipfile.ZIP_STORED},
+    ],
+    ids=["sized", "data-descriptor", "zip64", "zip64-data-descriptor", "stored"],
+)
+def test_export_lines_match_zipfile(options, chunk_size):
+    data = build_zip(**options)
+    assert read_events(data, chunk_size) == EVENTS
+
+
+def test_data_descriptor_members_are_flagged():
+    data = build_zip(stream=True)
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        assert all(info.flag_bits & 0x08 for info in z.infolist())
+    assert [name for name, _ in iter_zip_members([data])] == list(EVENTS)
+
+
+def test_unread_members_are_skipped():
+    data = build_zip(stream=True)
+    names = [name for name, _member in iter_zip_members(chunked(data, 100))]
+    assert names == list(EVENTS)
+
+
+def test_rejects_data_that_is_not_a_zip():
+    with pytest.raises(ValueError):
+        list(iter_zip_members([b"not a zip file at all"]))
+
+
+def test_truncated_zip_raises():
+    data = build_zip()
+    with pytest.raises(EOFError):
+        list(iter_export_lines([data[: len(data) // 2]]))
+
+
+def test_gzip_lines_handle_concatenated_members_and_split_lines():
+    data = gzip.compress(b'{"a": 1}\n{"a"') + gzip.compress(b': 2}\r\n\n{"a": 3}')
+    lines = list(iter_gzip_lines(chunked(data, 3)))
+    assert lines == [b'{"a": 1}', b'{"a": 2}', b'{"a": 3}']
+
+
+def test_export_file_events(tmp_path):
+    path = tmp_path / "export.zip"
+    path.write_bytes(build_zip(stream=True))
+    events = list(iter_export_file_events(str(path), chunk_size=64))
+    assert events == [e for member in EVENTS.values() for e in member]
+    raw = list(iter_export_file_events(str(path), raw=True))
+    assert raw[0] == json.dumps(EVENTS["123/123_2024-01-01_0#0.json.gz"][0]).encode()
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from amplitude_data_wrapper import export_sync
+from amplitude_data_wrapper.export_sync import sync_exports
+
+
+def test_proxy_url_is_passed_to_export_range_as_proxies(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        export_sync, "export_range", lambda *args, **kwargs: calls.append(kwargs)
+    )
+    projects = {
+        "1": {"key": "k", "secret": "s", "proxy": "http://proxy.example.org/path"},
+        "2": {"key": "k", "secret": "s"},
+    }
+    results = sync_exports(
+        projects, tmp_path, start="20240101T00", now=datetime(2024, 1, 1, 4)
+    )
+    assert results == {
+        "1": [str(tmp_path / "1" / "20240101T00-20240101T01.zip")],
+        "2": [str(tmp_path / "2" / "20240101T00-20240101T01.zip")],
+    }
+    assert [kwargs["proxy"] for kwargs in calls] == [
+        {
+            "http": "http://proxy.example.org/path",
+            "https": "http://proxy.example.org/path",
+        },
+        None,
+    ]
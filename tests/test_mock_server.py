@@ -0,0 +1,89 @@
+import asyncio
+import zipfile
+
+import aiohttp
+import pytest
+
+from amplitude_data_wrapper import analytics_api, async_api
+from amplitude_data_wrapper.analytics_api import register_region
+from amplitude_data_wrapper.export_engine import export_range
+from amplitude_data_wrapper.mock_server import MockAmplitudeServer
+
+
+@pytest.fixture
+def start_server():
+    servers = []
+
+    def start(**kwargs) -> tuple[MockAmplitudeServer, str]:
+        server = MockAmplitudeServer(**kwargs)
+        server.start()
+        servers.append(server)
+        region = f"mock{server.port}"
+        register_region(region, server.base_url)
+        return server, region
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_export_range_splits_windows_the_server_rejects(start_server, tmp_path):
+    server, region = start_server(export_events_per_hour=2, export_max_hours=6)
+    filename = tmp_path / "export.zip"
+    export_range("20240101T00", "20240101T23", "key", "secret", filename, region=region)
+    with zipfile.ZipFile(filename) as z:
+        assert len(z.namelist()) == 24
+    assert server.stats.statuses == {400: 3, 200: 4}
+
+
+def test_export_range_resumes_from_kept_parts(start_server, tmp_path):
+    server, region = start_server(export_events_per_hour=2)
+    filename = tmp_path / "export.zip"
+    options = {"region": region, "window_size": 6, "keep_parts": True}
+    export_range("20240101T00", "20240101T23", "key", "secret", filename, **options)
+    assert server.stats.total == 4
+    export_range("20240101T00", "20240101T23", "key", "secret", filename, **options)
+    assert server.stats.total == 4
+
+
+def test_sync_chart_retries_injected_error(start_server):
+    server, region = start_server()
+    server.inject("/api/3/chart", 503)
+    r = analytics_api.get_chart("key", "secret", "abc123", region=region)
+    assert r.json()["chart_id"] == "abc123"
+    assert server.stats.statuses == {503: 1, 200: 1}
+
+
+def test_async_chart_waits_for_retry_after(start_server):
+    server, region = start_server()
+    server.inject("/api/3/chart", 429, retry_after=0)
+
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            return await async_api.fetch_chart_json(
+                session, "abc123", {"Authorization": "Basic a2V5"}, region=region
+            )
+
+    assert asyncio.run(run())["chart_id"] == "abc123"
+    assert server.stats.statuses == {429: 1, 200: 1}
+
+
+def test_async_cohort_download_polls_until_ready(start_server, tmp_path):
+    server, region = start_server(cohort_rows=5, cohort_pending_polls=2)
+
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            return await async_api.download_cohort(
+                session,
+                "cohort1",
+                {"Authorization": "Basic a2V5"},
+                tmp_path / "cohort.csv",
+                region=region,
+                min_interval=0.01,
+            )
+
+    path = asyncio.run(run())
+    assert path.read_text().splitlines() == ["amplitude_id"] + [
+        str(10**9 + i) for i in range(5)
+    ]
+    assert server.stats.statuses[202] == 2
@@ -0,0 +1,12 @@
+import amplitude_data_wrapper
+
+
+def test_all_lists_every_lazy_name():
+    package = amplitude_data_wrapper
+    names = [*package._ATTRIBUTES, *package._SUBMODULES, "__version__"]
+    assert sorted(package.__all__) == sorted(names)
+
+
+def test_every_name_in_all_imports():
+    for name in amplitude_data_wrapper.__all__:
+        assert getattr(amplitude_data_wrapper, name) is not None
@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+from amplitude_data_wrapper.ratelimit import AsyncRateLimiter
+
+
+def test_blocked_key_does_not_hold_a_slot():
+    async def run() -> tuple[float, float]:
+        limiter = AsyncRateLimiter(max_concurrency=1)
+        limiter.block("a", 0.5)
+        started = time.monotonic()
+        finished = {}
+
+        async def use(key: str) -> None:
+            async with limiter.slot(key):
+                finished[key] = time.monotonic() - started
+
+        await asyncio.gather(use("a"), use("b"))
+        return finished["a"], finished["b"]
+
+    a, b = asyncio.run(run())
+    assert a >= 0.5
+    assert b < 0.2
+
+
+def test_throttled_key_does_not_hold_a_slot():
+    async def run() -> list[str]:
+        limiter = AsyncRateLimiter(max_concurrency=1, rate=2, burst=1)
+        order = []
+
+        async def use(key: str) -> None:
+            async with limiter.slot(key):
+                order.append(key)
+
+        await asyncio.gather(use("a"), use("a"), use("b"))
+        return order
+
+    assert asyncio.run(run()) == ["a", "b", "a"]
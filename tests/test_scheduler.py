@@ -0,0 +1,39 @@
+import asyncio
+
+from amplitude_data_wrapper.analytics_api import register_region
+from amplitude_data_wrapper.mock_server import MockAmplitudeServer
+from amplitude_data_wrapper.scheduler import run_jobs
+
+
+def test_bad_responses_fail_their_target_only(tmp_path):
+    async def run():
+        async with MockAmplitudeServer(cohort_rows=3, cohort_pending_polls=0) as server:
+            region = f"mock{server.port}"
+            register_region(region, server.base_url)
+            server.inject("/api/3/chart/broken", 200, body=b"not json")
+            server.inject(
+                "/api/5/cohorts/request/nokey", 200, body=b'{"cohort_id": "nokey"}'
+            )
+            jobs = [
+                {"project": "1", "kind": "charts", "targets": ["abc", "broken"]},
+                {"project": "1", "kind": "cohorts", "targets": ["nokey", "good"]},
+            ]
+            projects = {"1": {"key": "key", "secret": "secret", "region": region}}
+            return await run_jobs(jobs, projects, tmp_path, retries=1)
+
+    summary = asyncio.run(run())
+    charts, cohorts = summary.jobs
+    assert {r.target: r.status for r in charts.results} == {
+        "abc": "downloaded",
+        "broken": "failed",
+    }
+    assert {r.target: r.status for r in cohorts.results} == {
+        "nokey": "failed",
+        "good": "downloaded",
+    }
+    [bad_chart] = [r for r in charts.results if r.status == "failed"]
+    [bad_cohort] = [r for r in cohorts.results if r.status == "failed"]
+    assert "JSONDecodeError" in bad_chart.error
+    assert "KeyError" in bad_cohort.error
+    assert (tmp_path / "1" / "charts" / "abc.json").exists()
+    assert (tmp_path / "1" / "cohorts" / "good.csv").exists()
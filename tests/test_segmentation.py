@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from amplitude_data_wrapper.analytics_api import register_region
+from amplitude_data_wrapper.async_api import AsyncAmplitudeClient
+from amplitude_data_wrapper.mock_server import MockAmplitudeServer
+from amplitude_data_wrapper.segmentation import (
+    MONTHLY,
+    WEEKLY,
+    SegmentationStore,
+    fetch_event_segmentation,
+    get_event_segmentation_incremental,
+    merge_segmentation,
+    split_date_range,
+)
+
+
+def response(x_values: list[str], rows: dict) -> dict:
+    return {
+        "data": {
+            "xValues": x_values,
+            "seriesLabels": list(rows),
+            "series": list(rows.values()),
+        }
+    }
+
+
+def test_split_date_range_by_days():
+    assert split_date_range("20240101", "20240110", days=4) == [
+        ("20240101", "20240104"),
+        ("20240105", "20240108"),
+        ("20240109", "20240110"),
+    ]
+
+
+def test_split_date_range_keeps_months_whole():
+    assert split_date_range("20240115", "20240410", days=40, interval=MONTHLY) == [
+        ("20240115", "20240131"),
+        ("20240201", "20240229"),
+        ("20240301", "20240331"),
+        ("20240401", "20240410"),
+    ]
+
+
+def test_split_date_range_does_not_split_weeks():
+    assert split_date_range("20240101", "20240301", days=7, interval=WEEKLY) == [
+        ("20240101", "20240301")
+    ]
+
+
+def test_split_date_range_rejects_end_before_start():
+    with pytest.raises(ValueError):
+        split_date_range("20240102", "20240101")
+
+
+def test_merge_joins_ranges_and_fills_missing_labels():
+    merged = merge_segmentation(
+        [
+            response(["2024-01-01", "2024-01-02"], {"iOS": [1, 2], "Web": [3, 4]}),
+            response(["2024-01-03"], {"Android": [5], "iOS": [6]}),
+        ]
+    )
+    assert merged == {
+        "data": {
+            "xValues": ["2024-01-01", "2024-01-02", "2024-01-03"],
+            "seriesLabels": ["iOS", "Web", "Android"],
+            "series": [[1, 2, 6], [3, 4, 0], [0, 0, 5]],
+        }
+    }
+
+
+def test_merge_collapses_only_additive_metrics():
+    responses = [response(["a"], {0: [1]}), response(["b"], {0: [2]})]
+    assert "seriesCollapsed" not in merge_segmentation(responses, "uniques")["data"]
+    assert merge_segmentation(responses, "totals")["data"]["seriesCollapsed"] == [
+        [{"setId": "", "value": 3}]
+    ]
+
+
+def test_merge_tags_labels_with_segment_index():
+    merged = merge_segmentation(
+        [response(["a"], {0: [1]}), response(["a"], {"iOS": [2]})], segments=[0, 1]
+    )
+    assert merged["data"]["seriesLabels"] == [0, [1, "iOS"]]
+    assert merged["data"]["series"] == [[1], [2]]
+
+
+def test_merge_keeps_largest_groups_over_limit():
+    merged = merge_segmentation(
+        [
+            response(["a"], {"x": [1], "y": [10]}),
+            response(["b"], {"z": [4], "x": [2]}),
+        ],
+        limit=2,
+    )
+    assert merged["data"]["seriesLabels"] == ["y", "z"]
+
+
+def test_split_query_matches_single_query():
+    event = {"event_type": "event_1"}
+
+    async def run() -> tuple[dict, dict, int]:
+        async with MockAmplitudeServer() as server:
+            region = f"mock{server.port}"
+            register_region(region, server.base_url)
+            async with AsyncAmplitudeClient("key", "secret", region) as client:
+                whole = await fetch_event_segmentation(
+                    client, "20240101", "20240131", event, "uniques", days=31
+                )
+                split = await fetch_event_segmentation(
+                    client, "20240101", "20240131", event, "uniques", days=7
+                )
+            return whole, split, server.stats.total
+
+    whole, split, requests = asyncio.run(run())
+    assert requests == 1 + 5
+    assert split["data"]["xValues"] == whole["data"]["xValues"]
+    assert split["data"]["series"] == whole["data"]["series"]
+
+
+def test_incremental_wrapper_reuses_stored_days(tmp_path):
+    event = {"event_type": "event_1"}
+    path = tmp_path / "segmentation.db"
+    with MockAmplitudeServer() as server:
+        region = f"mock{server.port}"
+        register_region(region, server.base_url)
+        args = ("key", "secret", path, "20240101", "20240131", event, "uniques")
+        first = get_event_segmentation_incremental(*args, region=region)
+        requests = server.stats.total
+        store = SegmentationStore(path)
+        try:
+            second = get_event_segmentation_incremental(
+                "key", "secret", store, *args[3:], region=region
+            )
+            # a store that is passed in is left open
+            store.delete()
+        finally:
+            store.close()
+        assert server.stats.total == requests
+    assert second == first
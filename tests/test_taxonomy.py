@@ -0,0 +1,31 @@
+from amplitude_data_wrapper.analytics_api import register_region
+from amplitude_data_wrapper.async_api import AsyncAmplitudeClient
+from amplitude_data_wrapper.mock_server import MockAmplitudeServer
+from amplitude_data_wrapper.taxonomy import (
+    TaxonomyStore,
+    delete_event_types_bulk,
+    diff_taxonomy,
+    taxonomy_project_key,
+)
+
+
+def test_bulk_delete_reports_each_event_type_and_stores_snapshots(tmp_path):
+    path = tmp_path / "taxonomy.db"
+    with MockAmplitudeServer(event_types=5) as server:
+        region = f"mock{server.port}"
+        register_region(region, server.base_url)
+        server.inject("/api/2/taxonomy/event/event_2", 400)
+        report = delete_event_types_bulk(
+            "key", "secret", ["event_1", "event_2"], region=region, store=path
+        )
+    assert report.count("done") == 1
+    assert [r.event_type for r in report.failed] == ["event_2"]
+    assert report.failed[0].http_status == 400
+    project = taxonomy_project_key(AsyncAmplitudeClient("key", "secret", region))
+    store = TaxonomyStore(path)
+    try:
+        before, after = [store.get(i) for i, _ in store.history(project)]
+    finally:
+        store.close()
+    diff = diff_taxonomy(before, after)
+    assert diff.removed == ["event_1"]
@@ -0,0 +1,44 @@
+import asyncio
+
+from amplitude_data_wrapper.analytics_api import register_region
+from amplitude_data_wrapper.async_api import AsyncAmplitudeClient
+from amplitude_data_wrapper.mock_server import MockAmplitudeServer
+from amplitude_data_wrapper.users import UserIdCache, resolve_users, resolve_users_bulk
+
+
+def test_malformed_search_responses_fail_without_caching(tmp_path):
+    async def run():
+        async with MockAmplitudeServer() as server:
+            region = f"mock{server.port}"
+            register_region(region, server.base_url)
+            server.inject("/api/2/usersearch", 200, body=b"not json")
+            server.inject("/api/2/usersearch", 200, body=b'{"matches": [{}]}')
+            cache = UserIdCache(tmp_path / "users.db")
+            try:
+                async with AsyncAmplitudeClient(
+                    "key", "secret", region, max_concurrency=1
+                ) as client:
+                    first = await resolve_users(client, ["a", "b", "c"], cache)
+                    second = await resolve_users(client, ["a", "b", "c"], cache)
+            finally:
+                cache.close()
+            return first, second
+
+    first, second = asyncio.run(run())
+    assert [first.results[u].status for u in "abc"] == ["failed", "failed", "found"]
+    assert "JSONDecodeError" in first.results["a"].error
+    assert "KeyError" in first.results["b"].error
+    assert [second.results[u].status for u in "abc"] == ["found", "found", "cached"]
+
+
+def test_bulk_wrapper_reads_found_users_from_its_cache_file(tmp_path):
+    path = tmp_path / "users.db"
+    with MockAmplitudeServer() as server:
+        region = f"mock{server.port}"
+        register_region(region, server.base_url)
+        first = resolve_users_bulk("key", "secret", ["a", "b"], path, region=region)
+        second = resolve_users_bulk("key", "secret", ["a", "b"], path, region=region)
+    assert first.count("found") == 2
+    assert first.failed == []
+    assert second.count("cached") == 2
+    assert second.amplitude_ids == first.amplitude_ids